@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Chunked admin bulk operations for Telegram Bot
+
+A bulk job walks its targets in key order, a bounded chunk at a time. Each
+chunk is applied in its own short transaction in a worker thread, followed
+by a pause, so interactive writes get the database lock between chunks.
+Progress is reported after every chunk, and cancellation takes effect
+between chunks, so a cancelled job never leaves a chunk half-applied.
+
+On shutdown, running jobs are paused after their current chunk and saved
+with the key of the last finished chunk, so the next start picks them up
+where they stopped. Applying a chunk is idempotent, so a chunk cut off at
+the shutdown deadline is simply applied again.
+"""
+
+import asyncio
+import inspect
+import itertools
+import json
+import logging
+import sqlite3
+import time
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional
+
+from config import Config
+from database import fetch_rows, iter_rows, open_connection
+from quotas import release_usage
+from retention import ArchiveManager
+
+logger = logging.getLogger(__name__)
+
+
+class BulkJob:
+    """State of one running or finished bulk job"""
+
+    __slots__ = ('job_id', 'name', 'total', 'kind', 'params', 'chat_id', 'message_id', 'position',
+                 'done', 'failed', 'started', 'finished', 'completed', 'cancel_requested', 'paused',
+                 'error', 'task')
+
+    def __init__(self, job_id: int, name: str, total: Optional[int],
+                 kind: Optional[str] = None, params: Optional[dict] = None):
+        self.job_id = job_id
+        self.name = name
+        self.total = total
+        # What to run, so a paused job can be rebuilt after a restart
+        self.kind = kind
+        self.params = params or {}
+        # Progress message
+        self.chat_id: Optional[int] = None
+        self.message_id: Optional[int] = None
+        # Key of the last finished chunk
+        self.position = None
+        self.done = 0
+        self.failed = 0
+        self.started = time.monotonic()
+        self.finished = False
+        # Every target was processed
+        self.completed = False
+        self.cancel_requested = False
+        self.paused = False
+        self.error: Optional[Exception] = None
+        self.task: Optional[asyncio.Task] = None
+
+    @property
+    def processed(self) -> int:
+        return self.done + self.failed
+
+    @property
+    def cancelled(self) -> bool:
+        return self.finished and self.cancel_requested and not self.paused
+
+
+class BulkJobManager:
+    """Runs bulk jobs in the background, one chunk at a time"""
+
+    def __init__(self, chunk_size: Optional[int] = None, pause: Optional[float] = None):
+        self.chunk_size = chunk_size or Config.BULK_CHUNK_SIZE
+        self.pause = pause if pause is not None else Config.BULK_CHUNK_PAUSE_MS / 1000
+        self.jobs: Dict[int, BulkJob] = {}
+        self._ids = itertools.count(1)
+
+    def create(self, name: str, total: Optional[int] = None,
+               kind: Optional[str] = None, params: Optional[dict] = None) -> BulkJob:
+        """Register a job so its ID can be shown before it starts"""
+        job = BulkJob(next(self._ids), name, total, kind, params)
+        self.jobs[job.job_id] = job
+        return job
+
+    def start(self, job: BulkJob,
+              fetch: Callable[[Optional[object], int], List],
+              apply: Callable[[List], object],
+              on_progress: Optional[Callable[[BulkJob], Awaitable[None]]] = None,
+              on_finish: Optional[Callable[[BulkJob], Awaitable[None]]] = None):
+        """Run a created job in the background
+
+        `fetch(after, limit)` returns the next targets after the key `after`
+        (None for the first chunk); targets are keys or (key, record) pairs.
+        `apply(chunk)` returns how many targets succeeded; it may be a
+        coroutine function, otherwise it runs in a worker thread. A resumed
+        job continues after `job.position`.
+        """
+        job.task = asyncio.create_task(self._run(job, fetch, apply, on_progress, on_finish))
+
+    def cancel(self, job_id: int) -> bool:
+        """Ask a running job to stop after its current chunk"""
+        job = self.jobs.get(job_id)
+        if job is None or job.finished:
+            return False
+        job.cancel_requested = True
+        return True
+
+    def running(self) -> List[BulkJob]:
+        return [job for job in self.jobs.values() if not job.finished]
+
+    async def pause_all(self, timeout: float) -> List[BulkJob]:
+        """Stop running jobs after their current chunk; returns the jobs left unfinished
+
+        Jobs still inside a chunk after `timeout` seconds are cancelled; they
+        resume from their last finished chunk.
+        """
+        running = [job for job in self.running() if job.task is not None and not job.cancel_requested]
+        for job in running:
+            job.paused = job.cancel_requested = True
+        if running:
+            _, stuck = await asyncio.wait([job.task for job in running], timeout=timeout)
+            for task in stuck:
+                task.cancel()
+            if stuck:
+                await asyncio.wait(stuck)
+        return [job for job in running if job.error is None and not job.completed]
+
+    async def _run(self, job: BulkJob, fetch, apply, on_progress, on_finish):
+        cursor = job.position
+        try:
+            while not job.cancel_requested:
+                chunk = await asyncio.to_thread(fetch, cursor, self.chunk_size)
+                if not chunk:
+                    job.completed = True
+                    break
+                if inspect.iscoroutinefunction(apply):
+                    succeeded = await apply(chunk)
+                else:
+                    succeeded = await asyncio.to_thread(apply, chunk)
+                job.done += succeeded
+                job.failed += len(chunk) - succeeded
+                cursor = job.position = chunk[-1][0] if isinstance(chunk[-1], tuple) else chunk[-1]
+
+                if on_progress is not None:
+                    await on_progress(job)
+                if len(chunk) < self.chunk_size:
+                    job.completed = True
+                    break
+                await asyncio.sleep(self.pause)
+        except Exception as e:
+            logger.error("Bulk job %s (%s) failed: %s", job.job_id, job.name, e)
+            job.error = e
+        finally:
+            job.finished = True
+            # Keep a short history for /jobs
+            for old_id in [job_id for job_id, old in self.jobs.items() if old.finished][:-20]:
+                del self.jobs[old_id]
+
+        if on_finish is not None:
+            await on_finish(job)
+
+
+class PendingJobStore:
+    """Bulk jobs paused by a shutdown, kept in the database until the next start"""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+
+    @staticmethod
+    def init_schema(cursor: sqlite3.Cursor):
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS pending_bulk_jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                name TEXT NOT NULL,
+                params TEXT NOT NULL,
+                position TEXT,
+                total INTEGER,
+                done INTEGER DEFAULT 0,
+                failed INTEGER DEFAULT 0,
+                chat_id INTEGER,
+                message_id INTEGER,
+                saved_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+
+    def save(self, jobs: List[BulkJob]) -> int:
+        """Store paused jobs; jobs without a kind cannot be rebuilt and are skipped"""
+        rows = [
+            (job.kind, job.name, json.dumps(job.params), json.dumps(job.position), job.total,
+             job.done, job.failed, job.chat_id, job.message_id)
+            for job in jobs if job.kind
+        ]
+        if rows:
+            conn = open_connection(self.db_path)
+            conn.executemany('''
+                INSERT INTO pending_bulk_jobs (kind, name, params, position, total, done, failed, chat_id, message_id)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', rows)
+            conn.commit()
+            conn.close()
+        return len(rows)
+
+    def take(self, manager: BulkJobManager) -> List[BulkJob]:
+        """Remove the stored jobs and register them with `manager` for resuming"""
+        conn = open_connection(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute('SELECT * FROM pending_bulk_jobs ORDER BY id')
+        stored = fetch_rows(cursor)
+        cursor.execute('DELETE FROM pending_bulk_jobs')
+        conn.commit()
+        conn.close()
+
+        jobs = []
+        for row in stored:
+            job = manager.create(row['name'], row['total'], row['kind'], json.loads(row['params']))
+            job.position = json.loads(row['position']) if row['position'] else None
+            job.done, job.failed = row['done'], row['failed']
+            job.chat_id, job.message_id = row['chat_id'], row['message_id']
+            jobs.append(job)
+        return jobs
+
+
+class AdminOperations:
+    """Chunk queries and mutations used by the admin bulk jobs"""
+
+    def __init__(self, archive: ArchiveManager):
+        self.archive = archive
+
+    @staticmethod
+    def _placeholders(values: Iterable) -> str:
+        return ", ".join("?" * len(list(values)))
+
+    # Users
+
+    def existing_users(self, user_ids: List[int]) -> List[int]:
+        """The given IDs that belong to registered users, sorted"""
+        conn = self.archive.connect()
+        cursor = conn.cursor()
+        cursor.execute(f'SELECT user_id FROM users WHERE user_id IN ({self._placeholders(user_ids)}) ORDER BY user_id',
+                       user_ids)
+        found = [row[0] for row in cursor.fetchall()]
+        conn.close()
+        return found
+
+    def set_users_active(self, user_ids: List[int], active: bool) -> int:
+        """Activate or deactivate a chunk of users"""
+        conn = self.archive.connect()
+        cursor = conn.cursor()
+        cursor.execute(f'UPDATE users SET is_active = ? WHERE user_id IN ({self._placeholders(user_ids)})',
+                       [1 if active else 0] + list(user_ids))
+        changed = cursor.rowcount
+        conn.commit()
+        conn.close()
+        return changed
+
+    def inactive_users(self) -> List[int]:
+        conn = self.archive.connect()
+        cursor = conn.cursor()
+        cursor.execute('SELECT user_id FROM users WHERE is_active = 0')
+        user_ids = [row[0] for row in cursor.fetchall()]
+        conn.close()
+        return user_ids
+
+    # Files
+
+    def count_user_files(self, user_id: int) -> int:
+        conn = self.archive.connect()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT (SELECT COUNT(*) FROM main.files WHERE user_id = ?)
+                 + (SELECT COUNT(*) FROM archive.files WHERE user_id = ?)
+        ''', (user_id, user_id))
+        count = cursor.fetchone()[0]
+        conn.close()
+        return count
+
+    def user_file_ids_after(self, user_id: int, after: Optional[int], limit: int) -> List[int]:
+        """Next chunk of a user's file IDs, hot and archived"""
+        conn = self.archive.connect()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT file_id FROM main.files WHERE user_id = ? AND file_id > ?
+            UNION
+            SELECT file_id FROM archive.files WHERE user_id = ? AND file_id > ?
+            ORDER BY file_id LIMIT ?
+        ''', (user_id, after or 0, user_id, after or 0, limit))
+        file_ids = [row[0] for row in cursor.fetchall()]
+        conn.close()
+        return file_ids
+
+    def delete_files(self, file_ids: List[int]) -> int:
+        """Delete a chunk of files from the hot and archive tables in one transaction"""
+        placeholders = self._placeholders(file_ids)
+        conn = self.archive.connect()
+        cursor = conn.cursor()
+        # A file left in both tables by an interrupted archive run counts once
+        deleted = {}
+        for table in ('main.files', 'archive.files'):
+            cursor.execute(f'DELETE FROM {table} WHERE file_id IN ({placeholders}) RETURNING file_id, user_id, file_size',
+                           file_ids)
+            deleted.update((row[0], row[1:]) for row in cursor.fetchall())
+        release_usage(cursor, deleted.values())
+        conn.commit()
+        conn.close()
+        return len(deleted)
+
+    def count_files(self) -> int:
+        conn = self.archive.connect()
+        count = conn.execute('SELECT COUNT(*) FROM main.files').fetchone()[0]
+        conn.close()
+        return count
+
+    def files_after(self, after: Optional[int], limit: int) -> List[tuple]:
+        """Next chunk of hot files as (file_id, record) pairs"""
+        conn = self.archive.connect()
+        cursor = conn.cursor()
+        cursor.execute('SELECT * FROM main.files WHERE file_id > ? ORDER BY file_id LIMIT ?', (after or 0, limit))
+        files = [(row[0], row) for row in iter_rows(cursor)]
+        conn.close()
+        return files
+
+    def count_backups(self) -> int:
+        conn = self.archive.connect()
+        count = conn.execute('SELECT COUNT(*) FROM main.files WHERE backup_path IS NOT NULL').fetchone()[0]
+        conn.close()
+        return count
+
+    def backups_after(self, after: Optional[int], limit: int) -> List[tuple]:
+        """Next chunk of backed-up hot files as (file_id, record) pairs"""
+        conn = self.archive.connect()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT * FROM main.files WHERE backup_path IS NOT NULL AND file_id > ?
+            ORDER BY file_id LIMIT ?
+        ''', (after or 0, limit))
+        files = [(row[0], row) for row in iter_rows(cursor)]
+        conn.close()
+        return files
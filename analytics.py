@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Activity analytics for Telegram Bot
+
+Hourly and daily rollups of new users, uploads per kind, uploaded bytes and
+poll votes. Triggers on the raw tables bump the rollup rows in the same
+transaction as each write, so reports read a few rollup rows per bucket
+instead of scanning users, files or poll_responses. Rollups count events:
+deleting or archiving raw rows does not rewrite history. Buckets are UTC,
+like CURRENT_TIMESTAMP.
+"""
+
+import sqlite3
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from config import Config
+from database import open_connection
+
+SCHEMA = '''
+    CREATE TABLE activity_rollups (
+        period TEXT NOT NULL,
+        bucket TEXT NOT NULL,
+        metric TEXT NOT NULL,
+        value INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (period, bucket, metric)
+    ) WITHOUT ROWID
+'''
+
+# Bucket expression per period; hour buckets sort correctly as text
+PERIODS = {
+    'hour': "strftime('%Y-%m-%d %H:00', {ts})",
+    'day': "date({ts})",
+}
+BUCKET_FORMATS = {
+    'hour': '%Y-%m-%d %H:00',
+    'day': '%Y-%m-%d',
+}
+
+# Metrics per source table: (metric expression, value expression, timestamp column).
+# {row} is "new." inside triggers and empty in the backfill.
+EVENTS = {
+    'users': [
+        ("'new_users'", "1", 'registration_date'),
+    ],
+    'files': [
+        ("'uploads:' || COALESCE({row}media_kind, 'document')", "1", 'upload_date'),
+        ("'upload_bytes'", "COALESCE({row}file_size, 0)", 'upload_date'),
+    ],
+    'poll_responses': [
+        ("'votes'", "1", 'response_date'),
+    ],
+}
+
+UPSERT = '''
+    INSERT INTO activity_rollups (period, bucket, metric, value)
+    {source}
+    ON CONFLICT (period, bucket, metric) DO UPDATE SET value = value + excluded.value
+'''
+
+
+def _trigger(table: str) -> str:
+    rows = []
+    for metric, value, column in EVENTS[table]:
+        timestamp = f"COALESCE(new.{column}, 'now')"
+        for period, bucket in PERIODS.items():
+            rows.append(
+                f"('{period}', {bucket.format(ts=timestamp)}, "
+                f"{metric.format(row='new.')}, {value.format(row='new.')})"
+            )
+    upsert = UPSERT.format(source="VALUES " + ",\n        ".join(rows))
+    return f'''
+    CREATE TRIGGER IF NOT EXISTS {table}_rollup_insert AFTER INSERT ON {table} BEGIN
+        {upsert.strip()};
+    END
+    '''
+
+
+def _backfill(table: str) -> List[str]:
+    statements = []
+    for metric, value, column in EVENTS[table]:
+        timestamp = f"COALESCE({column}, 'now')"
+        for period, bucket in PERIODS.items():
+            # "WHERE true" keeps the parser from reading ON CONFLICT as a join constraint
+            source = (
+                f"SELECT '{period}', {bucket.format(ts=timestamp)}, {metric.format(row='')}, "
+                f"SUM({value.format(row='')}) FROM {table} WHERE true GROUP BY 2, 3"
+            )
+            statements.append(UPSERT.format(source=source))
+    return statements
+
+
+def bucket_key(moment: datetime, period: str) -> str:
+    """Rollup bucket a UTC datetime falls into"""
+    return moment.strftime(BUCKET_FORMATS[period])
+
+
+def sparkline(values: List[int]) -> str:
+    """Render values as a row of block characters"""
+    bars = '▁▂▃▄▅▆▇█'
+    peak = max(values, default=0)
+    if not peak:
+        return bars[0] * len(values)
+    # Any non-zero value gets at least the second bar; the peak gets the full one
+    return "".join(bars[(value * (len(bars) - 1) + peak - 1) // peak] for value in values)
+
+
+class ActivityAnalytics:
+    """Reads activity trends from the rollup tables"""
+
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = db_path or Config.DATABASE_PATH
+
+    @staticmethod
+    def init_schema(cursor: sqlite3.Cursor):
+        """Create the rollup table and triggers, rolling up existing rows once"""
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'activity_rollups'")
+        if not cursor.fetchone():
+            cursor.execute(SCHEMA)
+            for table in EVENTS:
+                for statement in _backfill(table):
+                    cursor.execute(statement)
+
+        for table in EVENTS:
+            cursor.execute(_trigger(table))
+
+    def _rows(self, period: str, start: str, end: str) -> List[Tuple[str, str, int]]:
+        """Rollup rows with start <= bucket < end"""
+        conn = open_connection(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT bucket, metric, value FROM activity_rollups
+            WHERE period = ? AND bucket >= ? AND bucket < ?
+        ''', (period, start, end))
+        rows = cursor.fetchall()
+        conn.close()
+        return rows
+
+    def series(self, start: datetime, end: datetime, period: str = 'day') -> List[Tuple[str, Dict[str, int]]]:
+        """Metrics per bucket for [start, end), including empty buckets"""
+        step = timedelta(hours=1) if period == 'hour' else timedelta(days=1)
+        if period == 'hour':
+            moment = start.replace(minute=0, second=0, microsecond=0)
+        else:
+            moment = start.replace(hour=0, minute=0, second=0, microsecond=0)
+
+        buckets: Dict[str, Dict[str, int]] = {}
+        while moment < end:
+            buckets[bucket_key(moment, period)] = {}
+            moment += step
+
+        if buckets:
+            # moment is now the first bucket past the range
+            for bucket, metric, value in self._rows(period, min(buckets), bucket_key(moment, period)):
+                buckets[bucket][metric] = value
+        return list(buckets.items())
+
+    def totals(self, start: datetime, end: datetime) -> Dict[str, int]:
+        """Metric totals for [start, end) at hour precision
+
+        Whole days are read from daily rows and only the partial days at
+        either edge from hourly rows, so the cost depends on neither the range
+        length in hours nor the size of the raw tables.
+        """
+        start = start.replace(minute=0, second=0, microsecond=0)
+        midnight = start.replace(hour=0)
+        first_day = midnight if midnight == start else midnight + timedelta(days=1)
+        last_day = end.replace(hour=0, minute=0, second=0, microsecond=0)
+
+        if first_day >= last_day:
+            ranges = [('hour', start, end)]
+        else:
+            ranges = [('hour', start, first_day), ('day', first_day, last_day), ('hour', last_day, end)]
+
+        totals: Dict[str, int] = {}
+        for period, range_start, range_end in ranges:
+            if range_start >= range_end:
+                continue
+            for _, metric, value in self._rows(period, bucket_key(range_start, period),
+                                               bucket_key(range_end, period)):
+                totals[metric] = totals.get(metric, 0) + value
+        return totals
+
+    def recent(self, days: int, now: Optional[datetime] = None) -> dict:
+        """Trend report for the last `days` days; hourly buckets for two days or less"""
+        now = now or datetime.utcnow()
+        end = now.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+        if days <= 2:
+            period = 'hour'
+            start = end - timedelta(days=days)
+        else:
+            # Whole days, today included
+            period = 'day'
+            start = now.replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=days - 1)
+        series = self.series(start, end, period)
+
+        metrics = sorted({metric for _, values in series for metric in values})
+        return {
+            'period': period,
+            'start': start,
+            'end': end,
+            'buckets': [bucket for bucket, _ in series],
+            'totals': self.totals(start, end),
+            'trends': {metric: [values.get(metric, 0) for _, values in series] for metric in metrics},
+        }
+
+
+METRIC_LABELS = {
+    'new_users': '👥 کاربران جدید',
+    'uploads:document': '📄 آپلود فایل',
+    'uploads:photo': '🖼️ آپلود عکس',
+    'upload_bytes': '💾 حجم آپلود',
+    'votes': '🗳️ رأی‌ها',
+}
+
+
+def metric_label(metric: str) -> str:
+    """Persian label for a metric name"""
+    if metric in METRIC_LABELS:
+        return METRIC_LABELS[metric]
+    if metric.startswith('uploads:'):
+        return f"📁 آپلود {metric.split(':', 1)[1]}"
+    return metric
+
+
+def format_value(metric: str, value: int) -> str:
+    """Human readable metric value"""
+    if metric == 'upload_bytes':
+        return f"{value / (1024 * 1024):.2f} MB"
+    return str(value)
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark for the cost of the always-on diagnostics
+
+- SQL timing: the same point lookups and inserts through a plain
+  sqlite3 connection and through open_connection (TimedConnection), which
+  reads the clock around every statement and commit.
+- Event-loop lag probe: a CPU-bound coroutine workload with and without
+  the probe running.
+- Sampling profiler: the same workload while a profile runs; this cost is
+  only paid while an admin runs /diag profile.
+
+Usage: python3 benchmarks/bench_diagnostics.py [--statements 200000]
+"""
+
+import argparse
+import asyncio
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import open_connection
+from diagnostics import LoopLagMonitor, SamplingProfiler
+
+
+def sql_workload(conn: sqlite3.Connection, statements: int) -> float:
+    """Seconds for `statements` point lookups plus one insert and commit per 100"""
+    cursor = conn.cursor()
+    started = time.perf_counter()
+    for i in range(statements):
+        cursor.execute('SELECT name FROM items WHERE id = ?', (i % 1000,))
+        cursor.fetchone()
+        if i % 100 == 0:
+            conn.execute('INSERT INTO log (item) VALUES (?)', (i,))
+            conn.commit()
+    return time.perf_counter() - started
+
+
+def bench_sql(statements: int):
+    with tempfile.TemporaryDirectory() as workdir:
+        db_path = os.path.join(workdir, 'bench.db')
+        conn = sqlite3.connect(db_path)
+        conn.execute('CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT)')
+        conn.execute('CREATE TABLE log (id INTEGER PRIMARY KEY, item INTEGER)')
+        conn.executemany('INSERT INTO items VALUES (?, ?)', ((i, f"item {i}") for i in range(1000)))
+        conn.commit()
+        conn.close()
+
+        results = {}
+        for name, connect in (('sqlite3.connect', sqlite3.connect), ('open_connection', open_connection)):
+            conn = connect(db_path)
+            sql_workload(conn, statements // 10)
+            results[name] = min(sql_workload(conn, statements) for _ in range(3))
+            conn.close()
+    return results
+
+
+async def loop_workload(tasks: int, steps: int) -> float:
+    """Seconds for `tasks` coroutines each doing `steps` small CPU slices"""
+    async def work():
+        total = 0
+        for step in range(steps):
+            total += sum(range(200))
+            await asyncio.sleep(0)
+        return total
+
+    started = time.perf_counter()
+    await asyncio.gather(*(work() for _ in range(tasks)))
+    return time.perf_counter() - started
+
+
+async def bench_loop(tasks: int, steps: int):
+    await loop_workload(tasks, steps // 10)
+    results = {'plain': await loop_workload(tasks, steps)}
+
+    monitor = LoopLagMonitor(interval=0.5, window=300)
+    monitor.start()
+    results['lag probe'] = await loop_workload(tasks, steps)
+    monitor.stop()
+
+    profiler = SamplingProfiler()
+    profile = asyncio.create_task(profiler.profile(3600))
+    await asyncio.sleep(0.05)
+    results['profiling'] = await loop_workload(tasks, steps)
+    profiler.stop()
+    stacks, samples, _ = await profile
+    return results, samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Overhead of the runtime diagnostics")
+    parser.add_argument('--statements', type=int, default=200_000)
+    parser.add_argument('--tasks', type=int, default=100)
+    parser.add_argument('--steps', type=int, default=2000)
+    args = parser.parse_args()
+
+    sql = bench_sql(args.statements)
+    base = sql['sqlite3.connect']
+    print(f"{'connection':<18} {'s':>7} {'us/stmt':>8} {'overhead':>9}")
+    print("-" * 45)
+    for name, seconds in sql.items():
+        print(f"{name:<18} {seconds:>7.3f} {seconds / args.statements * 1e6:>8.2f} "
+              f"{(seconds / base - 1) * 100:>8.1f}%")
+
+    loop, samples = asyncio.run(bench_loop(args.tasks, args.steps))
+    base = loop['plain']
+    print(f"\n{'event loop':<18} {'s':>7} {'overhead':>9}")
+    print("-" * 36)
+    for name, seconds in loop.items():
+        print(f"{name:<18} {seconds:>7.3f} {(seconds / base - 1) * 100:>8.1f}%")
+    print(f"\nProfiler took {samples} samples")
+
+
+if __name__ == '__main__':
+    main()
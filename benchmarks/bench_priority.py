@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Mixed-load benchmark for priority scheduling
+
+Runs the bot against the fake Bot API while heavy requests are in flight -
+users backing up all their files and admins asking for /admin_stats on a
+large database - and meanwhile sends a steady stream of interactive
+updates (/start and menu taps) from other users. Reports the latency of
+the interactive updates and how long the heavy ones took, once with
+updates processed one at a time (PRIORITY_SCHEDULING off, the old
+behaviour) and once with priority scheduling.
+
+Exits with status 1 if the interactive p99 with scheduling exceeds
+INTERACTIVE_SLO_MS.
+
+Usage: python3 benchmarks/bench_priority.py [--interactive 300] [--rate 50] [--api-latency 0.005]
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+from load_test import Harness, finishes_backup, percentile, sends_message
+
+ADMINS = list(range(90_000, 90_003))
+
+
+def seed_database(harness: Harness, rows: int):
+    """Fill the files table so the statistics queries have to scan"""
+    conn = sqlite3.connect(harness.bot.db_path)
+    conn.executemany('''
+        INSERT INTO files (user_id, file_name, file_type, file_size, telegram_file_id)
+        VALUES (?, ?, ?, ?, ?)
+    ''', ((i % 5000, f"old_{i}.pdf", 'application/pdf', 1024, f"old_{i}") for i in range(rows)))
+    conn.commit()
+    conn.close()
+
+
+async def run(args, scheduling: bool) -> Dict[str, List[float]]:
+    Config.PRIORITY_SCHEDULING = scheduling
+    Config.ADMIN_USER_IDS = ADMINS
+    with tempfile.TemporaryDirectory() as workdir:
+        harness = Harness(workdir, api_latency=args.api_latency)
+        await harness.start()
+        try:
+            seed_database(harness, args.rows)
+            heavy = []
+            for user_id in range(40_000, 40_000 + args.backups):
+                harness.seed_files(user_id, args.files)
+                heavy.append((user_id, [harness.callback(user_id, 'backup_all')], finishes_backup))
+            for admin in ADMINS:
+                for _ in range(args.stats):
+                    heavy.append((admin, [harness.command(admin, '/admin_stats')], sends_message))
+
+            started = time.perf_counter()
+            heavy_done = []
+            for chat_id, updates, predicate in heavy:
+                heavy_done.append(harness.expect(chat_id, predicate))
+                for update in updates:
+                    harness.api.push_update(update)
+
+            # Interactive users arrive at a steady rate while the heavy work runs
+            buttons = ['my_files', 'profile', 'create_poll']
+            interactive = []
+            for index in range(args.interactive):
+                user_id = 10_000 + index
+                if index % 2:
+                    update = harness.callback(user_id, buttons[index % len(buttons)])
+                else:
+                    update = harness.command(user_id, '/start')
+                future = harness.expect(user_id, sends_message)
+                harness.api.push_update(update)
+                interactive.append((time.perf_counter(), future))
+                await asyncio.sleep(1 / args.rate)
+
+            latencies = [await asyncio.wait_for(future, 300) - pushed for pushed, future in interactive]
+            finished = await asyncio.wait_for(asyncio.gather(*heavy_done), 300)
+            return {
+                'interactive': latencies,
+                'heavy_total': [max(finished) - started],
+            }
+        finally:
+            await harness.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Interactive latency under heavy load")
+    parser.add_argument('--interactive', type=int, default=300, help="interactive updates")
+    parser.add_argument('--rate', type=float, default=50, help="interactive updates per second")
+    parser.add_argument('--backups', type=int, default=8, help="users running 'backup all'")
+    parser.add_argument('--files', type=int, default=40, help="files per backing-up user")
+    parser.add_argument('--stats', type=int, default=3, help="/admin_stats per admin")
+    parser.add_argument('--rows', type=int, default=300_000, help="files in the database")
+    parser.add_argument('--api-latency', type=float, default=0.005, help="simulated Bot API latency in seconds")
+    args = parser.parse_args()
+
+    # Heavy handlers are expected to log slow-handler warnings here
+    logging.getLogger().setLevel(logging.ERROR)
+    slo = Config.INTERACTIVE_SLO_MS
+    print(f"{args.interactive} interactive updates at {args.rate:.0f}/s during {args.backups} backups of "
+          f"{args.files} files and {args.stats * len(ADMINS)} /admin_stats over {args.rows} rows\n")
+    print(f"{'processing':<22} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8} {'> SLO':>6} {'heavy s':>8}")
+    print("-" * 66)
+    passed = True
+    for name, scheduling in (('one at a time', False), ('priority scheduling', True)):
+        result = asyncio.run(run(args, scheduling))
+        latencies = [seconds * 1000 for seconds in result['interactive']]
+        misses = sum(1 for latency in latencies if latency > slo)
+        p99 = percentile(latencies, 0.99)
+        print(f"{name:<22} {percentile(latencies, 0.5):>8.1f} {p99:>8.1f} {max(latencies):>8.1f} "
+              f"{misses:>6} {result['heavy_total'][0]:>8.2f}")
+        if scheduling:
+            passed = p99 <= slo
+
+    if not passed:
+        print(f"\n❌ Interactive p99 above the {slo:.0f}ms SLO")
+        sys.exit(1)
+    print(f"\n✅ Interactive p99 within the {slo:.0f}ms SLO")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark for hot-path queries as file history grows, with and without archival
+
+For each history size it builds a database with the bot schema, with files
+arriving at a constant daily rate (a larger history covers more days), and
+times the first /my_files page and the /view_database statistics. It then
+archives everything past the retention and times them again. With archival
+the hot tables only hold the retention window, so hot-path times stay flat
+however much history exists.
+
+Usage: python3 benchmarks/bench_retention.py [--sizes 20000,100000,400000] [--rows-per-day 100]
+       [--retention-days 90]
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram_bot import TelegramBot
+
+
+def fill(db_path: str, rows: int, users: int, rows_per_day: int):
+    """Insert synthetic files uploaded at a constant daily rate"""
+    rng = random.Random(42)
+    conn = sqlite3.connect(db_path)
+    conn.executemany('INSERT OR IGNORE INTO users (user_id, first_name) VALUES (?, ?)',
+                     [(user_id, f"User{user_id}") for user_id in range(users)])
+    batch = []
+    for i in range(rows):
+        age = rng.uniform(0, rows / rows_per_day)
+        batch.append((rng.randrange(users), f"file_{i}.pdf", 'application/pdf', rng.randrange(1 << 20),
+                      f"tg{i}", f"-{age:.4f} days"))
+        if len(batch) == 20000 or i == rows - 1:
+            conn.executemany('''
+                INSERT INTO files (user_id, file_name, file_type, file_size, telegram_file_id, upload_date)
+                VALUES (?, ?, ?, ?, ?, datetime('now', ?))
+            ''', batch)
+            batch = []
+    conn.commit()
+    conn.close()
+
+
+def time_hot_path(bot: TelegramBot, users: int, samples: int):
+    """p50 milliseconds of the first /my_files page and of the database stats"""
+    rng = random.Random(7)
+    listing = []
+    for _ in range(samples):
+        user_id = rng.randrange(users)
+        started = time.perf_counter()
+        bot.archive.list_files(10, 0, user_id=user_id)
+        listing.append((time.perf_counter() - started) * 1000)
+
+    stats = []
+    for _ in range(max(3, samples // 20)):
+        started = time.perf_counter()
+        bot.get_database_stats()
+        stats.append((time.perf_counter() - started) * 1000)
+    return statistics.median(listing), statistics.median(stats)
+
+
+def hot_rows(db_path: str) -> int:
+    conn = sqlite3.connect(db_path)
+    count = conn.execute('SELECT COUNT(*) FROM files').fetchone()[0]
+    conn.close()
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hot-path query time vs. history size")
+    parser.add_argument('--sizes', default='20000,100000,400000', help="comma separated history sizes")
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--rows-per-day', type=int, default=100)
+    parser.add_argument('--retention-days', type=int, default=90)
+    parser.add_argument('--samples', type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'history':>9} {'hot rows':>9} {'my_files ms':>12} {'archived':>9} {'stats ms':>9} {'archived':>9}")
+    print("-" * 64)
+    for size in [int(value) for value in args.sizes.split(',')]:
+        with tempfile.TemporaryDirectory() as workdir:
+            db_path = os.path.join(workdir, 'bench.db')
+            bot = TelegramBot('0:BENCHMARK', db_path=db_path)
+            fill(db_path, size, args.users, args.rows_per_day)
+            listing_before, stats_before = time_hot_path(bot, args.users, args.samples)
+
+            while bot.archive.archive_batch('files', args.retention_days, batch_size=20000):
+                pass
+            listing_after, stats_after = time_hot_path(bot, args.users, args.samples)
+
+            print(f"{size:>9} {hot_rows(db_path):>9} {listing_before:>12.3f} {listing_after:>9.3f} "
+                  f"{stats_before:>9.2f} {stats_after:>9.2f}")
+
+
+if __name__ == '__main__':
+    main()
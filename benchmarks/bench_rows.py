@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark for the memory cost of file rows held in Python
+
+Builds a files table with the bot schema and loads every row the way the
+listing paths used to (one dict per row via cursor.description), as
+sqlite3.Row objects, and as the compact rows from database.py. Memory is
+measured with tracemalloc; "overhead" is what a representation costs on
+top of the plain tuples sqlite3 returns. It also shows the peak memory of
+streaming all rows through iter_rows, which stays flat.
+
+Usage: python3 benchmarks/bench_rows.py [--rows 1000000]
+"""
+
+import argparse
+import gc
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import fetch_rows, iter_rows
+from telegram_bot import TelegramBot
+
+
+def fill(db_path: str, rows: int, users: int = 1000):
+    rng = random.Random(42)
+    conn = sqlite3.connect(db_path)
+    batch = []
+    for i in range(rows):
+        batch.append((rng.randrange(users), f"report_{i}.pdf", 'application/pdf', rng.randrange(1 << 20),
+                      f"BQACAgQAAxkBAAI{i:012d}", f"-{rng.uniform(0, 365):.4f} days"))
+        if len(batch) == 50000 or i == rows - 1:
+            conn.executemany('''
+                INSERT INTO files (user_id, file_name, file_type, file_size, telegram_file_id, upload_date)
+                VALUES (?, ?, ?, ?, ?, datetime('now', ?))
+            ''', batch)
+            batch = []
+    conn.commit()
+    conn.close()
+
+
+def as_tuples(cursor):
+    return cursor.fetchall()
+
+
+def as_dicts(cursor):
+    results = cursor.fetchall()
+    columns = [description[0] for description in cursor.description]
+    return [dict(zip(columns, row)) for row in results]
+
+
+def as_sqlite_rows(cursor):
+    cursor.row_factory = sqlite3.Row
+    return cursor.fetchall()
+
+
+def measure(db_path: str, load):
+    """Bytes held by the loaded rows and the load time"""
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    cursor.execute('SELECT * FROM files')
+    rows = load(cursor)
+    elapsed = time.perf_counter() - started
+    held, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    count = len(rows)
+    del rows
+    conn.close()
+    return held, count, elapsed
+
+
+def streaming_peak(db_path: str):
+    """Peak bytes while visiting every row through iter_rows"""
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    gc.collect()
+    tracemalloc.start()
+    cursor.execute('SELECT * FROM files')
+    total_size = 0
+    for file in iter_rows(cursor):
+        total_size += file['file_size']
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    conn.close()
+    return peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory per loaded file row")
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        db_path = os.path.join(workdir, 'bench.db')
+        TelegramBot('0:BENCHMARK', db_path=db_path)
+        fill(db_path, args.rows)
+
+        results = [(name, *measure(db_path, load)) for name, load in (
+            ('plain tuples', as_tuples),
+            ('dict per row (old)', as_dicts),
+            ('sqlite3.Row', as_sqlite_rows),
+            ('compact rows', fetch_rows),
+        )]
+        peak = streaming_peak(db_path)
+
+    baseline = results[0][1] / results[0][2]
+    print(f"{'representation':<20} {'rows':>9} {'MB':>9} {'B/row':>7} {'overhead B/row':>15} {'load s':>7}")
+    print("-" * 72)
+    for name, held, count, elapsed in results:
+        per_row = held / count
+        print(f"{name:<20} {count:>9} {held / 2 ** 20:>9.1f} {per_row:>7.0f} {per_row - baseline:>15.0f} {elapsed:>7.2f}")
+    print(f"\nStreaming all rows through iter_rows: peak {peak / 1024:.1f} KB")
+
+
+if __name__ == '__main__':
+    main()
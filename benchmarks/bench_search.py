@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark for /search over a large files table
+
+Builds a throwaway database with the bot schema, fills it with synthetic
+files spread over many users and times prefix searches for random users.
+
+Usage: python3 benchmarks/bench_search.py [--rows N] [--users N] [--queries N]
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from search import SearchIndex
+
+WORDS = [
+    'report', 'invoice', 'photo', 'contract', 'resume', 'notes', 'budget', 'summary',
+    'lecture', 'slides', 'backup', 'draft', 'final', 'scan', 'letter', 'receipt',
+    'گزارش', 'فاکتور', 'قرارداد', 'جزوه', 'رزومه', 'نامه', 'تصویر', 'پروژه',
+]
+TYPES = ['application/pdf', 'image/jpeg', 'text/plain', 'application/zip', 'video/mp4']
+
+
+def build_database(path: str, rows: int, users: int):
+    """Create the schema and insert synthetic files"""
+    conn = sqlite3.connect(path)
+    cursor = conn.cursor()
+    cursor.execute('''
+        CREATE TABLE files (
+            file_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER, file_name TEXT, file_type TEXT, file_size INTEGER,
+            telegram_file_id TEXT, upload_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            backup_path TEXT, backup_date TIMESTAMP
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE polls (
+            poll_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER, question TEXT, options TEXT, poll_type TEXT,
+            creation_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP, is_active BOOLEAN DEFAULT 1
+        )
+    ''')
+    SearchIndex.init_schema(cursor)
+
+    rng = random.Random(42)
+    batch = []
+    for i in range(rows):
+        name = f"{rng.choice(WORDS)}_{rng.choice(WORDS)}_{i}.{rng.choice(['pdf', 'jpg', 'txt'])}"
+        batch.append((rng.randrange(users), name, rng.choice(TYPES), rng.randrange(1 << 20), f"tg{i}"))
+        if len(batch) == 50000:
+            cursor.executemany(
+                'INSERT INTO files (user_id, file_name, file_type, file_size, telegram_file_id) VALUES (?, ?, ?, ?, ?)',
+                batch
+            )
+            batch.clear()
+    if batch:
+        cursor.executemany(
+            'INSERT INTO files (user_id, file_name, file_type, file_size, telegram_file_id) VALUES (?, ?, ?, ?, ?)',
+            batch
+        )
+    conn.commit()
+    cursor.execute("INSERT INTO files_fts (files_fts) VALUES ('optimize')")
+    conn.commit()
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark full-text search")
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--users', type=int, default=10_000)
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--budget-ms', type=float, default=1.0, help="fail if p50 exceeds this")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        started = time.perf_counter()
+        build_database(path, args.rows, args.users)
+        print(f"built {args.rows} files in {time.perf_counter() - started:.1f}s")
+
+        index = SearchIndex(path)
+        rng = random.Random(7)
+        timings = []
+        for _ in range(args.queries):
+            user_id = rng.randrange(args.users)
+            query = rng.choice(WORDS)[:rng.randint(2, 5)]
+            started = time.perf_counter()
+            index.search(user_id, query, limit=10)
+            timings.append((time.perf_counter() - started) * 1000)
+        index.close()
+
+    timings.sort()
+    p50 = statistics.median(timings)
+    p99 = timings[int(len(timings) * 0.99) - 1]
+    print(f"queries: {len(timings)}  p50: {p50:.3f} ms  p99: {p99:.3f} ms  max: {timings[-1]:.3f} ms")
+    if p50 > args.budget_ms:
+        print(f"❌ p50 above budget of {args.budget_ms} ms")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Microbenchmarks for message rendering
+
+Compares the cost of building each screen inline (the way the handlers used
+to) with the precompiled MessageTemplates.
+
+Usage: python3 benchmarks/bench_templates.py [--number N]
+"""
+
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from templates import MessageTemplates
+
+FILES = [
+    {
+        'file_id': i,
+        'file_name': f"document_number_{i}_report.pdf",
+        'file_size': 1024 * i,
+        'upload_date': '2025-01-01 12:00:00',
+    }
+    for i in range(1, 11)
+]
+
+
+def inline_start(first_name):
+    welcome_text = f"""
+🤖 سلام {first_name}! به ربات تلگرام خوش آمدید!
+
+این ربات دارای قابلیت‌های زیر است:
+• 📝 مدیریت پروفایل کاربری
+• 📁 آپلود و دانلود فایل
+• 📸 ارسال عکس
+• 📊 ایجاد نظرسنجی
+• 🗄️ مشاهده دیتابیس
+
+برای شروع از دستور /help استفاده کنید.
+        """
+    keyboard = [
+        [InlineKeyboardButton("📝 پروفایل من", callback_data="profile")],
+        [InlineKeyboardButton("📁 فایل‌های من", callback_data="my_files")],
+        [InlineKeyboardButton("📊 ایجاد نظرسنجی", callback_data="create_poll")],
+        [InlineKeyboardButton("🗄️ مشاهده دیتابیس", callback_data="view_db")]
+    ]
+    return welcome_text, InlineKeyboardMarkup(keyboard)
+
+
+def inline_my_files(files):
+    text = "📁 فایل‌های شما:\n\n"
+    keyboard = []
+    for i, file in enumerate(files[:10], 1):
+        text += f"{i}. 📄 {file['file_name']}\n"
+        text += f"   📊 حجم: {file['file_size']} بایت\n"
+        text += f"   📅 تاریخ: {file['upload_date']}\n\n"
+        keyboard.append([
+            InlineKeyboardButton(
+                f"📥 دانلود {file['file_name'][:15]}...",
+                callback_data=f"download_{file['file_id']}"
+            ),
+            InlineKeyboardButton(
+                f"🗑️ حذف {file['file_name'][:15]}...",
+                callback_data=f"delete_{file['file_id']}"
+            )
+        ])
+    return text, InlineKeyboardMarkup(keyboard)
+
+
+def inline_help():
+    help_text = """
+📋 لیست دستورات ربات:
+
+👤 مدیریت پروفایل:
+/profile - مشاهده پروفایل
+/update_profile - به‌روزرسانی پروفایل
+
+📁 مدیریت فایل:
+/upload - آپلود فایل
+/download - دانلود فایل
+/my_files - مشاهده فایل‌های من
+
+📸 عکس:
+/send_photo - ارسال عکس
+
+📊 نظرسنجی:
+/create_poll - ایجاد نظرسنجی جدید
+
+🗄️ دیتابیس:
+/view_database - مشاهده اطلاعات دیتابیس
+/admin_stats - آمار کلی (برای ادمین)
+
+💡 نکته: می‌توانید فایل‌ها و عکس‌ها را مستقیماً ارسال کنید!
+        """
+    return help_text
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark screen rendering")
+    parser.add_argument('--number', type=int, default=20000, help="iterations per screen")
+    args = parser.parse_args()
+
+    templates = MessageTemplates()
+
+    cases = [
+        ("start (inline)", lambda: inline_start("Ali")),
+        ("start (templates)", lambda: (templates.render('welcome', 'fa', first_name="Ali"),
+                                       templates.keyboard('main_menu', 'fa'))),
+        ("help (inline)", inline_help),
+        ("help (templates)", lambda: templates.text('help', 'fa')),
+        ("my_files x10 (inline)", lambda: inline_my_files(FILES)),
+        ("my_files x10 (templates)", lambda: templates.file_list(FILES, 'fa')),
+        ("backup x10 (templates)", lambda: templates.backup_list(FILES, 'fa')),
+    ]
+
+    print(f"{'screen':<28} {'µs/render':>10}")
+    print("-" * 40)
+    for name, func in cases:
+        seconds = min(timeit.repeat(func, number=args.number, repeat=3))
+        print(f"{name:<28} {seconds / args.number * 1e6:>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
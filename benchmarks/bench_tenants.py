@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark for the memory cost of hosting several bots
+
+Starts bots against the fake Bot API in child processes and reports their
+resident memory and open file descriptors once they are polling and have
+answered a few updates:
+
+- separate processes: one bot per process, as with one container per bot
+- one process:        all bots in one event loop, each with its own HTTP clients
+- one process shared: all bots sharing HTTP clients and worker pools (multi-bot mode)
+
+Usage: python3 benchmarks/bench_tenants.py [--bots 20]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_bot_api import FakeBotAPI
+
+
+def resident_kb() -> int:
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+    return 0
+
+
+async def host(bots: int, shared: bool, workdir: str, base_url: str, base_file_url: str) -> dict:
+    """Run in the child: start the bots, let them handle updates, measure"""
+    from hosting import SharedResources, Tenant
+    from telegram_bot import TelegramBot
+
+    resources = SharedResources(bots) if shared else None
+    instances = [
+        TelegramBot(token, tenant=Tenant(token, workdir), shared=resources,
+                    base_url=base_url, base_file_url=base_file_url)
+        for token in (f"{100000 + index}:BENCHMARK" for index in range(bots))
+    ]
+    stop = asyncio.Event()
+    serving = [asyncio.create_task(bot.serve(stop=stop)) for bot in instances]
+    await asyncio.sleep(3)
+
+    result = {'rss_kb': resident_kb(), 'fds': len(os.listdir('/proc/self/fd'))}
+    stop.set()
+    await asyncio.gather(*serving)
+    if resources is not None:
+        resources.shutdown()
+    return result
+
+
+def measure(bots: int, shared: bool, api: FakeBotAPI) -> dict:
+    """Start a child process hosting `bots` bots; returns its memory and descriptors"""
+    with tempfile.TemporaryDirectory() as workdir:
+        for user_id in range(1, 4 * bots + 1):
+            api.push_update({'message': {
+                'message_id': user_id, 'date': 0, 'chat': {'id': user_id, 'type': 'private'},
+                'from': {'id': user_id, 'is_bot': False, 'first_name': f"User{user_id}"},
+                'text': '/start', 'entities': [{'type': 'bot_command', 'offset': 0, 'length': 6}],
+            }})
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--child', str(bots), str(int(shared)),
+             workdir, api.base_url, api.base_file_url],
+            capture_output=True, text=True, check=True
+        ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory per hosted bot")
+    parser.add_argument('--bots', type=int, default=20)
+    parser.add_argument('--child', nargs=5, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        bots, shared, workdir, base_url, base_file_url = args.child
+        result = asyncio.run(host(int(bots), shared == '1', workdir, base_url, base_file_url))
+        print(json.dumps(result))
+        return
+
+    api = FakeBotAPI()
+    api.start()
+    try:
+        single = measure(1, False, api)
+        unshared = measure(args.bots, False, api)
+        shared = measure(args.bots, True, api)
+    finally:
+        api.stop()
+
+    rows = [
+        ('separate processes', single['rss_kb'] * args.bots, single['fds'] * args.bots),
+        ('one process', unshared['rss_kb'], unshared['fds']),
+        ('one process shared', shared['rss_kb'], shared['fds']),
+    ]
+    print(f"{args.bots} bots")
+    print(f"{'hosting':<20} {'total MB':>9} {'MB/bot':>8} {'fds':>6}")
+    print("-" * 46)
+    for name, rss_kb, fds in rows:
+        print(f"{name:<20} {rss_kb / 1024:>9.1f} {rss_kb / 1024 / args.bots:>8.2f} {fds:>6}")
+    marginal = (shared['rss_kb'] - single['rss_kb']) / max(1, args.bots - 1) / 1024
+    print(f"\nEach extra bot in a shared process: {marginal:.2f} MB (vs {single['rss_kb'] / 1024:.1f} MB per process)")
+
+
+if __name__ == '__main__':
+    main()
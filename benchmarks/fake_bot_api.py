@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Minimal fake Telegram Bot API server for benchmarks
+
+Implements just enough of the Bot API for TelegramBot to run against it:
+getMe, deleteWebhook, getUpdates (long polling), sendMessage, sendDocument,
+sendPhoto, editMessageText, answerCallbackQuery, answerInlineQuery, getFile
+and the file download endpoint. It runs its own event loop in a background
+thread so blocking calls in the bot cannot stall it.
+"""
+
+import asyncio
+import itertools
+import json
+import threading
+import time
+from collections import deque
+from typing import Callable, Optional
+from urllib.parse import parse_qs, unquote
+
+BOT_USER = {'id': 1, 'is_bot': True, 'first_name': 'BenchBot', 'username': 'bench_bot'}
+
+
+class FakeBotAPI:
+    """Fake Bot API served on 127.0.0.1
+
+    `on_call(method, params, timestamp)` is invoked from the server thread for
+    every API call the bot makes; tests use it to detect completed operations.
+    """
+
+    def __init__(self, file_size: int = 64 * 1024, latency: float = 0.0,
+                 on_call: Optional[Callable[[str, dict, float], None]] = None):
+        self.file_size = file_size
+        self.latency = latency
+        self.on_call = on_call
+        self.port: Optional[int] = None
+        self.calls = 0
+        self._updates: deque = deque()
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1000)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._server = None
+        self._new_updates: Optional[asyncio.Event] = None
+        self._thread: Optional[threading.Thread] = None
+        self._ready = threading.Event()
+
+    # Lifecycle
+
+    def start(self):
+        """Start serving in a background thread"""
+        self._thread = threading.Thread(target=self._run, name='fake-bot-api', daemon=True)
+        self._thread.start()
+        self._ready.wait()
+
+    def stop(self):
+        """Stop the server thread"""
+        if self._loop is not None and self._loop.is_running():
+            asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop).result(timeout=5)
+            self._loop.call_soon_threadsafe(self._loop.stop)
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/bot"
+
+    @property
+    def base_file_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/file/bot"
+
+    async def _shutdown(self):
+        """Close the listener and open connections before the loop stops"""
+        self._server.close()
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._new_updates = asyncio.Event()
+        self._server = self._loop.run_until_complete(
+            asyncio.start_server(self._handle_connection, '127.0.0.1', 0, backlog=1024)
+        )
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._ready.set()
+        try:
+            self._loop.run_forever()
+        finally:
+            self._server.close()
+            self._loop.close()
+
+    # Feeding updates
+
+    def push_update(self, update: dict) -> int:
+        """Queue an update for getUpdates; returns its update_id (thread-safe)"""
+        update_id = next(self._update_ids)
+        update = dict(update, update_id=update_id)
+        self._loop.call_soon_threadsafe(self._enqueue, update)
+        return update_id
+
+    def _enqueue(self, update: dict):
+        self._updates.append(update)
+        self._new_updates.set()
+
+    # HTTP
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, _ = request_line.decode('latin-1').split(' ', 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = b''
+                length = int(headers.get('content-length', '0'))
+                if length:
+                    body = await reader.readexactly(length)
+
+                status, content_type, payload, extra = await self._dispatch(method, target, headers, body)
+                head = [
+                    f"HTTP/1.1 {status}",
+                    f"Content-Type: {content_type}",
+                    f"Content-Length: {len(payload)}",
+                    "Connection: keep-alive",
+                ] + extra
+                writer.write(("\r\n".join(head) + "\r\n\r\n").encode('latin-1') + payload)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    async def _dispatch(self, http_method: str, target: str, headers: dict, body: bytes):
+        path = unquote(target.split('?', 1)[0])
+        if path.startswith('/file/bot'):
+            return self._serve_file(headers)
+
+        api_method = path.rsplit('/', 1)[-1]
+        params = self._parse_params(headers, body)
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if api_method == 'getUpdates':
+            result = await self._get_updates(params)
+        else:
+            result = self._result_for(api_method, params)
+            if self.on_call is not None:
+                self.on_call(api_method, params, time.perf_counter())
+
+        payload = json.dumps({'ok': True, 'result': result}).encode()
+        return "200 OK", "application/json", payload, []
+
+    @staticmethod
+    def _parse_params(headers: dict, body: bytes) -> dict:
+        content_type = headers.get('content-type', '')
+        if not body:
+            return {}
+        if content_type.startswith('application/json'):
+            return json.loads(body)
+        if content_type.startswith('application/x-www-form-urlencoded'):
+            return {key: values[-1] for key, values in parse_qs(body.decode()).items()}
+        # Multipart uploads are not needed by the scenarios; only the method matters
+        return {}
+
+    def _serve_file(self, headers: dict):
+        size = self.file_size
+        start = 0
+        extra = []
+        status = "200 OK"
+        range_header = headers.get('range')
+        if range_header and range_header.startswith('bytes='):
+            start = int(range_header[6:].split('-', 1)[0] or 0)
+            status = "206 Partial Content"
+            extra.append(f"Content-Range: bytes {start}-{size - 1}/{size}")
+        payload = bytes(size - start)
+        return status, "application/octet-stream", payload, extra
+
+    async def _get_updates(self, params: dict) -> list:
+        offset = int(params.get('offset') or 0)
+        limit = int(params.get('limit') or 100)
+        timeout = float(params.get('timeout') or 0)
+        while self._updates and self._updates[0]['update_id'] < offset:
+            self._updates.popleft()
+        if not self._updates and timeout:
+            self._new_updates.clear()
+            try:
+                await asyncio.wait_for(self._new_updates.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return list(itertools.islice(self._updates, 0, limit))
+
+    def _message(self, params: dict, **fields) -> dict:
+        chat_id = int(params.get('chat_id') or 0)
+        message = {
+            'message_id': int(params['message_id']) if 'message_id' in params else next(self._message_ids),
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': BOT_USER,
+        }
+        message.update(fields)
+        return message
+
+    def _result_for(self, api_method: str, params: dict):
+        if api_method == 'getMe':
+            return dict(BOT_USER, can_join_groups=True, can_read_all_group_messages=False,
+                        supports_inline_queries=True)
+        if api_method in ('deleteWebhook', 'answerCallbackQuery', 'answerInlineQuery', 'setMyCommands'):
+            return True
+        if api_method in ('sendMessage', 'editMessageText'):
+            return self._message(params, text=params.get('text', ''))
+        if api_method == 'sendDocument':
+            return self._message(params, document={'file_id': 'doc', 'file_unique_id': 'doc'})
+        if api_method == 'sendPhoto':
+            return self._message(params, photo=[{'file_id': 'ph', 'file_unique_id': 'ph', 'width': 1, 'height': 1}])
+        if api_method == 'sendMediaGroup':
+            media = json.loads(params.get('media', '[]'))
+            return [self._message(params, photo=[{'file_id': 'ph', 'file_unique_id': 'ph', 'width': 1, 'height': 1}])
+                    for _ in media]
+        if api_method == 'getFile':
+            file_id = params.get('file_id', 'file')
+            return {
+                'file_id': file_id,
+                'file_unique_id': file_id,
+                'file_size': self.file_size,
+                'file_path': f"documents/{file_id}",
+            }
+        return True
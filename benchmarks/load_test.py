@@ -0,0 +1,363 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+End-to-end load test for Telegram Bot
+
+Runs TelegramBot with real polling against the fake Bot API in
+fake_bot_api.py and drives realistic scenarios through it:
+
+- registration: a storm of /start from new users
+- uploads:      users sending albums of documents or photos at once
+- navigation:   menu button taps (callback queries)
+- backup:       "backup all" for users with stored files
+
+Each operation is timed from pushing its update to the bot's API call that
+completes it. Throughput, p50/p99 latency and peak RSS are reported per
+scenario and compared with the stored baselines. The scenarios run several
+times, each with a fresh bot, and every metric is the median over the runs:
+single runs on a small machine vary by 15% and more.
+
+Usage:
+    python3 benchmarks/load_test.py                    # run and compare with baselines
+    python3 benchmarks/load_test.py --save-baseline    # run and store new baselines
+    python3 benchmarks/load_test.py --scenarios registration,backup --scale 2 --runs 5
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import resource
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+from fake_bot_api import BOT_USER, FakeBotAPI
+from telegram_bot import TelegramBot
+
+BASELINES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines.json')
+TOKEN = '123456:BENCHMARK'
+
+Predicate = Callable[[str, dict], bool]
+
+
+def sends_message(method: str, params: dict) -> bool:
+    return method == 'sendMessage'
+
+
+def finishes_backup(method: str, params: dict) -> bool:
+    return method == 'editMessageText' and '✅' in params.get('text', '')
+
+
+class Harness:
+    """Bot and fake API wired together, with completion tracking per chat"""
+
+    def __init__(self, workdir: str, api_latency: float = 0.0):
+        self.workdir = workdir
+        self.api = FakeBotAPI(latency=api_latency, on_call=self._on_call)
+        self.bot: Optional[TelegramBot] = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._waiters: Dict[int, List[tuple]] = {}
+        self._message_ids = itertools.count(1)
+
+    async def start(self):
+        self.loop = asyncio.get_running_loop()
+        self.api.start()
+        Config.BACKUP_DIR = os.path.join(self.workdir, 'backups')
+        self.bot = TelegramBot(
+            TOKEN,
+            db_path=os.path.join(self.workdir, 'bench.db'),
+            base_url=self.api.base_url,
+            base_file_url=self.api.base_file_url
+        )
+        application = self.bot.application
+        await application.initialize()
+        await application.start()
+        await application.updater.start_polling(poll_interval=0, timeout=10)
+
+    async def stop(self):
+        application = self.bot.application
+        await application.updater.stop()
+        await application.stop()
+        await application.shutdown()
+        self.api.stop()
+
+    # Completion tracking
+
+    def _on_call(self, method: str, params: dict, timestamp: float):
+        # Called from the server thread
+        self.loop.call_soon_threadsafe(self._resolve, method, params, timestamp)
+
+    def _resolve(self, method: str, params: dict, timestamp: float):
+        chat_id = int(params.get('chat_id') or 0)
+        waiters = self._waiters.get(chat_id)
+        if not waiters:
+            return
+        for waiter in waiters:
+            predicate, future = waiter
+            if not future.done() and predicate(method, params):
+                future.set_result(timestamp)
+                waiters.remove(waiter)
+                break
+
+    def expect(self, chat_id: int, predicate: Predicate) -> asyncio.Future:
+        future = self.loop.create_future()
+        self._waiters.setdefault(chat_id, []).append((predicate, future))
+        return future
+
+    # Update builders
+
+    def user(self, user_id: int) -> dict:
+        return {'id': user_id, 'is_bot': False, 'first_name': f"User{user_id}", 'language_code': 'fa'}
+
+    def message(self, user_id: int, **fields) -> dict:
+        message = {
+            'message_id': next(self._message_ids),
+            'date': int(time.time()),
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': self.user(user_id),
+        }
+        message.update(fields)
+        return {'message': message}
+
+    def command(self, user_id: int, command: str) -> dict:
+        return self.message(user_id, text=command, entities=[
+            {'type': 'bot_command', 'offset': 0, 'length': len(command.split()[0])}
+        ])
+
+    def document(self, user_id: int, index: int, media_group_id: Optional[str] = None) -> dict:
+        fields = {'document': {
+            'file_id': f"doc_{user_id}_{index}",
+            'file_unique_id': f"udoc_{user_id}_{index}",
+            'file_name': f"report_{index}.pdf",
+            'mime_type': 'application/pdf',
+            'file_size': 64 * 1024,
+        }}
+        if media_group_id:
+            fields['media_group_id'] = media_group_id
+        return self.message(user_id, **fields)
+
+    def photo(self, user_id: int, index: int, media_group_id: Optional[str] = None) -> dict:
+        fields = {'photo': [
+            {'file_id': f"photo_{user_id}_{index}_s", 'file_unique_id': f"uphoto_{user_id}_{index}_s",
+             'width': 90, 'height': 90, 'file_size': 2 * 1024},
+            {'file_id': f"photo_{user_id}_{index}", 'file_unique_id': f"uphoto_{user_id}_{index}",
+             'width': 1280, 'height': 960, 'file_size': 180 * 1024},
+        ]}
+        if media_group_id:
+            fields['media_group_id'] = media_group_id
+        return self.message(user_id, **fields)
+
+    def callback(self, user_id: int, data: str) -> dict:
+        return {'callback_query': {
+            'id': f"cq_{user_id}_{next(self._message_ids)}",
+            'from': self.user(user_id),
+            'chat_instance': str(user_id),
+            'data': data,
+            'message': {
+                'message_id': next(self._message_ids),
+                'date': int(time.time()),
+                'chat': {'id': user_id, 'type': 'private'},
+                'from': BOT_USER,
+                'text': 'menu',
+            },
+        }}
+
+    # Running operations
+
+    async def run(self, operations: List[tuple], timeout: float = 120) -> List[float]:
+        """Push every operation's updates at once; returns per-operation latency in seconds
+
+        Each operation is (chat_id, [updates], completion predicate).
+        """
+        pending = []
+        for chat_id, updates, predicate in operations:
+            future = self.expect(chat_id, predicate)
+            for update in updates:
+                self.api.push_update(update)
+            pending.append((time.perf_counter(), future))
+
+        latencies = []
+        for started, future in pending:
+            finished = await asyncio.wait_for(future, timeout)
+            latencies.append(finished - started)
+        return latencies
+
+    def seed_files(self, user_id: int, count: int):
+        """Insert stored files for a user directly"""
+        conn = sqlite3.connect(self.bot.db_path)
+        conn.execute('INSERT OR IGNORE INTO users (user_id, first_name) VALUES (?, ?)', (user_id, f"User{user_id}"))
+        conn.executemany('''
+            INSERT INTO files (user_id, file_name, file_type, file_size, telegram_file_id)
+            VALUES (?, ?, ?, ?, ?)
+        ''', [
+            (user_id, f"seed_{i}.pdf", 'application/pdf', 64 * 1024, f"seed_{user_id}_{i}")
+            for i in range(count)
+        ])
+        conn.commit()
+        conn.close()
+
+
+# Scenarios: each returns the operations to run for a given scale
+
+def registration(harness: Harness, scale: int) -> List[tuple]:
+    return [
+        (user_id, [harness.command(user_id, '/start')], sends_message)
+        for user_id in range(10_000, 10_000 + 200 * scale)
+    ]
+
+
+def uploads(harness: Harness, scale: int) -> List[tuple]:
+    operations = []
+    for user_id in range(20_000, 20_000 + 20 * scale):
+        # Half the users send a document album, the others a photo album
+        build = harness.document if user_id % 2 else harness.photo
+        album = [build(user_id, i, media_group_id=f"album_{user_id}") for i in range(10)]
+        operations.append((user_id, album, sends_message))
+    return operations
+
+
+def navigation(harness: Harness, scale: int) -> List[tuple]:
+    buttons = ['my_files', 'profile', 'create_poll']
+    return [
+        (user_id, [harness.callback(user_id, buttons[user_id % len(buttons)])], sends_message)
+        for user_id in range(30_000, 30_000 + 200 * scale)
+    ]
+
+
+def backup(harness: Harness, scale: int) -> List[tuple]:
+    operations = []
+    for user_id in range(40_000, 40_000 + 5 * scale):
+        harness.seed_files(user_id, 10)
+        operations.append((user_id, [harness.callback(user_id, 'backup_all')], finishes_backup))
+    return operations
+
+
+SCENARIOS = {
+    'registration': registration,
+    'uploads': uploads,
+    'navigation': navigation,
+    'backup': backup,
+}
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def run_scenarios(names: List[str], scale: int, api_latency: float) -> Dict[str, dict]:
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        harness = Harness(workdir, api_latency=api_latency)
+        await harness.start()
+        try:
+            for name in names:
+                operations = SCENARIOS[name](harness, scale)
+                started = time.perf_counter()
+                latencies = await harness.run(operations)
+                elapsed = time.perf_counter() - started
+                results[name] = {
+                    'operations': len(latencies),
+                    'throughput': len(latencies) / elapsed,
+                    'p50_ms': percentile(latencies, 0.50) * 1000,
+                    'p99_ms': percentile(latencies, 0.99) * 1000,
+                    'peak_rss_mb': peak_rss_mb(),
+                }
+        finally:
+            await harness.stop()
+    return results
+
+
+def median_results(runs: List[Dict[str, dict]]) -> Dict[str, dict]:
+    """Per scenario, the median of each metric over several runs"""
+    return {
+        name: {metric: statistics.median(run[name][metric] for run in runs) for metric in result}
+        for name, result in runs[0].items()
+    }
+
+
+def compare(results: Dict[str, dict], baselines: Dict[str, dict], tolerance: float) -> List[str]:
+    """List regressions beyond the tolerance"""
+    regressions = []
+    for name, result in results.items():
+        baseline = baselines.get(name)
+        if not baseline:
+            continue
+        if result['throughput'] < baseline['throughput'] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {result['throughput']:.1f}/s < baseline {baseline['throughput']:.1f}/s")
+        if result['p99_ms'] > baseline['p99_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p99 {result['p99_ms']:.1f}ms > baseline {baseline['p99_ms']:.1f}ms")
+        if result['peak_rss_mb'] > baseline['peak_rss_mb'] * (1 + tolerance):
+            regressions.append(f"{name}: peak RSS {result['peak_rss_mb']:.1f}MB > baseline {baseline['peak_rss_mb']:.1f}MB")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end load test against a fake Bot API")
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help="comma separated scenario names")
+    parser.add_argument('--scale', type=int, default=1, help="multiplier for the number of operations")
+    parser.add_argument('--api-latency', type=float, default=0.0, help="simulated Bot API latency in seconds")
+    parser.add_argument('--runs', type=int, default=5, help="runs to take the median of")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="allowed regression ratio")
+    parser.add_argument('--save-baseline', action='store_true', help="store results as the new baselines")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    names = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+
+    results = median_results([
+        asyncio.run(run_scenarios(names, args.scale, args.api_latency)) for _ in range(max(1, args.runs))
+    ])
+
+    print(f"\nMedian of {max(1, args.runs)} runs")
+    print(f"{'scenario':<14} {'ops':>6} {'ops/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'RSS MB':>8}")
+    print("-" * 60)
+    for name, result in results.items():
+        print(f"{name:<14} {result['operations']:>6} {result['throughput']:>9.1f} "
+              f"{result['p50_ms']:>9.1f} {result['p99_ms']:>9.1f} {result['peak_rss_mb']:>8.1f}")
+
+    baselines = {}
+    if os.path.exists(BASELINES_PATH):
+        with open(BASELINES_PATH) as f:
+            baselines = json.load(f)
+
+    if args.save_baseline:
+        key = f"scale={args.scale},api_latency={args.api_latency}"
+        baselines.setdefault(key, {}).update({
+            name: {metric: round(value, 2) for metric, value in result.items()}
+            for name, result in results.items()
+        })
+        with open(BASELINES_PATH, 'w') as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+        print(f"\n💾 Baselines saved to {BASELINES_PATH}")
+        return
+
+    regressions = compare(results, baselines.get(f"scale={args.scale},api_latency={args.api_latency}", {}),
+                          args.tolerance)
+    if regressions:
+        print("\n❌ Regressions:")
+        for line in regressions:
+            print(f"  {line}")
+        sys.exit(1)
+    print("\n✅ No regressions")
+
+
+if __name__ == '__main__':
+    main()
@@ -14,37 +14,136 @@ class Config:
     BOT_TOKEN: Optional[str] = os.getenv('TELEGRAM_BOT_TOKEN')
     BOT_USERNAME: Optional[str] = os.getenv('BOT_USERNAME', 'your_bot_username')
     
+    # Multi-bot hosting: several tokens served by one process, each with its own data directory
+    BOT_TOKENS: list = [token.strip() for token in os.getenv('TELEGRAM_BOT_TOKENS', '').split(',') if token.strip()]
+    TENANTS_DIR: str = os.getenv('TENANTS_DIR', '')  # default: tenants/ next to the database
+    TENANT_API_RATE_LIMIT: float = float(os.getenv('TENANT_API_RATE_LIMIT', '30'))  # API calls/s per hosted bot
+    
+    # Bot API client settings
+    API_CONNECTION_POOL_SIZE: int = int(os.getenv('API_CONNECTION_POOL_SIZE', '64'))
+    API_POOL_TIMEOUT: float = float(os.getenv('API_POOL_TIMEOUT', '5'))
+    SEND_MAX_RETRIES: int = int(os.getenv('SEND_MAX_RETRIES', '5'))
+    SEND_RETRY_BASE_DELAY: float = float(os.getenv('SEND_RETRY_BASE_DELAY', '0.5'))  # seconds
+    SEND_RETRY_MAX_DELAY: float = float(os.getenv('SEND_RETRY_MAX_DELAY', '30'))  # seconds
+    API_RATE_LIMIT: float = float(os.getenv('API_RATE_LIMIT', '0'))  # API calls/s, 0 = no limit
+    
     # Database settings
     DATABASE_PATH: str = os.getenv('DATABASE_PATH', 'bot_database.db')
     
+    # Diagnostics (/diag)
+    SLOW_QUERY_MS: float = float(os.getenv('SLOW_QUERY_MS', '50'))  # statements at least this slow are kept
+    SLOW_QUERY_LOG_SIZE: int = int(os.getenv('SLOW_QUERY_LOG_SIZE', '200'))
+    LOOP_LAG_INTERVAL: float = float(os.getenv('LOOP_LAG_INTERVAL', '0.5'))  # seconds between probes, 0 = off
+    LOOP_LAG_WINDOW: int = int(os.getenv('LOOP_LAG_WINDOW', '300'))  # seconds of probes kept
+    LOOP_LAG_WARN_MS: float = float(os.getenv('LOOP_LAG_WARN_MS', '250'))
+    PROFILE_INTERVAL_MS: float = float(os.getenv('PROFILE_INTERVAL_MS', '5'))  # sampling interval
+    PROFILE_MAX_SECONDS: int = int(os.getenv('PROFILE_MAX_SECONDS', '120'))
+    DIAG_SQL_LIMIT: int = int(os.getenv('DIAG_SQL_LIMIT', '15'))  # statements listed by /diag sql
+    DIAG_SQL_CHARS: int = int(os.getenv('DIAG_SQL_CHARS', '200'))  # longer statements are cut
+    
+    # Update scheduling: heavy updates run apart from interactive ones
+    PRIORITY_SCHEDULING: bool = os.getenv('PRIORITY_SCHEDULING', 'true').lower() in ('1', 'true', 'yes')
+    MAX_CONCURRENT_UPDATES: int = int(os.getenv('MAX_CONCURRENT_UPDATES', '256'))  # running or waiting
+    INTERACTIVE_CONCURRENCY: int = int(os.getenv('INTERACTIVE_CONCURRENCY', '32'))  # most interactive updates at once
+    INTERACTIVE_INITIAL_CONCURRENCY: int = int(os.getenv('INTERACTIVE_INITIAL_CONCURRENCY', '1'))  # adapts from here
+    INTERACTIVE_LOOP_BUSY: float = float(os.getenv('INTERACTIVE_LOOP_BUSY', '0.75'))  # event loop share that stops it rising
+    HEAVY_CONCURRENCY: int = int(os.getenv('HEAVY_CONCURRENCY', '2'))  # heavy updates running at once
+    HEAVY_PER_USER: int = int(os.getenv('HEAVY_PER_USER', '1'))  # of which from one user
+    HEAVY_QUEUE_PER_USER: int = int(os.getenv('HEAVY_QUEUE_PER_USER', '3'))  # waiting per user before refusing
+    HEAVY_THREADS: int = int(os.getenv('HEAVY_THREADS', '4'))  # threads for blocking heavy work
+    INTERACTIVE_SLO_MS: float = float(os.getenv('INTERACTIVE_SLO_MS', '500'))  # latency target
+    
+    # Shutdown and hand-off settings
+    SHUTDOWN_DEADLINE: float = float(os.getenv('SHUTDOWN_DEADLINE', '25'))  # seconds to drain in-flight work
+    HANDOFF_DIR: str = os.getenv('HANDOFF_DIR', '')  # polling lock directory, default: next to the database
+    HANDOFF_TIMEOUT: float = float(os.getenv('HANDOFF_TIMEOUT', '60'))  # seconds to wait for the old instance
+    HANDOFF_CHECK_INTERVAL: float = float(os.getenv('HANDOFF_CHECK_INTERVAL', '0.2'))  # seconds
+    
     # Logging settings
     LOG_LEVEL: str = os.getenv('LOG_LEVEL', 'INFO')
     LOG_FORMAT: str = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    LOG_JSON_CONSOLE: bool = os.getenv('LOG_JSON_CONSOLE', 'false').lower() in ('1', 'true', 'yes')
+    LOG_DIR: str = os.getenv('LOG_DIR', '/app/logs')
+    LOG_FILE_NAME: str = os.getenv('LOG_FILE_NAME', 'bot.log')
+    LOG_FILE_MAX_BYTES: int = int(os.getenv('LOG_FILE_MAX_BYTES', str(10 * 1024 * 1024)))
+    LOG_FILE_BACKUP_COUNT: int = int(os.getenv('LOG_FILE_BACKUP_COUNT', '5'))
+    LOG_DEBUG_SAMPLE_RATE: int = int(os.getenv('LOG_DEBUG_SAMPLE_RATE', '100'))  # keep 1 in N debug records
+    LOG_SLOW_HANDLER_MS: float = float(os.getenv('LOG_SLOW_HANDLER_MS', '1000'))
     
     # File settings
+    BACKUP_DIR: str = os.getenv('BACKUP_DIR', '/app/backups/files')
     MAX_FILE_SIZE: int = int(os.getenv('MAX_FILE_SIZE', '50')) * 1024 * 1024  # 50MB default
+    QUOTA_MAX_MB: int = int(os.getenv('QUOTA_MAX_MB', '1024'))  # stored per user, 0 = unlimited
+    QUOTA_MAX_FILES: int = int(os.getenv('QUOTA_MAX_FILES', '0'))  # files per user, 0 = unlimited
     ALLOWED_FILE_TYPES: list = [
-        'image/jpeg', 'image/png', 'image/gif',
-        'application/pdf', 'text/plain',
-        'audio/mpeg', 'video/mp4',
-        'application/zip'
+        file_type.strip() for file_type in os.getenv(
+            'ALLOWED_FILE_TYPES',
+            'image/jpeg,image/png,image/gif,application/pdf,text/plain,audio/mpeg,video/mp4,application/zip'
+        ).split(',')
+        if file_type.strip()
     ]
+    TRANSFER_TIMEOUT: float = float(os.getenv('TRANSFER_TIMEOUT', '60'))  # seconds without data
+    TRANSFER_MAX_RETRIES: int = int(os.getenv('TRANSFER_MAX_RETRIES', '5'))
+    VERIFY_WORKERS: int = int(os.getenv('VERIFY_WORKERS', '2'))  # backups hashed in parallel
+    VERIFY_READ_MBPS: float = float(os.getenv('VERIFY_READ_MBPS', '50'))  # combined read limit, 0 = none
+    
+    # Retention: rows older than this many days move to the archive database (0 keeps them)
+    FILES_RETENTION_DAYS: int = int(os.getenv('FILES_RETENTION_DAYS', '0'))
+    POLL_RESPONSES_RETENTION_DAYS: int = int(os.getenv('POLL_RESPONSES_RETENTION_DAYS', '0'))
+    ARCHIVE_DATABASE_PATH: str = os.getenv('ARCHIVE_DATABASE_PATH', '')  # default: <database>_archive.db
+    ARCHIVE_BATCH_SIZE: int = int(os.getenv('ARCHIVE_BATCH_SIZE', '500'))
+    ARCHIVE_BATCH_PAUSE_MS: int = int(os.getenv('ARCHIVE_BATCH_PAUSE_MS', '50'))
+    ARCHIVE_INTERVAL: int = int(os.getenv('ARCHIVE_INTERVAL', '3600'))  # seconds
+    FILES_PAGE_SIZE: int = int(os.getenv('FILES_PAGE_SIZE', '10'))
+    
+    # Photo previews: thumbnails and perceptual hashes of backed-up images (needs Pillow)
+    THUMBNAIL_DIR: str = os.getenv('THUMBNAIL_DIR', '/app/backups/thumbnails')
+    THUMBNAIL_SIZE: int = int(os.getenv('THUMBNAIL_SIZE', '320'))  # longest side, pixels
+    THUMBNAIL_QUALITY: int = int(os.getenv('THUMBNAIL_QUALITY', '80'))
+    THUMBNAIL_WORKERS: int = int(os.getenv('THUMBNAIL_WORKERS', '2'))  # worker processes
+    THUMBNAIL_BATCH_SIZE: int = int(os.getenv('THUMBNAIL_BATCH_SIZE', '32'))
+    THUMBNAIL_INTERVAL: int = int(os.getenv('THUMBNAIL_INTERVAL', '600'))  # seconds
+    GALLERY_PAGE_SIZE: int = min(10, int(os.getenv('GALLERY_PAGE_SIZE', '10')))  # Telegram album limit
+    DUPLICATE_MAX_DISTANCE: int = int(os.getenv('DUPLICATE_MAX_DISTANCE', '6'))  # differing hash bits
+    
+    # Upload batching: albums and bursts are stored and answered together
+    UPLOAD_BATCH_WINDOW_MS: int = int(os.getenv('UPLOAD_BATCH_WINDOW_MS', '800'))
+    UPLOAD_BATCH_MAX_WAIT_MS: int = int(os.getenv('UPLOAD_BATCH_MAX_WAIT_MS', '3000'))
+    UPLOAD_BATCH_MAX_ITEMS: int = int(os.getenv('UPLOAD_BATCH_MAX_ITEMS', '50'))
+    
+    # Language settings
+    DEFAULT_LANGUAGE: str = os.getenv('DEFAULT_LANGUAGE', 'fa')
+    
+    # Search settings
+    SEARCH_PAGE_SIZE: int = int(os.getenv('SEARCH_PAGE_SIZE', '10'))
+    
+    # Inline mode settings
+    INLINE_CACHE_TIME: int = int(os.getenv('INLINE_CACHE_TIME', '30'))  # seconds
+    INLINE_DEBOUNCE_MS: int = int(os.getenv('INLINE_DEBOUNCE_MS', '250'))
+    INLINE_RESULTS_LIMIT: int = 50  # Telegram maximum per answer
+    INLINE_INDEX_MAX_USERS: int = int(os.getenv('INLINE_INDEX_MAX_USERS', '1000'))
     
     # Poll settings
     MAX_POLL_OPTIONS: int = int(os.getenv('MAX_POLL_OPTIONS', '10'))
     MAX_POLL_QUESTION_LENGTH: int = int(os.getenv('MAX_POLL_QUESTION_LENGTH', '300'))
     
+    # Analytics settings
+    ANALYTICS_DEFAULT_DAYS: int = int(os.getenv('ANALYTICS_DEFAULT_DAYS', '7'))
+    ANALYTICS_MAX_DAYS: int = int(os.getenv('ANALYTICS_MAX_DAYS', '365'))
+    
     # Admin settings
     ADMIN_USER_IDS: list = [
         int(user_id) for user_id in os.getenv('ADMIN_USER_IDS', '').split(',')
         if user_id.strip()
     ]
+    BULK_CHUNK_SIZE: int = int(os.getenv('BULK_CHUNK_SIZE', '200'))
+    BULK_CHUNK_PAUSE_MS: int = int(os.getenv('BULK_CHUNK_PAUSE_MS', '100'))
     
     @classmethod
     def validate(cls) -> bool:
         """Validate configuration"""
-        if not cls.BOT_TOKEN:
-            print("❌ TELEGRAM_BOT_TOKEN is required!")
+        if not cls.BOT_TOKEN and not cls.BOT_TOKENS:
+            print("❌ TELEGRAM_BOT_TOKEN or TELEGRAM_BOT_TOKENS is required!")
             return False
         return True
     
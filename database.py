@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Database access helpers for Telegram Bot queries
+
+Rows come back as tuples with named fields instead of one dict per row. The
+row class is built once per column list and shared by every row with those
+columns, so a row costs what a plain tuple costs. Rows still read like the
+dicts they replace: row['file_name'], row.get('file_name'), dict(row), plus
+attribute access (row.file_name).
+
+Connections from open_connection() time every statement and commit. Those
+slower than SLOW_QUERY_MS are kept in a small ring buffer for /diag; the
+rest cost two clock reads.
+"""
+
+import functools
+import keyword
+import sqlite3
+import threading
+import time
+from collections import deque
+from operator import itemgetter
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from config import Config
+
+
+class Row(tuple):
+    """Base class of the generated row classes"""
+
+    __slots__ = ()
+    _fields: Tuple[str, ...] = ()
+    _index: Dict[str, int] = {}
+
+    def __getitem__(self, key):
+        if key.__class__ is str:
+            return tuple.__getitem__(self, self._index[key])
+        return tuple.__getitem__(self, key)
+
+    def get(self, key: str, default=None):
+        index = self._index.get(key)
+        return default if index is None else tuple.__getitem__(self, index)
+
+    def keys(self) -> Tuple[str, ...]:
+        return self._fields
+
+    def _asdict(self) -> dict:
+        return dict(zip(self._fields, self))
+
+    def __repr__(self) -> str:
+        return f"Row({', '.join(f'{name}={value!r}' for name, value in zip(self._fields, self))})"
+
+
+@functools.lru_cache(maxsize=256)
+def row_class(columns: Tuple[str, ...]) -> type:
+    """The shared row class for a column list"""
+    index: Dict[str, int] = {}
+    for position, name in enumerate(columns):
+        index.setdefault(name, position)
+
+    namespace = {'__slots__': (), '_fields': columns, '_index': index}
+    for name, position in index.items():
+        if name.isidentifier() and not keyword.iskeyword(name) and not hasattr(Row, name):
+            namespace[name] = property(itemgetter(position))
+    return type('Row', (Row,), namespace)
+
+
+def _factory(cursor: sqlite3.Cursor):
+    cls = row_class(tuple(description[0] for description in cursor.description))
+    return functools.partial(tuple.__new__, cls)
+
+
+def iter_rows(cursor: sqlite3.Cursor) -> Iterator[Row]:
+    """Lazily turn the rows of an executed query into row objects"""
+    if cursor.description is None:
+        return iter(())
+    return map(_factory(cursor), cursor)
+
+
+def fetch_rows(cursor: sqlite3.Cursor) -> List[Row]:
+    return list(iter_rows(cursor))
+
+
+def fetch_row(cursor: sqlite3.Cursor) -> Optional[Row]:
+    result = cursor.fetchone()
+    return None if result is None else _factory(cursor)(result)
+
+
+class QueryLog:
+    """The most recent statements that ran slower than a threshold"""
+
+    def __init__(self, threshold_ms: float, size: int):
+        self.threshold = threshold_ms / 1000
+        # (unix time, seconds, sql, thread name)
+        self.statements: deque = deque(maxlen=size)
+
+    def record(self, sql: str, seconds: float):
+        if seconds >= self.threshold:
+            self.statements.append((time.time(), seconds, ' '.join(sql.split()), threading.current_thread().name))
+
+    def slowest(self, limit: int) -> List[tuple]:
+        return sorted(self.statements, key=itemgetter(1), reverse=True)[:limit]
+
+    def clear(self):
+        self.statements.clear()
+
+
+query_log = QueryLog(Config.SLOW_QUERY_MS, Config.SLOW_QUERY_LOG_SIZE)
+
+
+# Looked up once; these run for every statement
+perf_counter = time.perf_counter
+_execute = sqlite3.Cursor.execute
+_executemany = sqlite3.Cursor.executemany
+
+
+class TimedCursor(sqlite3.Cursor):
+    """Cursor reporting slow statements to query_log; times execution up to the first row"""
+
+    def execute(self, sql, parameters=()):
+        started = perf_counter()
+        try:
+            return _execute(self, sql, parameters)
+        finally:
+            elapsed = perf_counter() - started
+            if elapsed >= query_log.threshold:
+                query_log.record(sql, elapsed)
+
+    def executemany(self, sql, seq_of_parameters):
+        started = perf_counter()
+        try:
+            return _executemany(self, sql, seq_of_parameters)
+        finally:
+            elapsed = perf_counter() - started
+            if elapsed >= query_log.threshold:
+                query_log.record(sql, elapsed)
+
+
+class TimedConnection(sqlite3.Connection):
+    """Connection whose statements and commits go through query_log"""
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    # sqlite3.Connection.execute does not go through cursor()
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def commit(self):
+        started = time.perf_counter()
+        try:
+            super().commit()
+        finally:
+            query_log.record('COMMIT', time.perf_counter() - started)
+
+
+def open_connection(path: str) -> sqlite3.Connection:
+    """Connect to a bot database with statement timing"""
+    return sqlite3.connect(path, factory=TimedConnection)
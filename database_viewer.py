@@ -7,7 +7,10 @@ Database viewer for Telegram Bot
 import sqlite3
 import os
 from datetime import datetime
+from analytics import ActivityAnalytics, format_value, metric_label, sparkline
 from config import Config
+from database import iter_rows
+from retention import ArchiveManager
 
 class DatabaseViewer:
     """Database viewer class"""
@@ -26,42 +29,53 @@ class DatabaseViewer:
             FROM users ORDER BY registration_date DESC
         ''')
         
-        users = cursor.fetchall()
-        conn.close()
-        
         print("\n👥 لیست کاربران:")
         print("-" * 80)
         print(f"{'ID':<10} {'نام کاربری':<15} {'نام':<15} {'ایمیل':<20} {'وضعیت':<8}")
         print("-" * 80)
         
-        for user in users:
-            status = "✅ فعال" if user[7] else "❌ غیرفعال"
-            print(f"{user[0]:<10} {user[1] or 'N/A':<15} {user[2] or 'N/A':<15} {user[4] or 'N/A':<20} {status:<8}")
-    
-    def view_files(self):
-        """View all files"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        # Rows are printed as they are read, never held all at once
+        for user in iter_rows(cursor):
+            status = "✅ فعال" if user.is_active else "❌ غیرفعال"
+            print(f"{user.user_id:<10} {user.username or 'N/A':<15} {user.first_name or 'N/A':<15} "
+                  f"{user.email or 'N/A':<20} {status:<8}")
         
-        cursor.execute('''
-            SELECT f.file_id, f.user_id, f.file_name, f.file_type, 
-                   f.file_size, f.upload_date, u.first_name
-            FROM files f
-            JOIN users u ON f.user_id = u.user_id
-            ORDER BY f.upload_date DESC
-        ''')
-        
-        files = cursor.fetchall()
         conn.close()
+    
+    def view_files(self, page_size: int = 50):
+        """View all files page by page, continuing into the archive"""
+        archive = ArchiveManager(self.db_path)
+        # A database that was never archived has no archive tables yet
+        archive.init_schema()
+        page = 0
         
         print("\n📁 لیست فایل‌ها:")
-        print("-" * 100)
-        print(f"{'ID':<5} {'کاربر':<15} {'نام فایل':<20} {'نوع':<15} {'حجم':<10} {'تاریخ':<15}")
-        print("-" * 100)
-        
-        for file in files:
-            size_mb = file[4] / (1024 * 1024) if file[4] else 0
-            print(f"{file[0]:<5} {file[6] or 'N/A':<15} {file[2][:20]:<20} {file[3][:15]:<15} {size_mb:.2f}MB {file[5][:15]:<15}")
+        while True:
+            files, has_next = archive.list_files(page_size, page * page_size)
+            
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            user_ids = sorted({file['user_id'] for file in files})
+            cursor.execute(
+                f"SELECT user_id, first_name FROM users WHERE user_id IN ({', '.join('?' * len(user_ids))})",
+                user_ids
+            )
+            names = dict(cursor.fetchall())
+            conn.close()
+            
+            print("-" * 100)
+            print(f"{'ID':<5} {'کاربر':<15} {'نام فایل':<20} {'نوع':<15} {'حجم':<10} {'تاریخ':<15}")
+            print("-" * 100)
+            
+            for file in files:
+                size_mb = file['file_size'] / (1024 * 1024) if file['file_size'] else 0
+                archived = " 🗄️" if file['archived'] else ""
+                print(f"{file['file_id']:<5} {names.get(file['user_id']) or 'N/A':<15} {(file['file_name'] or '')[:20]:<20} "
+                      f"{(file['file_type'] or '')[:15]:<15} {size_mb:.2f}MB {str(file['upload_date'])[:15]:<15}{archived}")
+            
+            if not has_next or input("\nصفحه بعد؟ (Enter = بله، q = بازگشت): ").strip().lower() == 'q':
+                break
+            page += 1
     
     def view_polls(self):
         """View all polls"""
@@ -76,19 +90,19 @@ class DatabaseViewer:
             ORDER BY p.creation_date DESC
         ''')
         
-        polls = cursor.fetchall()
-        conn.close()
-        
         print("\n📊 لیست نظرسنجی‌ها:")
         print("-" * 120)
         print(f"{'ID':<5} {'کاربر':<15} {'سوال':<40} {'گزینه‌ها':<30} {'تاریخ':<15} {'وضعیت':<8}")
         print("-" * 120)
         
-        for poll in polls:
-            status = "✅ فعال" if poll[5] else "❌ غیرفعال"
-            question = poll[2][:40] if poll[2] else 'N/A'
-            options = poll[3][:30] if poll[3] else 'N/A'
-            print(f"{poll[0]:<5} {poll[6] or 'N/A':<15} {question:<40} {options:<30} {poll[4][:15]:<15} {status:<8}")
+        for poll in iter_rows(cursor):
+            status = "✅ فعال" if poll.is_active else "❌ غیرفعال"
+            question = poll.question[:40] if poll.question else 'N/A'
+            options = poll.options[:30] if poll.options else 'N/A'
+            print(f"{poll.poll_id:<5} {poll.first_name or 'N/A':<15} {question:<40} {options:<30} "
+                  f"{poll.creation_date[:15]:<15} {status:<8}")
+        
+        conn.close()
     
     def get_statistics(self):
         """Get database statistics"""
@@ -137,6 +151,26 @@ class DatabaseViewer:
         print(f"📊 نظرسنجی‌های فعال: {active_polls}")
         print(f"💾 حجم دیتابیس: {db_size:.2f} KB")
     
+    def view_activity(self, days: int = 14):
+        """View activity trends from the analytics rollups"""
+        report = ActivityAnalytics(self.db_path).recent(days)
+        
+        print(f"\n📈 روند فعالیت {days} روز اخیر (UTC):")
+        print("-" * 80)
+        if not report['trends']:
+            print("📭 فعالیتی ثبت نشده است.")
+            return
+        
+        for metric, trend in report['trends'].items():
+            total = format_value(metric, report['totals'].get(metric, 0))
+            print(f"{metric_label(metric):<20} {total:>12}  {sparkline(trend)}")
+        
+        print("-" * 80)
+        print(f"{'تاریخ':<20} " + " ".join(f"{metric_label(metric)[:10]:>12}" for metric in report['trends']))
+        for index, bucket in enumerate(report['buckets']):
+            values = [format_value(metric, trend[index]) for metric, trend in report['trends'].items()]
+            print(f"{bucket:<20} " + " ".join(f"{value:>12}" for value in values))
+    
     def interactive_menu(self):
         """Interactive menu for database viewing"""
         while True:
@@ -147,9 +181,10 @@ class DatabaseViewer:
             print("2. 📁 مشاهده فایل‌ها")
             print("3. 📊 مشاهده نظرسنجی‌ها")
             print("4. 📈 آمار کلی")
-            print("5. ❌ خروج")
+            print("5. 📉 روند فعالیت")
+            print("6. ❌ خروج")
             
-            choice = input("\nانتخاب کنید (1-5): ").strip()
+            choice = input("\nانتخاب کنید (1-6): ").strip()
             
             if choice == '1':
                 self.view_users()
@@ -160,6 +195,8 @@ class DatabaseViewer:
             elif choice == '4':
                 self.get_statistics()
             elif choice == '5':
+                self.view_activity()
+            elif choice == '6':
                 print("👋 خداحافظ!")
                 break
             else:
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Runtime diagnostics for Telegram Bot
+
+- Event-loop lag: a probe task sleeps for a fixed interval and records how
+  late it wakes up. A late wake-up means something blocked the loop.
+- Sampling profiler: for a requested number of seconds, a background thread
+  records the stacks of all threads every few milliseconds. The result is
+  written in the folded format that flamegraph.pl and speedscope read. The
+  thread only exists while a profile runs.
+- Task dump: every asyncio task with its current stack.
+
+Slow SQL statements are recorded by the connections in database.py. All of
+this is process-wide, so bots hosted together share it.
+"""
+
+import asyncio
+import io
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from typing import Dict, List, Optional, Tuple
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Frames where a thread sits idle; samples ending in them are not counted as work
+IDLE_FUNCTIONS = {'select', 'poll', 'epoll', 'wait', 'get', 'acquire', 'sleep', 'accept', 'recv'}
+
+
+class LoopLagMonitor:
+    """Measures how late the event loop wakes a sleeping task"""
+
+    def __init__(self, interval: Optional[float] = None, window: Optional[int] = None):
+        self.interval = interval if interval is not None else Config.LOOP_LAG_INTERVAL
+        window = window or Config.LOOP_LAG_WINDOW
+        # (unix time, lag seconds)
+        self.samples: deque = deque(maxlen=max(1, int(window / self.interval)) if self.interval else 1)
+        self._task: Optional[asyncio.Task] = None
+        # start() calls not yet matched by stop(): one per bot using the probe
+        self._users = 0
+
+    def start(self):
+        """Start probing in the running loop; bots sharing a process share one probe"""
+        self._users += 1
+        if self.interval > 0 and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        """Match one start(); the probe stops once every bot using it has stopped"""
+        self._users = max(0, self._users - 1)
+        if not self._users and self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - started - self.interval)
+            self.samples.append((time.time(), lag))
+            if lag * 1000 >= Config.LOOP_LAG_WARN_MS:
+                logger.warning("Event loop blocked for %.0fms", lag * 1000,
+                               extra={'duration_ms': round(lag * 1000, 2)})
+
+    def summary(self) -> Dict[str, float]:
+        """Lag in seconds: last probe, max over 1 and 5 minutes, p50/p99 over the window"""
+        if not self.samples:
+            return {}
+        now = time.time()
+        lags = sorted(lag for _, lag in self.samples)
+        return {
+            'last': self.samples[-1][1],
+            'max_1m': max((lag for when, lag in self.samples if now - when <= 60), default=0.0),
+            'max_5m': max((lag for when, lag in self.samples if now - when <= 300), default=0.0),
+            'p50': lags[len(lags) // 2],
+            'p99': lags[min(len(lags) - 1, int(len(lags) * 0.99))],
+            'probes': len(lags),
+        }
+
+
+class SamplingProfiler:
+    """Samples the stacks of every thread from a background thread"""
+
+    def __init__(self, interval_ms: Optional[float] = None):
+        self.interval = (interval_ms if interval_ms is not None else Config.PROFILE_INTERVAL_MS) / 1000
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    @property
+    def running(self) -> bool:
+        return self._lock.locked()
+
+    def stop(self):
+        """End a running profile early"""
+        self._stop.set()
+
+    async def profile(self, seconds: float) -> Tuple[Counter, int, int]:
+        """Sample for `seconds`; returns (folded stack counts, samples, event-loop thread id)
+
+        Raises RuntimeError if a profile is already running.
+        """
+        if not self._lock.acquire(blocking=False):
+            raise RuntimeError("a profile is already running")
+        self._stop.clear()
+        loop_thread = threading.get_ident()
+        try:
+            stacks, samples = await asyncio.to_thread(self._sample, seconds, loop_thread)
+        finally:
+            self._lock.release()
+        return stacks, samples, loop_thread
+
+    def _sample(self, seconds: float, loop_thread: int) -> Tuple[Counter, int]:
+        me = threading.get_ident()
+        stacks: Counter = Counter()
+        samples = 0
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline and not self._stop.is_set():
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                frames = []
+                while frame is not None:
+                    code = frame.f_code
+                    frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                thread = 'event-loop' if ident == loop_thread else names.get(ident, str(ident))
+                frames.append(thread)
+                stacks[';'.join(reversed(frames))] += 1
+            samples += 1
+            time.sleep(self.interval)
+        return stacks, samples
+
+
+def folded(stacks: Counter) -> bytes:
+    """Stacks in the folded format: 'root;caller;callee count' per line"""
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common()).encode()
+
+
+def hot_functions(stacks: Counter, thread: str = 'event-loop', limit: int = 10) -> Tuple[List[tuple], int, int]:
+    """Functions the thread was executing most often; returns ([(frame, samples)], busy, total)
+
+    Samples that end in an idle wait (selector, lock, queue) count towards
+    the total but not as busy time.
+    """
+    leaves: Counter = Counter()
+    busy = total = 0
+    for stack, count in stacks.items():
+        frames = stack.split(';')
+        if frames[0] != thread:
+            continue
+        total += count
+        leaf = frames[-1]
+        if leaf.split(' ', 1)[0] in IDLE_FUNCTIONS:
+            continue
+        busy += count
+        leaves[leaf] += count
+    return leaves.most_common(limit), busy, total
+
+
+def dump_tasks() -> Tuple[str, Counter]:
+    """Every asyncio task of the running loop with its stack; plus task counts by coroutine"""
+    tasks = sorted(asyncio.all_tasks(), key=lambda task: task.get_name())
+    counts: Counter = Counter()
+    out = io.StringIO()
+    for task in tasks:
+        coro = task.get_coro()
+        counts[getattr(coro, '__qualname__', repr(coro))] += 1
+        out.write(f"--- {task.get_name()}: {getattr(coro, '__qualname__', coro)}\n")
+        task.print_stack(file=out)
+        out.write("\n")
+    return out.getvalue(), counts
+
+
+loop_monitor = LoopLagMonitor()
+profiler = SamplingProfiler()
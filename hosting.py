@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Multi-bot hosting for Telegram Bot
+
+Several bot tokens (tenants) run in one process and event loop. They share
+the HTTP clients to the Bot API, the thumbnail worker processes and the
+backup verifier, so an extra bot costs its handlers and caches rather than
+a whole interpreter with its own connection pools and worker processes.
+Each tenant keeps its own SQLite files, backups, hand-off lock, send rate
+limit and API metrics under TENANTS_DIR/<bot id>/.
+"""
+
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
+
+from telegram.request import HTTPXRequest
+
+from config import Config
+from thumbnails import PREVIEWS_AVAILABLE
+from transfers import BackupVerifier
+
+logger = logging.getLogger(__name__)
+
+
+class SharedRequest(HTTPXRequest):
+    """An HTTPXRequest used by several bots; its client closes when the last bot shuts down"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._users = 0
+
+    async def initialize(self) -> None:
+        self._users += 1
+        if self._users == 1:
+            await super().initialize()
+
+    async def shutdown(self) -> None:
+        if self._users == 0:
+            return
+        self._users -= 1
+        if self._users == 0:
+            await super().shutdown()
+
+
+class Tenant:
+    """Where one hosted bot keeps its data"""
+
+    __slots__ = ('token', 'bot_id', 'directory')
+
+    def __init__(self, token: str, base_dir: Optional[str] = None):
+        self.token = token
+        self.bot_id = token.split(':', 1)[0]
+        self.directory = os.path.join(base_dir or tenants_dir(), self.bot_id)
+
+    @property
+    def db_path(self) -> str:
+        return os.path.join(self.directory, 'bot_database.db')
+
+    @property
+    def archive_path(self) -> str:
+        return os.path.join(self.directory, 'bot_database_archive.db')
+
+    @property
+    def backup_dir(self) -> str:
+        return os.path.join(self.directory, 'backups', 'files')
+
+    @property
+    def thumbnail_dir(self) -> str:
+        return os.path.join(self.directory, 'backups', 'thumbnails')
+
+
+class SharedResources:
+    """Clients and worker pools shared by the bots of one process"""
+
+    def __init__(self, tenants: int):
+        self.request = SharedRequest(
+            connection_pool_size=Config.API_CONNECTION_POOL_SIZE,
+            pool_timeout=Config.API_POOL_TIMEOUT
+        )
+        # Every bot keeps one getUpdates long poll open
+        self.updates_request = SharedRequest(connection_pool_size=tenants + 1)
+        self.verifier = BackupVerifier()
+        self.thumbnail_pool: Optional[ProcessPoolExecutor] = None
+        if PREVIEWS_AVAILABLE:
+            # Workers start on first use; spawn, as in ThumbnailWorker
+            self.thumbnail_pool = ProcessPoolExecutor(
+                Config.THUMBNAIL_WORKERS, mp_context=multiprocessing.get_context('spawn')
+            )
+
+    def shutdown(self):
+        self.verifier.shutdown()
+        if self.thumbnail_pool is not None:
+            self.thumbnail_pool.shutdown(wait=False, cancel_futures=True)
+            self.thumbnail_pool = None
+
+
+def tenants_dir() -> str:
+    return Config.TENANTS_DIR or os.path.join(os.path.dirname(os.path.abspath(Config.DATABASE_PATH)), 'tenants')
+
+
+def tenants_from_config() -> List[Tenant]:
+    """One tenant per token in TELEGRAM_BOT_TOKENS, in order, without duplicates"""
+    tenants = {}
+    for token in Config.BOT_TOKENS:
+        tenant = Tenant(token)
+        if tenant.bot_id in tenants:
+            logger.warning("Bot %s is listed more than once, hosting it once", tenant.bot_id)
+            continue
+        tenants[tenant.bot_id] = tenant
+    return list(tenants.values())
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Upload ingestion pipeline for Telegram Bot
+
+Albums (items sharing a media_group_id) and bursts of uploads from the same
+chat are collected for a short window and handed over as one batch, so they
+are stored in one transaction and answered with one summary message.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+BatchKey = Tuple[int, int, Optional[str]]
+
+
+def validate_upload(item: dict) -> Optional[str]:
+    """Check an upload against the configured limits; returns the rejection reason"""
+    if item['file_size'] and item['file_size'] > Config.MAX_FILE_SIZE:
+        return 'too_large'
+    if not item['file_type']:
+        return 'unknown_type'
+    if item['file_type'] not in Config.ALLOWED_FILE_TYPES:
+        return 'type_not_allowed'
+    return None
+
+
+class _Batch:
+    """Items collected for one (chat, user, media group) key"""
+
+    __slots__ = ('items', 'started', 'deadline', 'full', 'task')
+
+    def __init__(self, now: float):
+        self.items: List[dict] = []
+        self.started = now
+        self.deadline = now
+        self.full = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+
+
+class UploadBatcher:
+    """Collects uploads per chat and flushes them as batches
+
+    A batch is flushed once no new item arrived for `window` seconds, after
+    `max_wait` seconds at most, or as soon as it holds `max_items` items.
+    """
+
+    def __init__(self, flush: Callable[[BatchKey, List[dict]], Awaitable[None]],
+                 window: Optional[float] = None, max_wait: Optional[float] = None,
+                 max_items: Optional[int] = None):
+        self.flush = flush
+        self.window = window if window is not None else Config.UPLOAD_BATCH_WINDOW_MS / 1000
+        self.max_wait = max_wait if max_wait is not None else Config.UPLOAD_BATCH_MAX_WAIT_MS / 1000
+        self.max_items = max_items or Config.UPLOAD_BATCH_MAX_ITEMS
+        self._batches: Dict[BatchKey, _Batch] = {}
+        self._tasks = set()
+
+    def add(self, key: BatchKey, item: dict):
+        """Queue an upload; the batch flushes in the background"""
+        now = time.monotonic()
+        batch = self._batches.get(key)
+        if batch is None:
+            batch = self._batches[key] = _Batch(now)
+            batch.task = asyncio.create_task(self._wait_and_flush(key, batch))
+            self._tasks.add(batch.task)
+            batch.task.add_done_callback(self._tasks.discard)
+
+        batch.items.append(item)
+        batch.deadline = min(now + self.window, batch.started + self.max_wait)
+        if len(batch.items) >= self.max_items:
+            # Close the batch so later items start a new one
+            del self._batches[key]
+            batch.full.set()
+
+    async def _wait_and_flush(self, key: BatchKey, batch: _Batch):
+        """Sleep until the batch deadline stops moving or the batch is full, then flush it"""
+        while not batch.full.is_set():
+            remaining = batch.deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                await asyncio.wait_for(batch.full.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+
+        if self._batches.get(key) is batch:
+            del self._batches[key]
+        await self._run_flush(key, batch.items)
+
+    async def _run_flush(self, key: BatchKey, items: List[dict]):
+        try:
+            await self.flush(key, items)
+        except Exception as e:
+            logger.error("Error flushing upload batch for chat %s: %s", key[0], e)
+
+    async def flush_all(self):
+        """Flush every open batch now and wait for flushes already running"""
+        batches = list(self._batches.items())
+        self._batches.clear()
+        for key, batch in batches:
+            if batch.task is not None:
+                batch.task.cancel()
+            await self._run_flush(key, batch.items)
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    @property
+    def pending(self) -> int:
+        """Number of uploads waiting in open batches"""
+        return sum(len(batch.items) for batch in self._batches.values())
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Inline mode for Telegram Bot: share stored files from any chat
+"""
+
+import asyncio
+import bisect
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from telegram import InlineQueryResultCachedDocument, InlineQueryResultCachedPhoto
+
+from config import Config
+from database import iter_rows, open_connection
+from search import TERM_PATTERN, normalize
+
+
+class UserPrefixIndex:
+    """Sorted token list for one user's files, searched by prefix with bisect"""
+
+    __slots__ = ('tokens', 'files')
+
+    def __init__(self):
+        self.tokens: List[Tuple[str, int]] = []
+        self.files: Dict[int, dict] = {}
+
+    @staticmethod
+    def tokenize(file: dict) -> Set[str]:
+        return set(TERM_PATTERN.findall(normalize(file['file_name'] or '')))
+
+    def load(self, files: Iterable[dict]):
+        """Index many files at once, sorting the tokens once at the end"""
+        for file in files:
+            file_id = file['file_id']
+            if file_id in self.files:
+                continue
+            self.files[file_id] = file
+            self.tokens.extend((token, file_id) for token in self.tokenize(file))
+        self.tokens.sort()
+
+    def add(self, file: dict):
+        """Index one file"""
+        file_id = file['file_id']
+        if file_id in self.files:
+            return
+        self.files[file_id] = file
+        for token in self.tokenize(file):
+            bisect.insort(self.tokens, (token, file_id))
+
+    def lookup(self, terms: List[str]) -> List[dict]:
+        """Files whose name has a word starting with every term, newest first"""
+        if not terms:
+            matches = set(self.files)
+        else:
+            matches = None
+            for term in terms:
+                found = set()
+                position = bisect.bisect_left(self.tokens, (term, -1))
+                while position < len(self.tokens) and self.tokens[position][0].startswith(term):
+                    found.add(self.tokens[position][1])
+                    position += 1
+                matches = found if matches is None else matches & found
+                if not matches:
+                    return []
+        return [self.files[file_id] for file_id in sorted(matches, reverse=True)]
+
+
+class InlineFileIndex:
+    """In-memory per-user prefix indexes, loaded on demand and kept LRU-bounded
+
+    A cold index is built in a worker thread, since a large library takes
+    long enough to stall the event loop. Files added while it is being built
+    are applied once it is ready.
+    """
+
+    def __init__(self, db_path: str, max_users: Optional[int] = None):
+        self.db_path = db_path
+        self.max_users = max_users or Config.INLINE_INDEX_MAX_USERS
+        self._indexes: 'OrderedDict[int, UserPrefixIndex]' = OrderedDict()
+        self._loading: Dict[int, asyncio.Future] = {}
+        # Files stored during a build; dropped by invalidate() so a stale build is not kept
+        self._pending: Dict[int, List[dict]] = {}
+
+    async def get(self, user_id: int) -> UserPrefixIndex:
+        """Get a user's index, loading it from the database if needed"""
+        index = self._indexes.get(user_id)
+        if index is not None:
+            self._indexes.move_to_end(user_id)
+            return index
+
+        loading = self._loading.get(user_id)
+        if loading is None:
+            self._pending[user_id] = []
+            loading = self._loading[user_id] = asyncio.ensure_future(self._load(user_id))
+        # Another query waiting on the same build must not cancel it
+        return await asyncio.shield(loading)
+
+    async def _load(self, user_id: int) -> UserPrefixIndex:
+        try:
+            index = await asyncio.to_thread(self.build, user_id)
+        except BaseException:
+            self._pending.pop(user_id, None)
+            raise
+        finally:
+            del self._loading[user_id]
+        pending = self._pending.pop(user_id, None)
+        if pending is None:
+            # Invalidated meanwhile: answer this query, rebuild for the next one
+            return index
+        for file in pending:
+            index.add(file)
+
+        self._indexes[user_id] = index
+        if len(self._indexes) > self.max_users:
+            self._indexes.popitem(last=False)
+        return index
+
+    def build(self, user_id: int) -> UserPrefixIndex:
+        """Build a user's index from the database"""
+        index = UserPrefixIndex()
+        conn = open_connection(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT file_id, file_name, file_type, telegram_file_id, media_kind
+            FROM files WHERE user_id = ?
+        ''', (user_id,))
+        # Compact rows: indexes of many users stay in memory
+        index.load(iter_rows(cursor))
+        conn.close()
+        return index
+
+    def add(self, user_id: int, file: dict):
+        """Add a newly stored file if the user's index is loaded or being built"""
+        index = self._indexes.get(user_id)
+        if index is not None:
+            index.add(file)
+        elif user_id in self._pending:
+            self._pending[user_id].append(file)
+
+    def invalidate(self, user_id: Optional[int] = None):
+        """Drop one user's index, or all of them; it is rebuilt on the next query"""
+        if user_id is None:
+            self._indexes.clear()
+            self._pending.clear()
+        else:
+            self._indexes.pop(user_id, None)
+            self._pending.pop(user_id, None)
+
+
+class InlineQueryResponder:
+    """Answers inline queries from the prefix index with per-user debouncing"""
+
+    def __init__(self, index: InlineFileIndex):
+        self.index = index
+        self.debounce = Config.INLINE_DEBOUNCE_MS / 1000
+        self._latest: Dict[int, str] = {}
+
+    async def debounced(self, user_id: int, query_id: str) -> bool:
+        """Wait out the debounce window; False if a newer query from the user arrived"""
+        self._latest[user_id] = query_id
+        if self.debounce > 0:
+            await asyncio.sleep(self.debounce)
+        if self._latest.get(user_id) != query_id:
+            return False
+        del self._latest[user_id]
+        return True
+
+    async def results(self, user_id: int, text: str, offset: int) -> Tuple[list, str]:
+        """Build one page of inline results and the next offset"""
+        terms = TERM_PATTERN.findall(normalize(text))
+        files = (await self.index.get(user_id)).lookup(terms)
+        limit = Config.INLINE_RESULTS_LIMIT
+        page = files[offset:offset + limit]
+
+        results = []
+        for file in page:
+            if file['media_kind'] == 'photo':
+                results.append(InlineQueryResultCachedPhoto(
+                    id=str(file['file_id']),
+                    photo_file_id=file['telegram_file_id'],
+                    title=file['file_name']
+                ))
+            else:
+                results.append(InlineQueryResultCachedDocument(
+                    id=str(file['file_id']),
+                    title=file['file_name'] or str(file['file_id']),
+                    document_file_id=file['telegram_file_id'],
+                    description=file['file_type']
+                ))
+
+        next_offset = str(offset + limit) if len(files) > offset + limit else ""
+        return results, next_offset
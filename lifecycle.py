@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Graceful shutdown and polling hand-off for Telegram Bot
+
+Shutdown stops fetching updates first, then gives running handlers, bulk
+jobs, upload batches and queued sends until a deadline to finish. Whatever
+still runs at the deadline is cancelled; unfinished bulk jobs are saved and
+resume on the next start.
+
+Only one process may poll a bot token. The polling process holds an
+exclusive lock on a file next to the database. An instance started with
+--handoff initializes first, then asks the polling one to let go and takes
+the lock the moment it is released - while the old process is still
+draining - so updates go unanswered only for about one getUpdates round
+trip during a deploy. The old process exits once drained.
+"""
+
+import asyncio
+import fcntl
+import functools
+import logging
+import os
+import socket
+import time
+from typing import Optional, Set
+
+from structured_logging import update_fields
+
+logger = logging.getLogger(__name__)
+
+
+class HandlerTracker:
+    """Runs handler callbacks as tracked tasks so shutdown can wait for or cancel them
+
+    PTB processes updates inside its fetcher task, which must not be
+    cancelled; running each callback in its own task lets shutdown cancel
+    a stuck handler while the fetcher carries on.
+    """
+
+    def __init__(self):
+        self.in_flight: Set[asyncio.Task] = set()
+        self.closed = False
+        self._last_dropped = None
+
+    def wrap(self, callback):
+        @functools.wraps(callback)
+        async def wrapper(update, context):
+            if self.closed:
+                # Logged once, not for every handler the update would reach
+                if update is not self._last_dropped:
+                    self._last_dropped = update
+                    logger.warning("Dropping update not handled before the shutdown deadline",
+                                   extra=update_fields(update))
+                return None
+
+            task = asyncio.create_task(callback(update, context), name=f"handler:{callback.__name__}")
+            self.in_flight.add(task)
+            task.add_done_callback(self.in_flight.discard)
+            try:
+                return await task
+            except asyncio.CancelledError:
+                if asyncio.current_task().cancelling():
+                    raise
+                # Cancelled by cancel_all: the update counts as handled
+                logger.warning("Handler cancelled at the shutdown deadline", extra=update_fields(update))
+                return None
+
+        return wrapper
+
+    def cancel_all(self) -> int:
+        """Stop accepting updates and cancel the handlers still running"""
+        self.closed = True
+        for task in self.in_flight:
+            task.cancel()
+        return len(self.in_flight)
+
+
+class FileLock:
+    """Exclusive lock on a file, released on release() or when the process exits"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fd: Optional[int] = None
+
+    @property
+    def held(self) -> bool:
+        return self._fd is not None
+
+    def try_acquire(self) -> bool:
+        if self._fd is not None:
+            return True
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        self._fd = fd
+        return True
+
+    async def acquire(self, timeout: float, interval: float = 0.05) -> bool:
+        """Wait for the lock; False if it was not released within `timeout` seconds"""
+        deadline = time.monotonic() + timeout
+        while not self.try_acquire():
+            if time.monotonic() >= deadline:
+                return False
+            await asyncio.sleep(interval)
+        return True
+
+    def release(self):
+        if self._fd is None:
+            return
+        fcntl.flock(self._fd, fcntl.LOCK_UN)
+        os.close(self._fd)
+        self._fd = None
+
+
+class HandOff:
+    """Locks and request file coordinating the instances sharing a database
+
+    `polling` is held while an instance polls. `jobs` is held from the time
+    an instance resumes saved bulk jobs until it has saved its own
+    unfinished ones, so a successor resumes only after its predecessor has
+    saved everything.
+    """
+
+    def __init__(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        self.polling = FileLock(os.path.join(directory, 'polling.lock'))
+        self.jobs = FileLock(os.path.join(directory, 'jobs.lock'))
+        self.request_path = os.path.join(directory, 'polling.handoff')
+        self.token = f"{socket.gethostname()}:{os.getpid()}"
+
+    def request(self):
+        """Ask the polling instance to stop polling"""
+        with open(self.request_path, 'w') as f:
+            f.write(self.token)
+
+    def requested(self) -> bool:
+        """Whether another instance asked this one to stop polling"""
+        try:
+            with open(self.request_path) as f:
+                requester = f.read().strip()
+        except FileNotFoundError:
+            return False
+        return bool(requester) and requester != self.token
+
+    def clear_request(self):
+        try:
+            os.remove(self.request_path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Outbound Telegram API client for Telegram Bot
+
+Every send goes through per-chat ordered queues with automatic retry:
+RetryAfter waits the time Telegram asks for, network errors back off
+exponentially with jitter. A timed-out request may still have reached
+Telegram, so only idempotent methods are repeated after a timeout, unless
+it happened before anything was sent. Pending edits of the same message are coalesced
+so only the latest text is sent. Latency is recorded per API method. An
+optional rate limit spaces all calls of one bot evenly.
+"""
+
+import asyncio
+import logging
+import random
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import httpx
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TimedOut
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, float('inf'))
+
+# Methods that have the same effect when repeated; a repeated send would post twice
+IDEMPOTENT_METHODS = frozenset({
+    'get_file', 'get_me', 'get_chat', 'edit_message_text', 'edit_message_reply_markup',
+    'answer_callback_query', 'answer_inline_query', 'delete_message',
+})
+
+
+def retry_is_safe(method: str, error: NetworkError) -> bool:
+    """Whether a call that failed with `error` can be repeated without doing it twice"""
+    if not isinstance(error, TimedOut) or method in IDEMPOTENT_METHODS:
+        return True
+    # Timed out connecting or waiting for a pooled connection: the request was never sent
+    return isinstance(error.__cause__, (httpx.ConnectTimeout, httpx.PoolTimeout))
+
+
+class ApiMetrics:
+    """Call counts, errors, retries and latency per API method"""
+
+    def __init__(self):
+        self.methods: Dict[str, dict] = {}
+
+    def _method(self, method: str) -> dict:
+        stats = self.methods.get(method)
+        if stats is None:
+            stats = self.methods[method] = {
+                'calls': 0,
+                'errors': 0,
+                'retries': 0,
+                'coalesced': 0,
+                'total_time': 0.0,
+                'max_time': 0.0,
+                'buckets': [0] * len(LATENCY_BUCKETS),
+            }
+        return stats
+
+    def observe(self, method: str, seconds: float, error: bool = False):
+        """Record one API round trip"""
+        stats = self._method(method)
+        stats['calls'] += 1
+        stats['total_time'] += seconds
+        stats['max_time'] = max(stats['max_time'], seconds)
+        if error:
+            stats['errors'] += 1
+        for index, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                stats['buckets'][index] += 1
+                break
+
+    def retried(self, method: str):
+        self._method(method)['retries'] += 1
+
+    def coalesced(self, method: str):
+        self._method(method)['coalesced'] += 1
+
+    def percentile(self, method: str, fraction: float) -> float:
+        """Approximate latency percentile from the histogram (bucket upper bound)"""
+        stats = self.methods.get(method)
+        if not stats or not stats['calls']:
+            return 0.0
+        target = stats['calls'] * fraction
+        seen = 0
+        for index, count in enumerate(stats['buckets']):
+            seen += count
+            if seen >= target:
+                bound = LATENCY_BUCKETS[index]
+                return stats['max_time'] if bound == float('inf') else bound
+        return stats['max_time']
+
+    def snapshot(self) -> Dict[str, dict]:
+        """Summary per method: calls, errors, retries, coalesced, avg/p95/max seconds"""
+        return {
+            method: {
+                'calls': stats['calls'],
+                'errors': stats['errors'],
+                'retries': stats['retries'],
+                'coalesced': stats['coalesced'],
+                'avg': stats['total_time'] / stats['calls'] if stats['calls'] else 0.0,
+                'p95': self.percentile(method, 0.95),
+                'max': stats['max_time'],
+            }
+            for method, stats in self.methods.items()
+        }
+
+
+def _consume_exception(future: asyncio.Future):
+    if not future.cancelled():
+        future.exception()
+
+
+class _RateLimit:
+    """Spaces calls to at most `rate` per second; 0 means no limit"""
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate if rate > 0 else 0.0
+        self._next = 0.0
+
+    async def wait(self):
+        if not self.interval:
+            return
+        now = time.monotonic()
+        start = max(now, self._next)
+        self._next = start + self.interval
+        if start > now:
+            await asyncio.sleep(start - now)
+
+
+class _Request:
+    """One queued API call"""
+
+    __slots__ = ('method', 'kwargs', 'future', 'coalesce_key')
+
+    def __init__(self, method: str, kwargs: dict, future: asyncio.Future, coalesce_key=None):
+        self.method = method
+        self.kwargs = kwargs
+        self.future = future
+        self.coalesce_key = coalesce_key
+
+
+class OutboundClient:
+    """Sends Bot API requests through per-chat ordered queues with retries"""
+
+    def __init__(self, bot, max_retries: Optional[int] = None,
+                 base_delay: Optional[float] = None, max_delay: Optional[float] = None,
+                 rate_limit: Optional[float] = None):
+        self.bot = bot
+        self.max_retries = max_retries if max_retries is not None else Config.SEND_MAX_RETRIES
+        self.base_delay = base_delay if base_delay is not None else Config.SEND_RETRY_BASE_DELAY
+        self.max_delay = max_delay if max_delay is not None else Config.SEND_RETRY_MAX_DELAY
+        self.metrics = ApiMetrics()
+        self._rate_limit = _RateLimit(rate_limit if rate_limit is not None else Config.API_RATE_LIMIT)
+        self._queues: Dict[Any, asyncio.Queue] = {}
+        self._workers: Dict[Any, asyncio.Task] = {}
+        self._pending_edits: Dict[Tuple[Any, int], _Request] = {}
+
+    # Public API
+
+    async def send_message(self, chat_id, text: str, **kwargs):
+        """Send a text message in chat order"""
+        return await self.enqueue(chat_id, 'send_message', chat_id=chat_id, text=text, **kwargs)
+
+    async def send_document(self, chat_id, document, **kwargs):
+        """Send a document in chat order"""
+        return await self.enqueue(chat_id, 'send_document', chat_id=chat_id, document=document, **kwargs)
+
+    async def send_photo(self, chat_id, photo, **kwargs):
+        """Send a photo in chat order"""
+        return await self.enqueue(chat_id, 'send_photo', chat_id=chat_id, photo=photo, **kwargs)
+
+    async def send_media_group(self, chat_id, media, **kwargs):
+        """Send an album in chat order"""
+        return await self.enqueue(chat_id, 'send_media_group', chat_id=chat_id, media=media, **kwargs)
+
+    async def edit_message_text(self, chat_id, message_id: int, text: str, **kwargs):
+        """Edit a message; a still-pending edit of the same message is replaced"""
+        return await asyncio.shield(self._submit_edit(chat_id, message_id, text, kwargs))
+
+    def schedule_edit(self, chat_id, message_id: int, text: str, **kwargs):
+        """Queue an edit without waiting for it, e.g. for progress updates"""
+        self._submit_edit(chat_id, message_id, text, kwargs)
+
+    async def answer_callback_query(self, callback_query_id: str, text: Optional[str] = None, **kwargs):
+        """Answer a callback query directly; answers are not ordered with messages"""
+        return await self.call('answer_callback_query', callback_query_id=callback_query_id, text=text, **kwargs)
+
+    async def enqueue(self, queue_key, method: str, **kwargs):
+        """Queue an API call behind earlier calls to the same chat and wait for its result"""
+        return await asyncio.shield(self._submit(queue_key, method, kwargs))
+
+    async def call(self, method: str, **kwargs):
+        """Call an API method now, retrying on flood control and network errors
+
+        A send that timed out after the request went out is not repeated;
+        the caller gets the TimedOut.
+        """
+        attempt = 0
+        while True:
+            await self._rate_limit.wait()
+            started = time.monotonic()
+            try:
+                result = await getattr(self.bot, method)(**kwargs)
+            except RetryAfter as e:
+                self.metrics.observe(method, time.monotonic() - started, error=True)
+                if attempt >= self.max_retries:
+                    raise
+                delay = e.retry_after + random.uniform(0, self.base_delay)
+            except (BadRequest, Forbidden):
+                self.metrics.observe(method, time.monotonic() - started, error=True)
+                raise
+            except NetworkError as e:
+                self.metrics.observe(method, time.monotonic() - started, error=True)
+                if attempt >= self.max_retries or not retry_is_safe(method, e):
+                    raise
+                delay = min(self.max_delay, self.base_delay * 2 ** attempt) * random.uniform(0.5, 1.5)
+            else:
+                self.metrics.observe(method, time.monotonic() - started)
+                return result
+
+            attempt += 1
+            self.metrics.retried(method)
+            logger.warning("Retrying %s in %.2fs (attempt %d)", method, delay, attempt)
+            await asyncio.sleep(delay)
+
+    async def drain(self, timeout: Optional[float] = None) -> bool:
+        """Wait until every queued call was sent; False if the timeout expired first"""
+        workers = list(self._workers.values())
+        if not workers:
+            return True
+        done, pending = await asyncio.wait(workers, timeout=timeout)
+        return not pending
+
+    @property
+    def queued(self) -> int:
+        """Number of calls waiting in chat queues"""
+        return sum(queue.qsize() for queue in self._queues.values())
+
+    # Internals
+
+    def _submit(self, chat_id, method: str, kwargs: dict, coalesce_key=None) -> asyncio.Future:
+        """Put a request on its chat queue, starting the chat worker if needed"""
+        future = asyncio.get_running_loop().create_future()
+        # Callers may be gone (cancelled) by the time a failure is known
+        future.add_done_callback(_consume_exception)
+        request = _Request(method, kwargs, future, coalesce_key)
+        if coalesce_key is not None:
+            self._pending_edits[coalesce_key] = request
+
+        queue = self._queues.get(chat_id)
+        if queue is None:
+            queue = self._queues[chat_id] = asyncio.Queue()
+        queue.put_nowait(request)
+        if chat_id not in self._workers:
+            self._workers[chat_id] = asyncio.create_task(self._drain(chat_id, queue))
+        return future
+
+    def _submit_edit(self, chat_id, message_id: int, text: str, kwargs: dict) -> asyncio.Future:
+        """Queue an edit, or replace the text of an edit of the same message still waiting"""
+        key = (chat_id, message_id)
+        kwargs.update(chat_id=chat_id, message_id=message_id, text=text)
+        pending = self._pending_edits.get(key)
+        if pending is not None:
+            pending.kwargs = kwargs
+            self.metrics.coalesced('edit_message_text')
+            return pending.future
+        return self._submit(chat_id, 'edit_message_text', kwargs, coalesce_key=key)
+
+    async def _drain(self, chat_id, queue: asyncio.Queue):
+        """Worker for one chat: send queued calls in order, exit when idle"""
+        try:
+            while not queue.empty():
+                request = queue.get_nowait()
+                if request.coalesce_key is not None:
+                    # From here on a new edit must be queued, not merged into this one
+                    self._pending_edits.pop(request.coalesce_key, None)
+                try:
+                    result = await self.call(request.method, **request.kwargs)
+                except Exception as e:
+                    if not request.future.done():
+                        request.future.set_exception(e)
+                else:
+                    if not request.future.done():
+                        request.future.set_result(result)
+        finally:
+            del self._workers[chat_id]
+            if queue.empty():
+                self._queues.pop(chat_id, None)
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Per-user storage quotas for Telegram Bot
+
+Each user's stored bytes and file count live in `storage_usage` and are
+updated in the same transaction as the file rows they count, so checking
+an upload is one primary-key lookup rather than a sum over the user's
+files. Usage covers hot and archived files alike: archiving moves a row
+without touching usage, deleting it gives the space back. This is why the
+accounting is done by the code that inserts and deletes files instead of
+by triggers - archiving deletes from the hot table too.
+
+Limits come from QUOTA_MAX_MB and QUOTA_MAX_FILES unless an admin set an
+override for the user; 0 means unlimited.
+"""
+
+import logging
+import sqlite3
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from config import Config
+from database import open_connection
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS storage_usage (
+        user_id INTEGER PRIMARY KEY,
+        bytes INTEGER NOT NULL DEFAULT 0,
+        files INTEGER NOT NULL DEFAULT 0,
+        max_bytes INTEGER,
+        max_files INTEGER
+    )
+'''
+
+
+def release_usage(cursor: sqlite3.Cursor, rows: Iterable[tuple]):
+    """Give back the space of deleted files, given as (user_id, file_size) rows
+
+    Call with the cursor that deleted them, before committing.
+    """
+    freed: Dict[int, List[int]] = {}
+    for user_id, file_size in rows:
+        usage = freed.setdefault(user_id, [0, 0])
+        usage[0] += file_size or 0
+        usage[1] += 1
+    cursor.executemany('''
+        UPDATE storage_usage SET bytes = MAX(0, bytes - ?), files = MAX(0, files - ?)
+        WHERE user_id = ?
+    ''', [(size, count, user_id) for user_id, (size, count) in freed.items()])
+
+
+class Quota:
+    """A user's usage and effective limits; a limit of 0 is unlimited"""
+
+    __slots__ = ('user_id', 'bytes', 'files', 'max_bytes', 'max_files', 'overridden')
+
+    def __init__(self, user_id: int, row: Optional[tuple]):
+        used_bytes, used_files, max_bytes, max_files = row or (0, 0, None, None)
+        self.user_id = user_id
+        self.bytes = used_bytes
+        self.files = used_files
+        self.overridden = max_bytes is not None or max_files is not None
+        self.max_bytes = max_bytes if max_bytes is not None else Config.QUOTA_MAX_MB * 1024 * 1024
+        self.max_files = max_files if max_files is not None else Config.QUOTA_MAX_FILES
+
+    def fits(self, size: int) -> bool:
+        """Whether one more file of `size` bytes stays within the limits"""
+        if self.max_bytes and self.bytes + size > self.max_bytes:
+            return False
+        return not self.max_files or self.files + 1 <= self.max_files
+
+
+class QuotaManager:
+    """Reads, reserves and overrides per-user storage quotas"""
+
+    def __init__(self, archive):
+        # ArchiveManager; recounting reads hot and archived files
+        self.archive = archive
+        self.db_path = archive.db_path
+
+    @staticmethod
+    def init_schema(cursor: sqlite3.Cursor) -> bool:
+        """Create the usage table; True if it was missing and usage needs a recount"""
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'storage_usage'")
+        if cursor.fetchone():
+            return False
+        cursor.execute(SCHEMA)
+        return True
+
+    @staticmethod
+    def _read(cursor: sqlite3.Cursor, user_id: int) -> Quota:
+        cursor.execute('SELECT bytes, files, max_bytes, max_files FROM storage_usage WHERE user_id = ?',
+                       (user_id,))
+        return Quota(user_id, cursor.fetchone())
+
+    def get(self, user_id: int) -> Quota:
+        conn = open_connection(self.db_path)
+        quota = self._read(conn.cursor(), user_id)
+        conn.close()
+        return quota
+
+    def reserve(self, cursor: sqlite3.Cursor, user_id: int, items: List[dict]) -> Tuple[List[dict], List[dict]]:
+        """Count the items that fit the user's quota as used; returns (fitting, refused)
+
+        Call inside the transaction that inserts the fitting items.
+        """
+        quota = self._read(cursor, user_id)
+        fitting, refused = [], []
+        added = 0
+        for item in items:
+            size = item['file_size'] or 0
+            if not quota.fits(size):
+                refused.append(item)
+                continue
+            quota.bytes += size
+            quota.files += 1
+            added += size
+            fitting.append(item)
+
+        if fitting:
+            cursor.execute('''
+                INSERT INTO storage_usage (user_id, bytes, files) VALUES (?, ?, ?)
+                ON CONFLICT (user_id) DO UPDATE SET bytes = bytes + excluded.bytes, files = files + excluded.files
+            ''', (user_id, added, len(fitting)))
+        return fitting, refused
+
+    def set_limits(self, user_id: int, max_bytes: Optional[int], max_files: Optional[int]):
+        """Override a user's limits; None goes back to the configured default"""
+        conn = open_connection(self.db_path)
+        conn.execute('''
+            INSERT INTO storage_usage (user_id, max_bytes, max_files) VALUES (?, ?, ?)
+            ON CONFLICT (user_id) DO UPDATE SET max_bytes = excluded.max_bytes, max_files = excluded.max_files
+        ''', (user_id, max_bytes, max_files))
+        conn.commit()
+        conn.close()
+
+    def largest(self, limit: int) -> List[Quota]:
+        """Users using the most space"""
+        conn = open_connection(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT user_id, bytes, files, max_bytes, max_files FROM storage_usage
+            ORDER BY bytes DESC LIMIT ?
+        ''', (limit,))
+        quotas = [Quota(row[0], row[1:]) for row in cursor.fetchall()]
+        conn.close()
+        return quotas
+
+    def recount(self) -> int:
+        """Rebuild every user's usage from the hot and archived files; returns the number of users"""
+        conn = self.archive.connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            cursor.execute('UPDATE main.storage_usage SET bytes = 0, files = 0')
+            # A file left in both tables by an interrupted archive run counts once
+            cursor.execute('''
+                INSERT INTO main.storage_usage (user_id, bytes, files)
+                SELECT user_id, SUM(COALESCE(file_size, 0)), COUNT(*) FROM (
+                    SELECT file_id, user_id, file_size FROM main.files
+                    UNION
+                    SELECT file_id, user_id, file_size FROM archive.files
+                ) WHERE user_id IS NOT NULL GROUP BY user_id
+                ON CONFLICT (user_id) DO UPDATE SET bytes = excluded.bytes, files = excluded.files
+            ''')
+            users = cursor.rowcount
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+        logger.info("Recounted storage usage of %s users", users)
+        return users
@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Data retention and archival for Telegram Bot
+
+Rows older than the configured retention move from the hot `files` and
+`poll_responses` tables to tables of the same name in an archive database
+attached as `archive`. They move in small batches so the write lock is only
+held briefly. File listings page through the hot table first and continue
+in the archive, so archived files stay reachable.
+"""
+
+import asyncio
+import logging
+import os
+import sqlite3
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from config import Config
+from database import Row, fetch_row, fetch_rows, open_connection
+from quotas import release_usage
+
+logger = logging.getLogger(__name__)
+
+# Archived tables: primary key and the timestamp the retention applies to
+POLICIES = {
+    'files': ('file_id', 'upload_date'),
+    'poll_responses': ('response_id', 'response_date'),
+}
+
+HOT_INDEXES = [
+    'CREATE INDEX IF NOT EXISTS idx_files_upload_date ON files (upload_date)',
+    'CREATE INDEX IF NOT EXISTS idx_poll_responses_date ON poll_responses (response_date)',
+]
+
+ARCHIVE_INDEXES = [
+    'CREATE INDEX IF NOT EXISTS archive.idx_archive_files_user ON files (user_id, upload_date)',
+    'CREATE INDEX IF NOT EXISTS archive.idx_archive_files_date ON files (upload_date)',
+    'CREATE INDEX IF NOT EXISTS archive.idx_archive_responses_poll ON poll_responses (poll_id)',
+]
+
+
+def retention_days() -> Dict[str, int]:
+    """Configured retention per table; 0 keeps rows in the hot table forever"""
+    return {
+        'files': Config.FILES_RETENTION_DAYS,
+        'poll_responses': Config.POLL_RESPONSES_RETENTION_DAYS,
+    }
+
+
+class ArchiveManager:
+    """Moves old rows to the archive database and reads across both"""
+
+    def __init__(self, db_path: Optional[str] = None, archive_path: Optional[str] = None):
+        self.db_path = db_path or Config.DATABASE_PATH
+        if not archive_path:
+            root, ext = os.path.splitext(self.db_path)
+            archive_path = Config.ARCHIVE_DATABASE_PATH or f"{root}_archive{ext or '.db'}"
+        self.archive_path = archive_path
+        self._columns: Dict[str, List[str]] = {}
+
+    def connect(self) -> sqlite3.Connection:
+        """Open the hot database with the archive attached"""
+        conn = open_connection(self.db_path)
+        conn.execute('ATTACH DATABASE ? AS archive', (self.archive_path,))
+        return conn
+
+    def init_schema(self):
+        """Create date indexes on the hot tables and mirror their columns in the archive"""
+        conn = self.connect()
+        cursor = conn.cursor()
+        for statement in HOT_INDEXES:
+            cursor.execute(statement)
+
+        for table, (key, _) in POLICIES.items():
+            cursor.execute(f'PRAGMA main.table_info({table})')
+            columns = [(row[1], row[2]) for row in cursor.fetchall()]
+            cursor.execute(f'PRAGMA archive.table_info({table})')
+            archived = {row[1] for row in cursor.fetchall()}
+
+            if not archived:
+                definitions = ", ".join(
+                    f"{name} INTEGER PRIMARY KEY" if name == key else f"{name} {kind}"
+                    for name, kind in columns
+                )
+                cursor.execute(f'''
+                    CREATE TABLE archive.{table} (
+                        {definitions},
+                        archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    )
+                ''')
+            else:
+                # Columns added to the hot table by later migrations
+                for name, kind in columns:
+                    if name not in archived:
+                        cursor.execute(f'ALTER TABLE archive.{table} ADD COLUMN {name} {kind}')
+
+            self._columns[table] = [name for name, _ in columns]
+
+        for statement in ARCHIVE_INDEXES:
+            cursor.execute(statement)
+
+        conn.commit()
+        conn.close()
+
+    # Archiving
+
+    def archive_batch(self, table: str, days: int, batch_size: Optional[int] = None) -> int:
+        """Move up to `batch_size` rows older than `days` days; returns how many moved"""
+        key, date_column = POLICIES[table]
+        batch_size = batch_size or Config.ARCHIVE_BATCH_SIZE
+        if table not in self._columns:
+            self.init_schema()
+        columns = ", ".join(self._columns[table])
+
+        conn = self.connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(f'''
+                SELECT {key} FROM main.{table}
+                WHERE {date_column} < datetime('now', ?)
+                ORDER BY {date_column}
+                LIMIT ?
+            ''', (f'-{days} days', batch_size))
+            ids = [row[0] for row in cursor.fetchall()]
+            if not ids:
+                return 0
+
+            placeholders = ", ".join("?" * len(ids))
+            # Copy and delete in one transaction. In WAL mode a crash can still
+            # leave a copy without the delete; OR REPLACE makes the retry harmless.
+            cursor.execute('BEGIN IMMEDIATE')
+            cursor.execute(f'''
+                INSERT OR REPLACE INTO archive.{table} ({columns})
+                SELECT {columns} FROM main.{table} WHERE {key} IN ({placeholders})
+            ''', ids)
+            cursor.execute(f'DELETE FROM main.{table} WHERE {key} IN ({placeholders})', ids)
+            conn.commit()
+            return len(ids)
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    async def run_once(self) -> Dict[str, int]:
+        """Archive everything past retention, one batch at a time in a worker thread
+
+        Pauses between batches so interactive writes get the lock in between.
+        Returns the number of rows moved per table.
+        """
+        moved = {}
+        pause = Config.ARCHIVE_BATCH_PAUSE_MS / 1000
+        for table, days in retention_days().items():
+            if days <= 0:
+                continue
+            total = 0
+            while True:
+                count = await asyncio.to_thread(self.archive_batch, table, days)
+                total += count
+                if count < Config.ARCHIVE_BATCH_SIZE:
+                    break
+                await asyncio.sleep(pause)
+            if total:
+                logger.info("Archived %d rows from %s", total, table)
+            moved[table] = total
+        return moved
+
+    # Reading across hot and archived rows
+
+    def list_files(self, limit: int, offset: int = 0, user_id: Optional[int] = None,
+                   photos_only: bool = False) -> Tuple[List[Row], bool]:
+        """One page of files, newest first, continuing into the archive past the hot rows
+
+        Archived files are always older than hot ones, so the archive simply
+        follows the hot table. `photos_only` keeps Telegram photos and images
+        with a generated thumbnail. Returns the page and whether another page follows.
+        """
+        conditions, params = [], ()
+        if user_id is not None:
+            conditions.append('user_id = ?')
+            params = (user_id,)
+        if photos_only:
+            conditions.append("(media_kind = 'photo' OR thumbnail_path != '')")
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        conn = self.connect()
+        cursor = conn.cursor()
+
+        cursor.execute(f'''
+            SELECT *, 0 AS archived FROM main.files {where}
+            ORDER BY upload_date DESC, file_id DESC LIMIT ? OFFSET ?
+        ''', params + (limit + 1, offset))
+        files = fetch_rows(cursor)
+
+        if len(files) <= limit:
+            # The hot rows end on this page; the rest comes from the archive
+            if files:
+                hot_count = offset + len(files)
+            else:
+                cursor.execute(f'SELECT COUNT(*) FROM main.files {where}', params)
+                hot_count = cursor.fetchone()[0]
+            cursor.execute(f'''
+                SELECT *, 1 AS archived FROM archive.files {where}
+                ORDER BY upload_date DESC, file_id DESC LIMIT ? OFFSET ?
+            ''', params + (limit + 1 - len(files), max(0, offset - hot_count)))
+            files.extend(fetch_rows(cursor))
+
+        conn.close()
+        return files[:limit], len(files) > limit
+
+    def get_user_file(self, user_id: int, file_id: str) -> Optional[Row]:
+        """Find one of the user's archived files by database ID or Telegram file ID"""
+        conn = self.connect()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT *, 1 AS archived FROM archive.files
+            WHERE user_id = ? AND (file_id = ? OR telegram_file_id = ?)
+        ''', (user_id, file_id, file_id))
+        file = fetch_row(cursor)
+        conn.close()
+        return file
+
+    def record_backup(self, file_id: int, backup_path: str, size: int, checksum: str):
+        """Store a finished backup on the file's row, hot or archived"""
+        conn = self.connect()
+        values = (backup_path, datetime.now().isoformat(), size, checksum, file_id)
+        # A file left in both tables by an interrupted archive run gets it in both
+        for table in ('main.files', 'archive.files'):
+            conn.execute(f'''
+                UPDATE {table} SET backup_path = ?, backup_date = ?, backup_size = ?, backup_sha256 = ?
+                WHERE file_id = ?
+            ''', values)
+        conn.commit()
+        conn.close()
+
+    def delete_user_file(self, user_id: int, file_id: str) -> int:
+        """Delete one of the user's archived files; returns the number of rows deleted"""
+        conn = self.connect()
+        cursor = conn.cursor()
+        cursor.execute('''
+            DELETE FROM archive.files
+            WHERE user_id = ? AND (file_id = ? OR telegram_file_id = ?)
+            RETURNING user_id, file_size
+        ''', (user_id, file_id, file_id))
+        rows = cursor.fetchall()
+        deleted = len(rows)
+        release_usage(cursor, rows)
+        conn.commit()
+        conn.close()
+        return deleted
@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Priority scheduling of updates for Telegram Bot
+
+Every update is classified by its command or button into a latency class:
+
+- interactive: /start, /help, menu taps, uploads and everything else cheap.
+  They run as they arrive, in order per user, as many at a time as the
+  adaptive limit allows (at most INTERACTIVE_CONCURRENCY). Against a slow
+  Bot API the limit rises until the event loop is INTERACTIVE_LOOP_BUSY
+  busy, so handlers overlap their waiting; against a fast one it stays at
+  one at a time, since extra concurrent sends then only cost CPU in the
+  HTTP connection pool.
+- heavy: backups, statistics, the gallery and admin bulk commands. They
+  share HEAVY_CONCURRENCY slots handed out round-robin between the users
+  waiting, at most HEAVY_PER_USER at a time per user, so one user cannot
+  take every slot. A user with HEAVY_QUEUE_PER_USER heavy requests waiting
+  is told to wait instead of queueing more.
+
+Heavy handlers run their blocking work (large queries, downloads) in their
+own thread pool, so it neither blocks the event loop nor competes with the
+default executor used by interactive handlers.
+"""
+
+import asyncio
+import contextlib
+import contextvars
+import functools
+import logging
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, List, Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = 'interactive'
+HEAVY = 'heavy'
+
+HEAVY_COMMANDS = {
+    'view_database', 'admin_stats', 'analytics', 'gallery', 'duplicates', 'backup_file',
+    'verify_backups', 'rebackup_all', 'purge_files', 'deactivate_users', 'activate_users',
+}
+# Callback data, matched as prefixes: database stats, gallery pages, backups
+HEAVY_CALLBACKS = ('view_db', 'gallery_page_', 'backup_')
+
+
+def classify(update: object) -> str:
+    """Latency class of an update"""
+    if not isinstance(update, Update):
+        return INTERACTIVE
+    query = update.callback_query
+    if query is not None:
+        return HEAVY if (query.data or '').startswith(HEAVY_CALLBACKS) else INTERACTIVE
+    message = update.message
+    if message is not None and message.text and message.text.startswith('/'):
+        command = message.text.split(maxsplit=1)[0][1:].split('@', 1)[0].lower()
+        if command in HEAVY_COMMANDS:
+            return HEAVY
+    return INTERACTIVE
+
+
+class FairScheduler:
+    """A fixed number of slots handed out round-robin between keys"""
+
+    def __init__(self, slots: int, per_key: int):
+        self.slots = slots
+        self.per_key = per_key
+        self.active = 0
+        self.running: Dict[Hashable, int] = {}
+        # Keys in the order they get their next turn
+        self._waiting: Dict[Hashable, Deque[asyncio.Future]] = {}
+
+    def queued(self, key: Optional[Hashable] = None) -> int:
+        """Waiters for `key`, or for all keys"""
+        if key is not None:
+            return len(self._waiting.get(key, ()))
+        return sum(len(queue) for queue in self._waiting.values())
+
+    async def acquire(self, key: Hashable):
+        future = asyncio.get_running_loop().create_future()
+        self._waiting.setdefault(key, deque()).append(future)
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.cancelled():
+                self._discard(key, future)
+            else:
+                # Granted just before the cancellation
+                self.release(key)
+            raise
+
+    def release(self, key: Hashable):
+        self.active -= 1
+        self.running[key] -= 1
+        if not self.running[key]:
+            del self.running[key]
+        self._dispatch()
+
+    def _discard(self, key: Hashable, future: asyncio.Future):
+        queue = self._waiting.get(key)
+        if queue is not None and future in queue:
+            queue.remove(future)
+            if not queue:
+                del self._waiting[key]
+
+    def _dispatch(self):
+        while self.active < self.slots:
+            key = next((key for key in self._waiting if self.running.get(key, 0) < self.per_key), None)
+            if key is None:
+                return
+            # The key goes to the back of the line for its next waiter
+            queue = self._waiting.pop(key)
+            future = queue.popleft()
+            if queue:
+                self._waiting[key] = queue
+            if future.done():
+                continue
+            future.set_result(None)
+            self.active += 1
+            self.running[key] = self.running.get(key, 0) + 1
+
+
+class AdaptiveLimit:
+    """A concurrency limit that keeps the event loop busy, but not more
+
+    While work waits for a slot, the share of time the event loop spent
+    running code is measured over windows of `window` completions per slot,
+    and the limit is scaled towards the one at which that share would be
+    `busy`, moving by at least one. Below `busy` the updates are mostly
+    waiting on the Bot API, so more of them at once finish sooner. Above
+    it the loop is what they wait for, and extra concurrent sends only
+    cost CPU in the connection pool.
+    """
+
+    def __init__(self, initial: int, maximum: int, busy: float, window: int = 2):
+        self.maximum = max(1, maximum)
+        self.limit = max(1, min(initial, self.maximum))
+        self.busy = busy
+        self.window = window
+        self.running = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._completed = 0
+        self._window_started: Optional[float] = None
+        self._cpu_started = 0.0
+        # Whether anything waited during the window: only then is the limit what holds work back
+        self._saturated = False
+
+    async def acquire(self):
+        if self.running < self.limit and not self._waiters:
+            self.running += 1
+            return
+        self._saturated = True
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.cancelled():
+                self._waiters.remove(future)
+            else:
+                # Granted just before the cancellation
+                self.release()
+            raise
+
+    def release(self):
+        self.running -= 1
+        self._completed += 1
+        if self._completed >= self.window * self.limit:
+            self._adjust()
+        while self._waiters and self.running < self.limit:
+            future = self._waiters.popleft()
+            if not future.done():
+                future.set_result(None)
+                self.running += 1
+
+    def _adjust(self):
+        # Runs on the event loop thread, so its CPU time is the loop's
+        now, cpu = asyncio.get_running_loop().time(), time.thread_time()
+        started, self._window_started = self._window_started, now
+        cpu_started, self._cpu_started = self._cpu_started, cpu
+        self._completed = 0
+        saturated = self._saturated or bool(self._waiters)
+        self._saturated = False
+        if started is None or not saturated or now <= started:
+            # Arrivals set the pace; the limit is not what holds work back
+            return
+
+        busy = (cpu - cpu_started) / (now - started)
+        if busy < self.busy:
+            target = self.limit * self.busy / busy if busy > 0 else self.maximum
+            self.limit = min(self.maximum, max(self.limit + 1, int(target)))
+        else:
+            self.limit = max(1, min(self.limit - 1, int(self.limit * self.busy / busy)))
+
+
+class LatencyWindow:
+    """Durations of the most recent updates of one class"""
+
+    def __init__(self, size: int = 1000):
+        self.durations: Deque[float] = deque(maxlen=size)
+        self.count = 0
+
+    def record(self, seconds: float):
+        self.durations.append(seconds)
+        self.count += 1
+
+    def percentile(self, fraction: float) -> float:
+        if not self.durations:
+            return 0.0
+        ordered = sorted(self.durations)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class PriorityUpdateProcessor(BaseUpdateProcessor):
+    """Runs interactive updates at once and heavy ones through a fair, bounded pool
+
+    `on_rejected(update)` answers a heavy update refused because its user
+    already has too many waiting.
+    """
+
+    def __init__(self, on_rejected: Optional[Callable[[object], Awaitable[Any]]] = None,
+                 max_concurrent_updates: Optional[int] = None, heavy_slots: Optional[int] = None,
+                 heavy_per_user: Optional[int] = None, heavy_queue_per_user: Optional[int] = None,
+                 interactive_slots: Optional[int] = None):
+        # Heavy updates waiting for a slot also count against max_concurrent_updates
+        super().__init__(max_concurrent_updates or Config.MAX_CONCURRENT_UPDATES)
+        self.on_rejected = on_rejected
+        maximum = interactive_slots or Config.INTERACTIVE_CONCURRENCY
+        self.interactive = AdaptiveLimit(min(Config.INTERACTIVE_INITIAL_CONCURRENCY, maximum), maximum,
+                                         Config.INTERACTIVE_LOOP_BUSY)
+        self.heavy = FairScheduler(heavy_slots or Config.HEAVY_CONCURRENCY,
+                                   heavy_per_user or Config.HEAVY_PER_USER)
+        self.heavy_queue_per_user = heavy_queue_per_user or Config.HEAVY_QUEUE_PER_USER
+        self.executor = ThreadPoolExecutor(Config.HEAVY_THREADS, thread_name_prefix='heavy')
+        self.latency = {INTERACTIVE: LatencyWindow(), HEAVY: LatencyWindow()}
+        self.slo_misses = 0
+        self.rejected = 0
+        # Per user: [lock keeping their interactive updates in order, updates holding or waiting for it]
+        self._in_order: Dict[Hashable, list] = {}
+
+    @staticmethod
+    def key_for(update: object) -> Optional[Hashable]:
+        if isinstance(update, Update):
+            if update.effective_user is not None:
+                return update.effective_user.id
+            if update.effective_chat is not None:
+                return update.effective_chat.id
+        return None
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        latency_class = classify(update)
+        key = self.key_for(update)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+
+        if latency_class == HEAVY:
+            if self.heavy.queued(key) >= self.heavy_queue_per_user:
+                coroutine.close()
+                self.rejected += 1
+                logger.info("Refused a heavy update from %s with %d already waiting", key, self.heavy.queued(key))
+                if self.on_rejected is not None:
+                    await self.on_rejected(update)
+                return
+            try:
+                await self.heavy.acquire(key)
+            except asyncio.CancelledError:
+                coroutine.close()
+                raise
+            try:
+                await coroutine
+            finally:
+                self.heavy.release(key)
+        else:
+            async with self.ordered(key):
+                try:
+                    await self.interactive.acquire()
+                except asyncio.CancelledError:
+                    coroutine.close()
+                    raise
+                try:
+                    await coroutine
+                finally:
+                    self.interactive.release()
+
+        elapsed = loop.time() - started
+        self.latency[latency_class].record(elapsed)
+        if latency_class == INTERACTIVE and elapsed * 1000 > Config.INTERACTIVE_SLO_MS:
+            self.slo_misses += 1
+
+    @contextlib.asynccontextmanager
+    async def ordered(self, key: Optional[Hashable]):
+        """Hold the user's interactive lock, so their updates are handled in order"""
+        if key is None:
+            yield
+            return
+        entry = self._in_order.get(key)
+        if entry is None:
+            entry = self._in_order[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._in_order[key]
+
+    async def run_blocking(self, func: Callable, *args, **kwargs) -> Any:
+        """Run blocking heavy work in the heavy thread pool, keeping the log context"""
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(
+            self.executor, functools.partial(context.run, func, *args, **kwargs)
+        )
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Full-text search over user files and polls for Telegram Bot
+"""
+
+import re
+import sqlite3
+import unicodedata
+from typing import List, Optional, Tuple
+
+from database import open_connection
+
+# Contentless FTS5 tables: the text lives in files/polls and is only indexed
+# here. The owner column holds a "u<user_id>" token so a user's rows are
+# selected inside the index instead of filtering a global match afterwards.
+SCHEMA = {
+    'files_fts': '''
+        CREATE VIRTUAL TABLE files_fts USING fts5(
+            owner, file_name, file_type,
+            content='', prefix='2 3 4 5', tokenize='unicode61 remove_diacritics 2'
+        )
+    ''',
+    'polls_fts': '''
+        CREATE VIRTUAL TABLE polls_fts USING fts5(
+            owner, question, options,
+            content='', prefix='2 3 4 5', tokenize='unicode61 remove_diacritics 2'
+        )
+    ''',
+}
+
+BACKFILL = {
+    'files_fts': '''
+        INSERT INTO files_fts (rowid, owner, file_name, file_type)
+        SELECT file_id, 'u' || user_id, file_name, file_type FROM files
+    ''',
+    'polls_fts': '''
+        INSERT INTO polls_fts (rowid, owner, question, options)
+        SELECT poll_id, 'u' || user_id, question, options FROM polls
+    ''',
+}
+
+TRIGGERS = [
+    '''
+    CREATE TRIGGER IF NOT EXISTS files_fts_insert AFTER INSERT ON files BEGIN
+        INSERT INTO files_fts (rowid, owner, file_name, file_type)
+        VALUES (new.file_id, 'u' || new.user_id, new.file_name, new.file_type);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS files_fts_delete AFTER DELETE ON files BEGIN
+        INSERT INTO files_fts (files_fts, rowid, owner, file_name, file_type)
+        VALUES ('delete', old.file_id, 'u' || old.user_id, old.file_name, old.file_type);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS files_fts_update
+    AFTER UPDATE OF user_id, file_name, file_type ON files BEGIN
+        INSERT INTO files_fts (files_fts, rowid, owner, file_name, file_type)
+        VALUES ('delete', old.file_id, 'u' || old.user_id, old.file_name, old.file_type);
+        INSERT INTO files_fts (rowid, owner, file_name, file_type)
+        VALUES (new.file_id, 'u' || new.user_id, new.file_name, new.file_type);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS polls_fts_insert AFTER INSERT ON polls BEGIN
+        INSERT INTO polls_fts (rowid, owner, question, options)
+        VALUES (new.poll_id, 'u' || new.user_id, new.question, new.options);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS polls_fts_delete AFTER DELETE ON polls BEGIN
+        INSERT INTO polls_fts (polls_fts, rowid, owner, question, options)
+        VALUES ('delete', old.poll_id, 'u' || old.user_id, old.question, old.options);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS polls_fts_update
+    AFTER UPDATE OF user_id, question, options ON polls BEGIN
+        INSERT INTO polls_fts (polls_fts, rowid, owner, question, options)
+        VALUES ('delete', old.poll_id, 'u' || old.user_id, old.question, old.options);
+        INSERT INTO polls_fts (rowid, owner, question, options)
+        VALUES (new.poll_id, 'u' || new.user_id, new.question, new.options);
+    END
+    ''',
+]
+
+# Candidate lookups. Each term is a full prefix query, so the candidates are
+# the rows score() accepts; terms of up to five characters seek a prefix
+# index. bm25() is avoided because it scans the whole doclist of every
+# phrase to compute IDF, which grows with the table.
+FILES_QUERY = '''
+    SELECT f.file_id, f.file_name, f.file_type, f.telegram_file_id
+    FROM files_fts JOIN files f ON f.file_id = files_fts.rowid
+    WHERE files_fts MATCH ?
+'''
+
+POLLS_QUERY = '''
+    SELECT p.poll_id, p.question, p.options
+    FROM polls_fts JOIN polls p ON p.poll_id = polls_fts.rowid
+    WHERE polls_fts MATCH ?
+'''
+
+# Words as the unicode61 tokenizer splits them: letters and digits only,
+# so underscores separate tokens
+TERM_PATTERN = re.compile(r'[^\W_]+', re.UNICODE)
+MAX_TERMS = 8
+MIN_TERM_LENGTH = 2
+# Upper bound on matches ranked per query for users with very large libraries
+MAX_CANDIDATES = 1000
+
+
+def normalize(text: str) -> str:
+    """Lowercase and strip diacritics the same way the FTS tokenizer does"""
+    decomposed = unicodedata.normalize('NFKD', text.lower())
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def build_match(owner: int, terms: List[str], columns: str) -> str:
+    """Build an FTS5 MATCH expression restricted to one owner, with prefix terms"""
+    phrases = " AND ".join(f'"{term}"*' for term in terms)
+    return f'owner:u{owner} AND {{{columns}}} : ({phrases})'
+
+
+def score(terms: List[str], title: Optional[str], detail: Optional[str]) -> int:
+    """Rank a candidate; 0 means it does not match every term
+
+    Whole-word hits in the title count most, then prefix hits in the title,
+    then hits in the secondary column.
+    """
+    title_tokens = TERM_PATTERN.findall(normalize(title or ''))
+    detail_tokens = TERM_PATTERN.findall(normalize(detail or ''))
+    total = 0
+    for term in terms:
+        if term in title_tokens:
+            total += 3
+        elif any(token.startswith(term) for token in title_tokens):
+            total += 2
+        elif any(token.startswith(term) for token in detail_tokens):
+            total += 1
+        else:
+            return 0
+    return total
+
+
+class SearchIndex:
+    """FTS5 index over files and polls, kept in sync by triggers"""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def connection(self) -> sqlite3.Connection:
+        """Get the long-lived read connection
+
+        Opening a connection re-parses the FTS schema, which costs more than
+        the query itself, so searches share one connection.
+        """
+        if self._conn is None:
+            self._conn = open_connection(self.db_path)
+        return self._conn
+
+    def close(self):
+        """Close the read connection"""
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    @staticmethod
+    def init_schema(cursor: sqlite3.Cursor):
+        """Create the FTS tables and triggers, indexing existing rows once
+
+        A table created with an older definition (e.g. fewer prefix indexes)
+        is rebuilt.
+        """
+        for table, statement in SCHEMA.items():
+            cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table,))
+            row = cursor.fetchone()
+            if row and row[0].split() == statement.split():
+                continue
+            if row:
+                cursor.execute(f"DROP TABLE {table}")
+            cursor.execute(statement)
+            cursor.execute(BACKFILL[table])
+
+        for statement in TRIGGERS:
+            cursor.execute(statement)
+
+    @staticmethod
+    def parse_terms(text: str) -> List[str]:
+        """Split a user query into search terms"""
+        terms = [term for term in TERM_PATTERN.findall(normalize(text)) if len(term) >= MIN_TERM_LENGTH]
+        return terms[:MAX_TERMS]
+
+    def search(self, user_id: int, text: str, limit: int = 10, offset: int = 0) -> Tuple[List[dict], bool]:
+        """Search a user's files and polls, best matches first
+
+        Returns one page of results and whether another page follows.
+        """
+        terms = self.parse_terms(text)
+        if not terms:
+            return [], False
+
+        cursor = self.connection().cursor()
+
+        results = []
+        matched = 0
+        cursor.execute(FILES_QUERY, (build_match(user_id, terms, 'file_name file_type'),))
+        for file_id, file_name, file_type, telegram_file_id in cursor:
+            rank = score(terms, file_name, file_type)
+            if rank:
+                matched += 1
+                results.append((rank, file_id, {
+                    'kind': 'file',
+                    'item_id': file_id,
+                    'title': file_name,
+                    'detail': file_type,
+                    'telegram_file_id': telegram_file_id,
+                }))
+                if matched >= MAX_CANDIDATES:
+                    break
+
+        matched = 0
+        cursor.execute(POLLS_QUERY, (build_match(user_id, terms, 'question options'),))
+        for poll_id, question, options in cursor:
+            rank = score(terms, question, options)
+            if rank:
+                matched += 1
+                results.append((rank, poll_id, {
+                    'kind': 'poll',
+                    'item_id': poll_id,
+                    'title': question,
+                    'detail': options,
+                    'telegram_file_id': None,
+                }))
+                if matched >= MAX_CANDIDATES:
+                    break
+
+        cursor.close()
+
+        # Best score first, newest first among equals
+        results.sort(key=lambda result: (-result[0], -result[1]))
+        page = [result for _, _, result in results[offset:offset + limit]]
+        return page, len(results) > offset + limit
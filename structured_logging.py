@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Structured, non-blocking logging for Telegram Bot
+
+Log calls only put the record on an in-memory queue. A listener thread
+formats it and writes it to the console and a rotating JSON file, so disk
+and terminal I/O stay off the event loop. Records created while an update is
+being handled carry bot_id, update_id, user_id and the handler name. Each
+handler call is timed. High-volume DEBUG events are sampled.
+"""
+
+import atexit
+import contextvars
+import functools
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import time
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Fields copied from records (context or `extra=`) into the JSON output
+STRUCTURED_FIELDS = ('bot_id', 'update_id', 'user_id', 'chat_id', 'handler', 'duration_ms', 'sample_rate')
+
+# Set while a handler runs, so every record it logs is attributed to the update
+_update_context: contextvars.ContextVar[Optional[dict]] = contextvars.ContextVar('update_context', default=None)
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for field in STRUCTURED_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class ContextFilter(logging.Filter):
+    """Attach the current update's fields to records logged while handling it"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        context = _update_context.get()
+        if context:
+            for field, value in context.items():
+                if getattr(record, field, None) is None:
+                    setattr(record, field, value)
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Keep one in `rate` DEBUG records per call site and handler; other levels pass untouched"""
+
+    def __init__(self, rate: int):
+        super().__init__()
+        self.rate = max(1, rate)
+        self._counts: Dict[Tuple[str, object, Optional[str]], int] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno != logging.DEBUG or self.rate == 1:
+            return True
+        key = (record.name, record.msg, getattr(record, 'handler', None))
+        count = self._counts.get(key, 0)
+        self._counts[key] = count + 1
+        if count % self.rate:
+            return False
+        record.sample_rate = self.rate
+        return True
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """Queue records with their message merged; formatting happens in the listener thread
+
+    The stock QueueHandler formats every record in the caller so it can be
+    pickled. The queue here never leaves the process, so only `msg % args`
+    runs in the caller - the arguments may change or be reused once the log
+    call returns - and the formatter output (JSON, tracebacks) is left to the
+    listener, off the event loop.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Same message either way, so other handlers may see the merged record
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+def _file_handler() -> Optional[logging.Handler]:
+    """Rotating JSON file in Config.LOG_DIR, or None if the directory is unusable"""
+    try:
+        os.makedirs(Config.LOG_DIR, exist_ok=True)
+        handler = logging.handlers.RotatingFileHandler(
+            os.path.join(Config.LOG_DIR, Config.LOG_FILE_NAME),
+            maxBytes=Config.LOG_FILE_MAX_BYTES,
+            backupCount=Config.LOG_FILE_BACKUP_COUNT,
+            encoding='utf-8'
+        )
+    except OSError as e:
+        logger.warning("File logging disabled, cannot write to %s: %s", Config.LOG_DIR, e)
+        return None
+    handler.setFormatter(JsonFormatter())
+    return handler
+
+
+def setup_logging() -> logging.handlers.QueueListener:
+    """Route all logging through a queue to console and file handlers"""
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    console = logging.StreamHandler()
+    console.setFormatter(JsonFormatter() if Config.LOG_JSON_CONSOLE else logging.Formatter(Config.LOG_FORMAT))
+    handlers = [console]
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    queue_handler = DeferredQueueHandler(log_queue)
+    # Context first, so sampling can tell handlers apart
+    queue_handler.addFilter(ContextFilter())
+    queue_handler.addFilter(SamplingFilter(Config.LOG_DEBUG_SAMPLE_RATE))
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(Config.LOG_LEVEL.upper())
+    # httpx logs every Bot API request at INFO
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+
+    file_handler = _file_handler()
+    if file_handler is not None:
+        handlers.append(file_handler)
+
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+    return _listener
+
+
+def stop_logging():
+    """Flush queued records and stop the listener thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def update_fields(update) -> dict:
+    """Structured fields identifying an update"""
+    fields = {}
+    if getattr(update, 'update_id', None) is not None:
+        fields['update_id'] = update.update_id
+        if update.effective_user is not None:
+            fields['user_id'] = update.effective_user.id
+        if update.effective_chat is not None:
+            fields['chat_id'] = update.effective_chat.id
+    return fields
+
+
+def timed_handler(callback):
+    """Wrap a handler callback to log its duration with the update's fields
+
+    Every call is logged at DEBUG (and so sampled), calls slower than
+    LOG_SLOW_HANDLER_MS at WARNING.
+    """
+    name = getattr(callback, '__name__', repr(callback))
+    handler_logger = logging.getLogger('handlers')
+
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        fields = dict(update_fields(update), handler=name)
+        # Tells apart the bots hosted in one process
+        fields['bot_id'] = context.bot.id
+
+        token = _update_context.set(fields)
+        started = time.perf_counter()
+        try:
+            # Exceptions go on to the application's error handler
+            return await callback(update, context)
+        finally:
+            duration_ms = round((time.perf_counter() - started) * 1000, 2)
+            if duration_ms >= Config.LOG_SLOW_HANDLER_MS:
+                handler_logger.warning("Slow handler %s took %.0fms", name, duration_ms,
+                                       extra={'duration_ms': duration_ms})
+            elif handler_logger.isEnabledFor(logging.DEBUG):
+                handler_logger.debug("Handled update", extra={'duration_ms': duration_ms})
+            _update_context.reset(token)
+
+    return wrapper
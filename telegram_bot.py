@@ -9,39 +9,117 @@ Telegram Bot with comprehensive features:
 - Database with viewing capabilities
 """
 
+import argparse
+import asyncio
 import logging
+import mimetypes
 import os
-import sqlite3
+import signal
 import shutil
-import requests
+import threading
+import time
 from datetime import datetime
 from typing import Dict, List, Optional
 
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, Poll
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, InputMediaPhoto, Poll
 from telegram.ext import (
-    Application, CommandHandler, MessageHandler, CallbackQueryHandler,
-    ContextTypes, filters
+    Application, ApplicationHandlerStop, CommandHandler, MessageHandler, CallbackQueryHandler,
+    InlineQueryHandler, TypeHandler, ContextTypes, filters
 )
 from telegram.constants import ParseMode
 
-# Configure logging
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
+from admin_jobs import AdminOperations, BulkJob, BulkJobManager, PendingJobStore
+from analytics import ActivityAnalytics, format_value, metric_label, sparkline
+from config import Config
+from database import fetch_row, fetch_rows, open_connection, query_log
+from diagnostics import dump_tasks, folded, hot_functions, loop_monitor, profiler
+from hosting import SharedResources, Tenant, tenants_from_config
+from ingestion import UploadBatcher, validate_upload
+from inline_mode import InlineFileIndex, InlineQueryResponder
+from lifecycle import HandlerTracker, HandOff
+from outbound import OutboundClient
+from quotas import QuotaManager, release_usage
+from retention import ArchiveManager, retention_days
+from scheduling import HEAVY, INTERACTIVE, PriorityUpdateProcessor
+from search import SearchIndex
+from structured_logging import setup_logging, timed_handler, update_fields
+from templates import MessageTemplates
+from transfers import VERIFIED, BackupVerifier, TransferError, download_resumable
+from thumbnails import (
+    PREVIEWS_AVAILABLE, ThumbnailWorker, find_near_duplicates, photo_sizes_json, preview_file_id
 )
+
 logger = logging.getLogger(__name__)
 
 class TelegramBot:
-    def __init__(self, token: str):
+    def __init__(self, token: str, db_path: Optional[str] = None,
+                 base_url: Optional[str] = None, base_file_url: Optional[str] = None,
+                 tenant: Optional[Tenant] = None, shared: Optional[SharedResources] = None):
         self.token = token
-        self.application = Application.builder().token(token).build()
-        self.db_path = "bot_database.db"
+        self.bot_id = token.split(':', 1)[0]
+        self.shared = shared
+        # Heavy updates get their own fair, bounded lane; with scheduling off, updates run one at a time
+        self.scheduler = PriorityUpdateProcessor(
+            on_rejected=self.reject_heavy_update,
+            max_concurrent_updates=None if Config.PRIORITY_SCHEDULING else 1
+        )
+        builder = Application.builder().token(token).concurrent_updates(self.scheduler)
+        if shared is not None:
+            # One HTTP client for all bots in the process
+            builder = builder.request(shared.request).get_updates_request(shared.updates_request)
+        else:
+            builder = (
+                builder
+                .connection_pool_size(Config.API_CONNECTION_POOL_SIZE)
+                .pool_timeout(Config.API_POOL_TIMEOUT)
+            )
+        # A different Bot API server, e.g. a local one or the benchmark fake
+        if base_url:
+            builder = builder.base_url(base_url)
+        if base_file_url:
+            builder = builder.base_file_url(base_file_url)
+        self.application = builder.build()
+        if tenant is not None:
+            # A hosted bot keeps everything in its own directory
+            os.makedirs(tenant.directory, exist_ok=True)
+            self.db_path = tenant.db_path
+            self.backup_dir = tenant.backup_dir
+            self.handoff_dir = tenant.directory
+            self.outbound = OutboundClient(self.application.bot, rate_limit=Config.TENANT_API_RATE_LIMIT)
+        else:
+            self.db_path = db_path or Config.DATABASE_PATH
+            self.backup_dir = Config.BACKUP_DIR
+            self.handoff_dir = Config.HANDOFF_DIR or os.path.dirname(os.path.abspath(self.db_path))
+            self.outbound = OutboundClient(self.application.bot)
+        self.templates = MessageTemplates()
+        self.analytics = ActivityAnalytics(self.db_path)
+        self.search_index = SearchIndex(self.db_path)
+        self.inline_index = InlineFileIndex(self.db_path)
+        self.inline_responder = InlineQueryResponder(self.inline_index)
+        self.upload_batcher = UploadBatcher(self.flush_uploads)
+        self.archive = ArchiveManager(self.db_path, tenant.archive_path if tenant else None)
+        self.retention_task: Optional[asyncio.Task] = None
+        self.thumbnails = ThumbnailWorker(self.db_path, tenant.thumbnail_dir if tenant else None,
+                                          pool=shared.thumbnail_pool if shared else None)
+        self.thumbnail_task: Optional[asyncio.Task] = None
+        # Background /diag profile
+        self.profile_task: Optional[asyncio.Task] = None
+        self.verifier = shared.verifier if shared else BackupVerifier()
+        # Set at shutdown: this bot's downloads and verifications stop at their next chunk
+        self.transfers_aborted = threading.Event()
+        self.admin_ops = AdminOperations(self.archive)
+        self.quotas = QuotaManager(self.archive)
+        self.bulk_jobs = BulkJobManager()
+        self.job_store = PendingJobStore(self.db_path)
+        self.resume_task: Optional[asyncio.Task] = None
+        self.handler_tracker = HandlerTracker()
         self.init_database()
+        self.inactive_users = set(self.admin_ops.inactive_users())
         self.setup_handlers()
     
     def init_database(self):
         """Initialize SQLite database with required tables"""
-        conn = sqlite3.connect(self.db_path)
+        conn = open_connection(self.db_path)
         cursor = conn.cursor()
         
         # Users table
@@ -70,9 +148,26 @@ class TelegramBot:
                 upload_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 backup_path TEXT,
                 backup_date TIMESTAMP,
+                backup_size INTEGER,
+                backup_sha256 TEXT,
+                media_kind TEXT DEFAULT 'document',
+                photo_sizes TEXT,
+                thumbnail_path TEXT,
+                phash INTEGER,
                 FOREIGN KEY (user_id) REFERENCES users (user_id)
             )
         ''')
+        if self.ensure_column(cursor, 'files', 'media_kind', "TEXT DEFAULT 'document'"):
+            # Older rows: photos were stored with generated names
+            cursor.execute('''
+                UPDATE files SET media_kind = 'photo'
+                WHERE file_type = 'image/jpeg' AND file_name LIKE 'photo\\_%' ESCAPE '\\'
+            ''')
+        for column, definition in (('photo_sizes', 'TEXT'), ('thumbnail_path', 'TEXT'), ('phash', 'INTEGER'),
+                                   ('backup_size', 'INTEGER'), ('backup_sha256', 'TEXT')):
+            self.ensure_column(cursor, 'files', column, definition)
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_files_user ON files (user_id, upload_date)')
+        ThumbnailWorker.init_schema(cursor)
         
         # Polls table
         cursor.execute('''
@@ -101,12 +196,76 @@ class TelegramBot:
             )
         ''')
         
+        # Full-text search index over files and polls
+        SearchIndex.init_schema(cursor)
+        
+        # Hourly/daily activity rollups
+        ActivityAnalytics.init_schema(cursor)
+        
+        # Bulk jobs paused by a shutdown
+        PendingJobStore.init_schema(cursor)
+        
+        # Per-user storage usage and quota overrides
+        recount_usage = QuotaManager.init_schema(cursor)
+        
         conn.commit()
         conn.close()
+        
+        # Archive tables for rows past retention
+        self.archive.init_schema()
+        if recount_usage:
+            # Usage of files stored before quotas existed
+            self.quotas.recount()
         logger.info("Database initialized successfully")
     
+    @staticmethod
+    def ensure_column(cursor, table: str, column: str, definition: str) -> bool:
+        """Add a column to an existing table; True if it was missing"""
+        cursor.execute(f'PRAGMA table_info({table})')
+        if any(row[1] == column for row in cursor.fetchall()):
+            return False
+        cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+        return True
+    
+    async def post_init(self, application: Application):
+        """Start background maintenance once the application is initialized"""
+        if any(days > 0 for days in retention_days().values()):
+            self.retention_task = asyncio.create_task(self.retention_loop())
+        if PREVIEWS_AVAILABLE:
+            self.thumbnail_task = asyncio.create_task(self.thumbnails.run())
+        loop_monitor.start()
+    
+    async def post_stop(self, application: Application):
+        """Stop background maintenance"""
+        if self.retention_task is not None:
+            self.retention_task.cancel()
+            self.retention_task = None
+        if self.thumbnail_task is not None:
+            self.thumbnail_task.cancel()
+            self.thumbnail_task = None
+        if self.profile_task is not None:
+            profiler.stop()
+        loop_monitor.stop()
+        if self.shared is None:
+            self.verifier.shutdown()
+    
+    async def retention_loop(self):
+        """Periodically move rows past retention to the archive"""
+        while True:
+            try:
+                moved = await self.archive.run_once()
+                if moved.get('files'):
+                    # Cached inline indexes may still list archived files
+                    self.inline_index.invalidate()
+            except Exception as e:
+                logger.error("Error archiving old rows: %s", e)
+            await asyncio.sleep(Config.ARCHIVE_INTERVAL)
+    
     def setup_handlers(self):
         """Setup all bot command and message handlers"""
+        # Deactivated users are dropped before any other handler sees the update
+        self.application.add_handler(TypeHandler(Update, self.drop_inactive_users), group=-1)
+        
         # Command handlers
         self.application.add_handler(CommandHandler("start", self.start_command))
         self.application.add_handler(CommandHandler("help", self.help_command))
@@ -114,12 +273,25 @@ class TelegramBot:
         self.application.add_handler(CommandHandler("update_profile", self.update_profile_command))
         self.application.add_handler(CommandHandler("upload", self.upload_command))
         self.application.add_handler(CommandHandler("my_files", self.my_files_command))
+        self.application.add_handler(CommandHandler("quota", self.quota_command))
+        self.application.add_handler(CommandHandler("search", self.search_command))
         self.application.add_handler(CommandHandler("send_photo", self.send_photo_command))
+        self.application.add_handler(CommandHandler("gallery", self.gallery_command))
+        self.application.add_handler(CommandHandler("duplicates", self.duplicates_command))
         self.application.add_handler(CommandHandler("create_poll", self.create_poll_command))
         self.application.add_handler(CommandHandler("view_database", self.view_database_command))
         self.application.add_handler(CommandHandler("admin_stats", self.admin_stats_command))
+        self.application.add_handler(CommandHandler("analytics", self.analytics_command))
+        self.application.add_handler(CommandHandler("diag", self.diag_command))
+        self.application.add_handler(CommandHandler("deactivate_users", self.deactivate_users_command))
+        self.application.add_handler(CommandHandler("activate_users", self.activate_users_command))
+        self.application.add_handler(CommandHandler("purge_files", self.purge_files_command))
+        self.application.add_handler(CommandHandler("rebackup_all", self.rebackup_all_command))
+        self.application.add_handler(CommandHandler("jobs", self.jobs_command))
+        self.application.add_handler(CommandHandler("cancel_job", self.cancel_job_command))
         self.application.add_handler(CommandHandler("backup", self.backup_command))
         self.application.add_handler(CommandHandler("backup_file", self.backup_file_command))
+        self.application.add_handler(CommandHandler("verify_backups", self.verify_backups_command))
         
         # Message handlers
         self.application.add_handler(MessageHandler(filters.PHOTO, self.handle_photo))
@@ -128,6 +300,52 @@ class TelegramBot:
         
         # Callback query handlers
         self.application.add_handler(CallbackQueryHandler(self.handle_callback))
+        
+        # Inline mode; non-blocking so newer keystrokes can supersede a debounced query
+        self.application.add_handler(InlineQueryHandler(self.handle_inline_query, block=False))
+        
+        # Time every handler and attribute its log records to the update;
+        # run it as a tracked task so shutdown can wait for it
+        for handlers in self.application.handlers.values():
+            for handler in handlers:
+                handler.callback = self.handler_tracker.wrap(timed_handler(handler.callback))
+        self.application.add_error_handler(self.handle_error)
+    
+    async def handle_error(self, update: object, context: ContextTypes.DEFAULT_TYPE):
+        """Log errors raised while handling updates"""
+        logger.error("Error handling update", exc_info=context.error, extra=update_fields(update))
+    
+    def is_admin(self, user_id: int) -> bool:
+        """Whether a user is listed in ADMIN_USER_IDS"""
+        return user_id in Config.ADMIN_USER_IDS
+    
+    async def require_admin(self, update: Update) -> bool:
+        """Check the sender is an admin, telling them off otherwise"""
+        if self.is_admin(update.effective_user.id):
+            return True
+        await self.reply(update, "⛔ این دستور فقط برای ادمین‌ها در دسترس است.")
+        return False
+    
+    async def drop_inactive_users(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Stop handling updates from deactivated users"""
+        user = update.effective_user
+        if user is not None and user.id in self.inactive_users and not self.is_admin(user.id):
+            raise ApplicationHandlerStop
+    
+    async def reply(self, update: Update, text: str, **kwargs):
+        """Send a message to the chat an update came from"""
+        return await self.outbound.send_message(update.effective_chat.id, text, **kwargs)
+    
+    async def reject_heavy_update(self, update: Update):
+        """Answer a heavy request refused because the user already has several waiting"""
+        if update.callback_query is not None:
+            await self.outbound.answer_callback_query(update.callback_query.id)
+        await self.reply(update, "⏳ درخواست‌های قبلی شما هنوز در صف اجرا هستند؛ لطفاً پس از پایان آن‌ها دوباره تلاش کنید.")
+    
+    async def edit_callback_message(self, update: Update, text: str, **kwargs):
+        """Edit the message a callback button belongs to"""
+        message = update.callback_query.message
+        return await self.outbound.edit_message_text(message.chat_id, message.message_id, text, **kwargs)
     
     async def start_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /start command"""
@@ -137,73 +355,36 @@ class TelegramBot:
         # Register user in database
         self.register_user(user)
         
-        welcome_text = f"""
-🤖 سلام {user.first_name}! به ربات تلگرام خوش آمدید!
-
-این ربات دارای قابلیت‌های زیر است:
-• 📝 مدیریت پروفایل کاربری
-• 📁 آپلود و دانلود فایل
-• 📸 ارسال عکس
-• 📊 ایجاد نظرسنجی
-• 🗄️ مشاهده دیتابیس
-
-برای شروع از دستور /help استفاده کنید.
-        """
+        language = self.templates.language_for(user)
+        welcome_text = self.templates.render('welcome', language, first_name=user.first_name)
+        reply_markup = self.templates.keyboard('main_menu', language)
         
-        keyboard = [
-            [InlineKeyboardButton("📝 پروفایل من", callback_data="profile")],
-            [InlineKeyboardButton("📁 فایل‌های من", callback_data="my_files")],
-            [InlineKeyboardButton("📊 ایجاد نظرسنجی", callback_data="create_poll")],
-            [InlineKeyboardButton("🗄️ مشاهده دیتابیس", callback_data="view_db")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await update.message.reply_text(welcome_text, reply_markup=reply_markup)
+        await self.reply(update, welcome_text, reply_markup=reply_markup)
     
     async def help_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /help command"""
-        help_text = """
-📋 لیست دستورات ربات:
-
-👤 مدیریت پروفایل:
-/profile - مشاهده پروفایل
-/update_profile - به‌روزرسانی پروفایل
-
-📁 مدیریت فایل:
-/upload - آپلود فایل
-/download - دانلود فایل
-/my_files - مشاهده فایل‌های من
-
-📸 عکس:
-/send_photo - ارسال عکس
-
-📊 نظرسنجی:
-/create_poll - ایجاد نظرسنجی جدید
-
-🗄️ دیتابیس:
-/view_database - مشاهده اطلاعات دیتابیس
-/admin_stats - آمار کلی (برای ادمین)
-
-💡 نکته: می‌توانید فایل‌ها و عکس‌ها را مستقیماً ارسال کنید!
-        """
-        await update.message.reply_text(help_text)
+        help_text = self.templates.text('help', self.templates.language_for(update.effective_user))
+        await self.reply(update, help_text)
     
     def register_user(self, user):
         """Register or update user in database"""
-        conn = sqlite3.connect(self.db_path)
+        conn = open_connection(self.db_path)
         cursor = conn.cursor()
         
+        # Upsert: returning users keep their email, phone, registration date and
+        # active flag, and only real registrations fire the analytics insert trigger
         cursor.execute('''
-            INSERT OR REPLACE INTO users 
-            (user_id, username, first_name, last_name, registration_date, is_active)
-            VALUES (?, ?, ?, ?, ?, ?)
+            INSERT INTO users (user_id, username, first_name, last_name, is_active)
+            VALUES (?, ?, ?, ?, 1)
+            ON CONFLICT (user_id) DO UPDATE SET
+                username = excluded.username,
+                first_name = excluded.first_name,
+                last_name = excluded.last_name
         ''', (
             user.id,
             user.username,
             user.first_name,
-            user.last_name,
-            datetime.now(),
-            1
+            user.last_name
         ))
         
         conn.commit()
@@ -227,57 +408,30 @@ class TelegramBot:
         else:
             profile_text = "❌ اطلاعات کاربری یافت نشد!"
         
-        keyboard = [
-            [InlineKeyboardButton("✏️ ویرایش پروفایل", callback_data="edit_profile")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        reply_markup = self.templates.keyboard('profile', self.templates.language_for(update.effective_user))
         
-        await update.message.reply_text(profile_text, reply_markup=reply_markup)
+        await self.reply(update, profile_text, reply_markup=reply_markup)
     
     def get_user_data(self, user_id):
         """Get user data from database"""
-        conn = sqlite3.connect(self.db_path)
+        conn = open_connection(self.db_path)
         cursor = conn.cursor()
         
         cursor.execute('SELECT * FROM users WHERE user_id = ?', (user_id,))
-        result = cursor.fetchone()
-        
-        if result:
-            columns = [description[0] for description in cursor.description]
-            user_data = dict(zip(columns, result))
-        else:
-            user_data = None
+        user_data = fetch_row(cursor)
         
         conn.close()
         return user_data
     
     async def update_profile_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /update_profile command"""
-        text = """
-✏️ برای به‌روزرسانی پروفایل، لطفاً اطلاعات زیر را ارسال کنید:
-
-📧 ایمیل: example@email.com
-📱 شماره تلفن: 09123456789
-
-فرمت: 
-email: your_email@example.com
-phone: your_phone_number
-        """
-        await update.message.reply_text(text)
+        text = self.templates.text('update_profile', self.templates.language_for(update.effective_user))
+        await self.reply(update, text)
     
     async def show_edit_profile_options(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Show edit profile options for callback queries"""
-        text = """
-✏️ برای به‌روزرسانی پروفایل، لطفاً اطلاعات زیر را ارسال کنید:
-
-📧 ایمیل: example@email.com
-📱 شماره تلفن: 09123456789
-
-فرمت: 
-email: your_email@example.com
-phone: your_phone_number
-        """
-        await update.callback_query.edit_message_text(text)
+        text = self.templates.text('update_profile', self.templates.language_for(update.effective_user))
+        await self.edit_callback_message(update, text)
     
     async def handle_text(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle text messages for profile updates"""
@@ -292,11 +446,11 @@ phone: your_phone_number
         if "email:" in text or "phone:" in text:
             await self.process_profile_update(update, text, user_id)
         else:
-            await update.message.reply_text("❓ متوجه نشدم. از دستور /help استفاده کنید.")
+            await self.reply(update, "❓ متوجه نشدم. از دستور /help استفاده کنید.")
     
     async def process_profile_update(self, update: Update, text: str, user_id: int):
         """Process profile update from text message"""
-        conn = sqlite3.connect(self.db_path)
+        conn = open_connection(self.db_path)
         cursor = conn.cursor()
         
         email = None
@@ -320,198 +474,324 @@ phone: your_phone_number
             conn.commit()
             conn.close()
             
-            await update.message.reply_text("✅ پروفایل با موفقیت به‌روزرسانی شد!")
+            await self.reply(update, "✅ پروفایل با موفقیت به‌روزرسانی شد!")
         else:
-            await update.message.reply_text("❌ فرمت صحیح نیست. لطفاً دوباره تلاش کنید.")
+            await self.reply(update, "❌ فرمت صحیح نیست. لطفاً دوباره تلاش کنید.")
     
     async def upload_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /upload command"""
-        text = """
-📁 برای آپلود فایل، کافیست فایل مورد نظر را ارسال کنید.
-
-پشتیبانی از انواع فایل:
-• 📄 اسناد (PDF, DOC, TXT, ...)
-• 🖼️ تصاویر (JPG, PNG, GIF, ...)
-• 🎵 فایل‌های صوتی (MP3, WAV, ...)
-• 🎬 ویدیو (MP4, AVI, ...)
-        """
-        await update.message.reply_text(text)
+        text = self.templates.text('upload', self.templates.language_for(update.effective_user))
+        await self.reply(update, text)
     
     async def handle_document(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle document uploads"""
-        user_id = update.effective_user.id
         document = update.message.document
         
-        # Save file info to database
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO files (user_id, file_name, file_type, file_size, telegram_file_id)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (
-            user_id,
-            document.file_name,
-            document.mime_type,
-            document.file_size,
-            document.file_id
-        ))
-        
-        conn.commit()
-        conn.close()
-        
-        await update.message.reply_text(
-            f"✅ فایل با موفقیت آپلود شد!\n"
-            f"📄 نام فایل: {document.file_name}\n"
-            f"📊 حجم: {document.file_size} بایت\n"
-            f"🔗 شناسه فایل: {document.file_id}"
-        )
+        # Some clients send no MIME type; go by the file name then
+        file_type = document.mime_type or mimetypes.guess_type(document.file_name or '')[0]
+        self.queue_upload(update, {
+            'file_name': document.file_name,
+            'file_type': file_type,
+            'file_size': document.file_size,
+            'telegram_file_id': document.file_id,
+            'media_kind': 'document',
+        })
     
     async def handle_photo(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle photo uploads"""
-        user_id = update.effective_user.id
         photo = update.message.photo[-1]  # Get highest resolution
         
-        # Save photo info to database
-        conn = sqlite3.connect(self.db_path)
+        self.queue_upload(update, {
+            'file_name': f"photo_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jpg",
+            'file_type': "image/jpeg",
+            'file_size': photo.file_size,
+            'telegram_file_id': photo.file_id,
+            'media_kind': 'photo',
+            # The smaller sizes serve gallery previews without generating anything
+            'photo_sizes': photo_sizes_json(update.message.photo),
+        })
+    
+    def queue_upload(self, update: Update, item: dict):
+        """Add an upload to its chat's batch; albums share a batch per media group"""
+        message = update.message
+        item['message_id'] = message.message_id
+        item['language'] = self.templates.language_for(update.effective_user)
+        key = (update.effective_chat.id, update.effective_user.id, message.media_group_id)
+        self.upload_batcher.add(key, item)
+    
+    async def flush_uploads(self, key, items: List[dict]):
+        """Validate and store a batch of uploads, then send one summary reply"""
+        chat_id, user_id, _ = key
+        
+        accepted = []
+        rejected = []
+        for item in items:
+            reason = validate_upload(item)
+            if reason:
+                rejected.append((item, reason))
+            else:
+                accepted.append(item)
+        
+        if accepted:
+            refused = self.store_uploads(user_id, accepted)
+            if refused:
+                accepted = [item for item in accepted if item not in refused]
+                rejected.extend((item, 'over_quota') for item in refused)
+        
+        text = self.templates.upload_summary(accepted, rejected, items[0]['language'])
+        await self.outbound.send_message(
+            chat_id,
+            text,
+            reply_to_message_id=items[0]['message_id'],
+            allow_sending_without_reply=True
+        )
+    
+    def store_uploads(self, user_id: int, items: List[dict]) -> List[dict]:
+        """Save a batch of uploads in one transaction; returns the items refused by the user's quota"""
+        conn = open_connection(self.db_path)
         cursor = conn.cursor()
         
-        cursor.execute('''
-            INSERT INTO files (user_id, file_name, file_type, file_size, telegram_file_id)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (
-            user_id,
-            f"photo_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jpg",
-            "image/jpeg",
-            photo.file_size,
-            photo.file_id
-        ))
+        # Reserve the space and insert under one write lock, so concurrent batches cannot overshoot
+        cursor.execute('BEGIN IMMEDIATE')
+        items, refused = self.quotas.reserve(cursor, user_id, items)
+        for item in items:
+            cursor.execute('''
+                INSERT INTO files (user_id, file_name, file_type, file_size, telegram_file_id, media_kind, photo_sizes)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                user_id,
+                item['file_name'],
+                item['file_type'],
+                item['file_size'],
+                item['telegram_file_id'],
+                item['media_kind'],
+                item.get('photo_sizes')
+            ))
+            item['file_id'] = cursor.lastrowid
         
         conn.commit()
         conn.close()
         
-        await update.message.reply_text(
-            f"📸 عکس با موفقیت آپلود شد!\n"
-            f"📊 حجم: {photo.file_size} بایت\n"
-            f"🔗 شناسه فایل: {photo.file_id}"
-        )
+        if refused:
+            logger.info("Refused %s uploads over the storage quota of user %s", len(refused), user_id)
+        for item in items:
+            self.inline_index.add(user_id, {
+                'file_id': item['file_id'],
+                'file_name': item['file_name'],
+                'file_type': item['file_type'],
+                'telegram_file_id': item['telegram_file_id'],
+                'media_kind': item['media_kind'],
+            })
+        return refused
+    
+    async def quota_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /quota command: the sender's usage; admins can inspect and override others'"""
+        args = context.args or []
+        language = self.templates.language_for(update.effective_user)
+        if not args:
+            quota = self.quotas.get(update.effective_user.id)
+            await self.reply(update, self.templates.quota_status(quota, language))
+            return
+        if not await self.require_admin(update):
+            return
+        
+        usage = self.templates.text('quota_admin_usage', language)
+        if args[0] == 'top':
+            await self.reply(update, self.templates.quota_top(self.quotas.largest(10), language))
+            return
+        if args[0] == 'recount':
+            users = await self.scheduler.run_blocking(self.quotas.recount)
+            await self.reply(update, self.templates.render('quota_recounted', language, users=users))
+            return
+        
+        if not args[0].isdigit() or len(args) > 3:
+            await self.reply(update, usage)
+            return
+        target = int(args[0])
+        if len(args) > 1:
+            if args[1] == 'default' and len(args) == 2:
+                self.quotas.set_limits(target, None, None)
+            elif all(arg.isdigit() for arg in args[1:]):
+                max_files = int(args[2]) if len(args) > 2 else None
+                self.quotas.set_limits(target, int(args[1]) * 1024 * 1024, max_files)
+            else:
+                await self.reply(update, usage)
+                return
+        
+        quota = self.quotas.get(target)
+        kind = self.templates.text('quota_kind_overridden' if quota.overridden else 'quota_kind_default', language)
+        header = self.templates.render('quota_user_header', language, user_id=target, kind=kind)
+        await self.reply(update, f"{header}\n{self.templates.quota_status(quota, language)}")
     
     async def my_files_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /my_files command"""
-        user_id = update.effective_user.id
-        files = self.get_user_files(user_id)
+        language = self.templates.language_for(update.effective_user)
+        text, reply_markup = self.render_files_page(update.effective_user.id, 0, language)
         
-        if files:
-            text = "📁 فایل‌های شما:\n\n"
-            keyboard = []
-            
-            for i, file in enumerate(files[:10], 1):  # Limit to 10 files
-                text += f"{i}. 📄 {file['file_name']}\n"
-                text += f"   📊 حجم: {file['file_size']} بایت\n"
-                text += f"   📅 تاریخ: {file['upload_date']}\n\n"
-                
-                # Add individual buttons for each file
-                keyboard.append([
-                    InlineKeyboardButton(
-                        f"📥 دانلود {file['file_name'][:15]}...",
-                        callback_data=f"download_{file['file_id']}"
-                    ),
-                    InlineKeyboardButton(
-                        f"🗑️ حذف {file['file_name'][:15]}...",
-                        callback_data=f"delete_{file['file_id']}"
-                    )
-                ])
-            
-            reply_markup = InlineKeyboardMarkup(keyboard)
-        else:
-            text = "📭 هیچ فایلی آپلود نکرده‌اید."
-            reply_markup = None
-        
-        await update.message.reply_text(text, reply_markup=reply_markup)
+        await self.reply(update, text, reply_markup=reply_markup)
+    
+    async def show_files_page(self, update: Update, context: ContextTypes.DEFAULT_TYPE, page: int):
+        """Show another page of /my_files for callback queries"""
+        language = self.templates.language_for(update.effective_user)
+        text, reply_markup = self.render_files_page(update.effective_user.id, page, language)
+        await self.edit_callback_message(update, text, reply_markup=reply_markup)
+    
+    def render_files_page(self, user_id: int, page: int, language: str):
+        """Render one page of a user's files; older pages come from the archive"""
+        page_size = Config.FILES_PAGE_SIZE
+        files, has_next = self.archive.list_files(page_size, page * page_size, user_id=user_id)
+        return self.templates.file_list(files, language, limit=page_size, page=page, has_next=has_next)
     
-    def get_user_files(self, user_id):
-        """Get user files from database"""
-        conn = sqlite3.connect(self.db_path)
+    def get_user_files(self, user_id, limit: int = -1, backed_up: bool = False):
+        """Get user files from database, newest first; `limit` caps how many"""
+        conn = open_connection(self.db_path)
         cursor = conn.cursor()
         
-        cursor.execute('''
-            SELECT * FROM files WHERE user_id = ? ORDER BY upload_date DESC
-        ''', (user_id,))
+        cursor.execute(f'''
+            SELECT * FROM files WHERE user_id = ? {'AND backup_path IS NOT NULL' if backed_up else ''}
+            ORDER BY upload_date DESC LIMIT ?
+        ''', (user_id, limit))
         
-        results = cursor.fetchall()
-        columns = [description[0] for description in cursor.description]
-        files = [dict(zip(columns, row)) for row in results]
+        files = fetch_rows(cursor)
         
         conn.close()
         return files
     
+    async def search_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /search command"""
+        language = self.templates.language_for(update.effective_user)
+        query_text = " ".join(context.args) if context.args else ""
+        
+        if not self.search_index.parse_terms(query_text):
+            await self.reply(update, self.templates.text('search_usage', language))
+            return
+        
+        # Keep the query for the paging buttons, callback data is too small to carry it
+        context.user_data['search_query'] = query_text
+        text, reply_markup = self.render_search_page(update.effective_user.id, query_text, 0, language)
+        
+        await self.reply(update, text, reply_markup=reply_markup)
+    
+    async def show_search_page(self, update: Update, context: ContextTypes.DEFAULT_TYPE, page: int):
+        """Show another page of the last search for callback queries"""
+        language = self.templates.language_for(update.effective_user)
+        query_text = context.user_data.get('search_query')
+        
+        if not query_text:
+            await self.edit_callback_message(update, self.templates.text('search_expired', language))
+            return
+        
+        text, reply_markup = self.render_search_page(update.effective_user.id, query_text, page, language)
+        await self.edit_callback_message(update, text, reply_markup=reply_markup)
+    
+    def render_search_page(self, user_id: int, query_text: str, page: int, language: str):
+        """Run a search and render one page of results"""
+        page_size = Config.SEARCH_PAGE_SIZE
+        results, has_next = self.search_index.search(user_id, query_text, limit=page_size, offset=page * page_size)
+        return self.templates.search_results(query_text, results, page, has_next, language)
+    
+    async def handle_inline_query(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle inline queries (@bot query) with the user's stored files"""
+        inline_query = update.inline_query
+        user_id = inline_query.from_user.id
+        
+        # Skip queries superseded by a newer keystroke from the same user
+        if not await self.inline_responder.debounced(user_id, inline_query.id):
+            return
+        
+        offset = int(inline_query.offset) if inline_query.offset.isdigit() else 0
+        results, next_offset = await self.inline_responder.results(user_id, inline_query.query, offset)
+        
+        await self.outbound.call(
+            'answer_inline_query',
+            inline_query_id=inline_query.id,
+            results=results,
+            cache_time=Config.INLINE_CACHE_TIME,
+            is_personal=True,
+            next_offset=next_offset
+        )
+    
     async def send_photo_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /send_photo command"""
-        text = """
-📸 برای ارسال عکس، کافیست عکس مورد نظر را ارسال کنید.
-
-همچنین می‌توانید از عکس‌های آپلود شده قبلی استفاده کنید:
-        """
+        language = self.templates.language_for(update.effective_user)
+        text = self.templates.text('send_photo', language)
         
         user_id = update.effective_user.id
-        photos = self.get_user_photos(user_id)
-        
-        if photos:
-            keyboard = []
-            for photo in photos[:5]:  # Show max 5 photos
-                keyboard.append([
-                    InlineKeyboardButton(
-                        f"📸 {photo['file_name']}", 
-                        callback_data=f"send_photo_{photo['file_id']}"
-                    )
-                ])
-            reply_markup = InlineKeyboardMarkup(keyboard)
-        else:
-            reply_markup = None
+        photos = self.get_user_photos(user_id, limit=5)
+        reply_markup = self.templates.photo_list(photos, language, limit=5)
         
-        await update.message.reply_text(text, reply_markup=reply_markup)
+        await self.reply(update, text, reply_markup=reply_markup)
     
-    def get_user_photos(self, user_id):
-        """Get user photos from database"""
-        conn = sqlite3.connect(self.db_path)
+    def get_user_photos(self, user_id, limit: int = -1):
+        """Get user photos from database, newest first; `limit` caps how many"""
+        conn = open_connection(self.db_path)
         cursor = conn.cursor()
         
         cursor.execute('''
             SELECT * FROM files 
             WHERE user_id = ? AND file_type LIKE 'image%' 
-            ORDER BY upload_date DESC
-        ''', (user_id,))
+            ORDER BY upload_date DESC LIMIT ?
+        ''', (user_id, limit))
         
-        results = cursor.fetchall()
-        columns = [description[0] for description in cursor.description]
-        photos = [dict(zip(columns, row)) for row in results]
+        photos = fetch_rows(cursor)
         
         conn.close()
         return photos
     
+    async def gallery_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /gallery command"""
+        await self.send_gallery_page(update, 0)
+    
+    async def send_gallery_page(self, update: Update, page: int):
+        """Send one gallery page as an album of previews, followed by its buttons"""
+        language = self.templates.language_for(update.effective_user)
+        page_size = Config.GALLERY_PAGE_SIZE
+        photos, has_next = self.archive.list_files(page_size, page * page_size,
+                                                   user_id=update.effective_user.id, photos_only=True)
+        
+        media = [item for item in map(self.gallery_preview, photos) if item is not None]
+        if len(media) == 1:
+            await self.outbound.send_photo(update.effective_chat.id, media[0].media)
+        elif media:
+            await self.outbound.send_media_group(update.effective_chat.id, media)
+        
+        text, reply_markup = self.templates.gallery(photos, page, has_next, language)
+        await self.reply(update, text, reply_markup=reply_markup)
+    
+    def gallery_preview(self, photo: dict) -> Optional[InputMediaPhoto]:
+        """Smallest preview of a photo: a Telegram size, else the generated thumbnail"""
+        file_id = preview_file_id(photo['photo_sizes'], Config.THUMBNAIL_SIZE)
+        if file_id:
+            return InputMediaPhoto(file_id)
+        if photo['thumbnail_path'] and os.path.exists(photo['thumbnail_path']):
+            with open(photo['thumbnail_path'], 'rb') as f:
+                return InputMediaPhoto(f.read())
+        if photo['media_kind'] == 'photo':
+            return InputMediaPhoto(photo['telegram_file_id'])
+        return None
+    
+    async def duplicates_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /duplicates command"""
+        language = self.templates.language_for(update.effective_user)
+        if not PREVIEWS_AVAILABLE:
+            await self.reply(update, self.templates.text('duplicates_unavailable', language))
+            return
+        
+        photos = await self.scheduler.run_blocking(self.thumbnails.user_hashes, update.effective_user.id)
+        groups = await self.scheduler.run_blocking(find_near_duplicates, photos, Config.DUPLICATE_MAX_DISTANCE)
+        await self.reply(update, self.templates.duplicates(groups, language))
+    
     async def create_poll_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /create_poll command"""
-        text = """
-📊 برای ایجاد نظرسنجی، لطفاً اطلاعات زیر را ارسال کنید:
-
-فرمت:
-سوال: سوال نظرسنجی شما
-گزینه1: گزینه اول
-گزینه2: گزینه دوم
-گزینه3: گزینه سوم
-...
-
-مثال:
-سوال: بهترین زبان برنامه‌نویسی کدام است؟
-گزینه1: Python
-گزینه2: JavaScript
-گزینه3: Java
-        """
-        await update.message.reply_text(text)
+        text = self.templates.text('create_poll', self.templates.language_for(update.effective_user))
+        await self.reply(update, text)
     
     async def view_database_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /view_database command"""
-        stats = self.get_database_stats()
+        if not await self.require_admin(update):
+            return
+        
+        stats = await self.scheduler.run_blocking(self.get_database_stats)
         
         text = f"""
 🗄️ آمار دیتابیس:
@@ -527,18 +807,13 @@ phone: your_phone_number
 • نظرسنجی‌های فعال: {stats['active_polls']}
         """
         
-        keyboard = [
-            [InlineKeyboardButton("👥 لیست کاربران", callback_data="list_users")],
-            [InlineKeyboardButton("📁 لیست فایل‌ها", callback_data="list_files")],
-            [InlineKeyboardButton("📊 لیست نظرسنجی‌ها", callback_data="list_polls")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        reply_markup = self.templates.keyboard('database', self.templates.language_for(update.effective_user))
         
-        await update.message.reply_text(text, reply_markup=reply_markup)
+        await self.reply(update, text, reply_markup=reply_markup)
     
     def get_database_stats(self):
         """Get database statistics"""
-        conn = sqlite3.connect(self.db_path)
+        conn = open_connection(self.db_path)
         cursor = conn.cursor()
         
         # Get file size
@@ -585,7 +860,10 @@ phone: your_phone_number
     
     async def admin_stats_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /admin_stats command"""
-        stats = self.get_database_stats()
+        if not await self.require_admin(update):
+            return
+        
+        stats = await self.scheduler.run_blocking(self.get_database_stats)
         
         text = f"""
 🔧 آمار مدیریتی:
@@ -603,12 +881,389 @@ phone: your_phone_number
 • وضعیت: ✅ آنلاین
         """
         
-        await update.message.reply_text(text)
+        api_lines = [
+            f"• {method}: {m['calls']} درخواست، میانگین {m['avg'] * 1000:.0f}ms، "
+            f"p95 ≤ {m['p95'] * 1000:.0f}ms، تلاش مجدد {m['retries']}، خطا {m['errors']}"
+            for method, m in sorted(self.outbound.metrics.snapshot().items())
+        ]
+        if api_lines:
+            text = text.rstrip() + "\n\n📡 API تلگرام:\n" + "\n".join(api_lines)
+        
+        await self.reply(update, text)
+    
+    async def analytics_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /analytics command"""
+        if not await self.require_admin(update):
+            return
+        
+        days = Config.ANALYTICS_DEFAULT_DAYS
+        if context.args:
+            if not context.args[0].isdigit() or not 1 <= int(context.args[0]) <= Config.ANALYTICS_MAX_DAYS:
+                await self.reply(update, f"❌ استفاده: /analytics [تعداد روز، ۱ تا {Config.ANALYTICS_MAX_DAYS}]")
+                return
+            days = int(context.args[0])
+        
+        report = self.analytics.recent(days)
+        resolution = "ساعتی" if report['period'] == 'hour' else "روزانه"
+        lines = [f"📈 فعالیت {days} روز اخیر ({resolution}، UTC):"]
+        
+        for metric, trend in report['trends'].items():
+            total = format_value(metric, report['totals'].get(metric, 0))
+            lines.append(f"\n{metric_label(metric)}: {total}\n{sparkline(trend)}")
+        
+        if not report['trends']:
+            lines.append("\n📭 فعالیتی در این بازه ثبت نشده است.")
+        
+        await self.reply(update, "\n".join(lines))
+    
+    async def diag_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /diag command: runtime diagnostics for admins"""
+        if not await self.require_admin(update):
+            return
+        
+        action = context.args[0].lower() if context.args else ''
+        if action == 'profile':
+            await self.diag_profile(update, context.args[1:])
+        elif action == 'tasks':
+            await self.diag_tasks(update)
+        elif action == 'sql':
+            await self.diag_sql(update, context.args[1:])
+        elif not action:
+            await self.reply(update, self.diag_overview())
+        else:
+            await self.reply(update, "❌ استفاده: /diag [profile [ثانیه] | tasks | sql [clear]]")
+    
+    @staticmethod
+    def format_statement(statement: tuple) -> str:
+        """One slow statement from query_log as a line"""
+        when, seconds, sql, thread = statement
+        if len(sql) > Config.DIAG_SQL_CHARS:
+            sql = sql[:Config.DIAG_SQL_CHARS] + "…"
+        clock = datetime.fromtimestamp(when).strftime('%H:%M:%S')
+        return f"• {seconds * 1000:.0f}ms — {sql} ({thread}، {clock})"
+    
+    def diag_overview(self) -> str:
+        """Event-loop lag, task counts and the slowest recent statements"""
+        lines = ["🩺 عیب‌یابی زمان اجرا:"]
+        
+        lag = loop_monitor.summary()
+        if lag:
+            lines.append(
+                f"\n⏱️ تأخیر حلقه رویداد: آخرین {lag['last'] * 1000:.0f}ms | "
+                f"بیشینه ۱ دقیقه {lag['max_1m'] * 1000:.0f}ms | ۵ دقیقه {lag['max_5m'] * 1000:.0f}ms\n"
+                f"میانه {lag['p50'] * 1000:.1f}ms | p99 {lag['p99'] * 1000:.1f}ms ({lag['probes']} نمونه)"
+            )
+        else:
+            lines.append("\n⏱️ تأخیر حلقه رویداد: هنوز نمونه‌ای ثبت نشده است.")
+        
+        lines.append(
+            f"🧵 تسک‌ها: {len(asyncio.all_tasks())} | هندلرهای در حال اجرا: "
+            f"{len(self.handler_tracker.in_flight)} | رشته‌ها: {threading.active_count()}"
+        )
+        if profiler.running:
+            lines.append("🔬 یک پروفایل در حال اجراست.")
+        
+        scheduler = self.scheduler
+        interactive, heavy = scheduler.latency[INTERACTIVE], scheduler.latency[HEAVY]
+        lines.append(
+            f"⚡ درخواست‌های سبک: p50 {interactive.percentile(0.5) * 1000:.0f}ms | "
+            f"p99 {interactive.percentile(0.99) * 1000:.0f}ms (هدف {Config.INTERACTIVE_SLO_MS:.0f}ms، "
+            f"{scheduler.slo_misses} مورد کندتر از {interactive.count}) | "
+            f"هم‌زمانی {scheduler.interactive.running}/{scheduler.interactive.limit}\n"
+            f"🏋️ درخواست‌های سنگین: {scheduler.heavy.active}/{scheduler.heavy.slots} در حال اجرا | "
+            f"{scheduler.heavy.queued()} در صف | p99 {heavy.percentile(0.99):.1f}s | {scheduler.rejected} رد شده"
+        )
+        
+        slowest = query_log.slowest(5)
+        lines.append(f"\n🐢 کندترین کوئری‌های اخیر (≥ {Config.SLOW_QUERY_MS:.0f}ms):")
+        lines.extend(self.format_statement(statement) for statement in slowest)
+        if not slowest:
+            lines.append("موردی ثبت نشده است.")
+        
+        lines.append("\nجزئیات: /diag profile [ثانیه] | /diag tasks | /diag sql [clear]")
+        return "\n".join(lines)
+    
+    async def diag_profile(self, update: Update, args: List[str]):
+        """Start a sampling profile; the result is sent when it ends"""
+        seconds = 10
+        if args:
+            if not args[0].isdigit() or not 1 <= int(args[0]) <= Config.PROFILE_MAX_SECONDS:
+                await self.reply(update, f"❌ استفاده: /diag profile [ثانیه، ۱ تا {Config.PROFILE_MAX_SECONDS}]")
+                return
+            seconds = int(args[0])
+        if profiler.running:
+            await self.reply(update, "⏳ یک پروفایل دیگر در حال اجراست؛ لطفاً صبر کنید.")
+            return
+        
+        await self.reply(update, f"🔬 پروفایل‌گیری به مدت {seconds} ثانیه آغاز شد...")
+        # Not a handler task, so the handler returns and shutdown does not wait for it
+        self.profile_task = asyncio.create_task(self.send_profile(update.effective_chat.id, seconds))
+    
+    async def send_profile(self, chat_id: int, seconds: int):
+        """Run a profile and send the folded stacks with a summary"""
+        try:
+            stacks, samples, _ = await profiler.profile(seconds)
+            hot, busy, total = hot_functions(stacks, limit=5)
+            lines = [f"🔬 پروفایل {seconds} ثانیه: {samples} نمونه",
+                     f"مشغولی حلقه رویداد: {busy * 100 / max(1, total):.0f}%"]
+            for frame, count in hot:
+                lines.append(f"• {count * 100 / max(1, total):.0f}% {frame}")
+            
+            await self.outbound.send_message(chat_id, "\n".join(lines))
+            await self.outbound.send_document(
+                chat_id, folded(stacks),
+                filename=f"profile-{datetime.now():%Y%m%d-%H%M%S}.folded",
+                caption="📎 برای flamegraph.pl یا speedscope.app"
+            )
+        except Exception as e:
+            logger.error("Error running profile: %s", e)
+            await self.outbound.send_message(chat_id, f"❌ خطا در پروفایل‌گیری: {str(e)}")
+        finally:
+            self.profile_task = None
+    
+    async def diag_tasks(self, update: Update):
+        """Send every asyncio task with its stack"""
+        text, counts = dump_tasks()
+        lines = [f"🧵 {sum(counts.values())} تسک:"]
+        lines.extend(f"• {count} × {name}" for name, count in counts.most_common(10))
+        await self.reply(update, "\n".join(lines))
+        await self.outbound.send_document(
+            update.effective_chat.id, text.encode(),
+            filename=f"tasks-{datetime.now():%Y%m%d-%H%M%S}.txt"
+        )
+    
+    async def diag_sql(self, update: Update, args: List[str]):
+        """List the slowest recent statements, or clear them"""
+        if args and args[0].lower() == 'clear':
+            query_log.clear()
+            await self.reply(update, "🧹 فهرست کوئری‌های کند پاک شد.")
+            return
+        
+        slowest = query_log.slowest(Config.DIAG_SQL_LIMIT)
+        if not slowest:
+            await self.reply(update, f"📭 کوئری کندتر از {Config.SLOW_QUERY_MS:.0f}ms ثبت نشده است.")
+            return
+        lines = [f"🐢 {len(slowest)} کوئری کند از {len(query_log.statements)} مورد ثبت‌شده:"]
+        lines.extend(self.format_statement(statement) for statement in slowest)
+        await self.reply(update, "\n".join(lines))
+    
+    @staticmethod
+    def parse_ids(args) -> Optional[List[int]]:
+        """Parse command arguments as numeric IDs; None if any is not a number"""
+        if not args or not all(arg.lstrip('-').isdigit() for arg in args):
+            return None
+        return sorted({int(arg) for arg in args})
+    
+    def render_job(self, job: BulkJob):
+        """Progress or result text of a bulk job, with a cancel button while it runs"""
+        total = f"/{job.total}" if job.total is not None else ""
+        counts = f"✅ موفق: {job.done} | ❌ خطا: {job.failed}"
+        if not job.finished:
+            keyboard = InlineKeyboardMarkup([[
+                InlineKeyboardButton("⛔ لغو", callback_data=f"cancel_job_{job.job_id}")
+            ]])
+            return f"⏳ #{job.job_id} {job.name}: {job.processed}{total}\n{counts}", keyboard
+        
+        if job.error is not None:
+            status = f"❌ متوقف شد: {job.error}"
+        elif job.paused:
+            return (f"⏸️ #{job.job_id} {job.name}: {job.processed}{total}\n{counts}\n"
+                    f"ربات در حال راه‌اندازی مجدد است؛ عملیات پس از آن ادامه می‌یابد."), None
+        elif job.cancelled:
+            status = "⛔ لغو شد"
+        else:
+            status = "✅ کامل شد"
+        elapsed = time.monotonic() - job.started
+        return f"{status} — #{job.job_id} {job.name}\n{counts}\n⏱️ {elapsed:.1f} ثانیه", None
+    
+    async def start_bulk_job(self, update: Update, kind: str, params: dict, name: str, total: Optional[int]):
+        """Start a bulk job and keep a progress message updated until it finishes"""
+        job = self.bulk_jobs.create(name, total, kind, params)
+        text, reply_markup = self.render_job(job)
+        progress = await self.reply(update, text, reply_markup=reply_markup)
+        job.chat_id, job.message_id = progress.chat_id, progress.message_id
+        self.run_bulk_job(job)
+    
+    def run_bulk_job(self, job: BulkJob):
+        """Run a new or resumed bulk job, reporting to its progress message"""
+        fetch, apply = self.bulk_job_steps(job.kind, job.params)
+        
+        async def on_progress(job: BulkJob):
+            text, reply_markup = self.render_job(job)
+            self.outbound.schedule_edit(job.chat_id, job.message_id, text, reply_markup=reply_markup)
+        
+        async def on_finish(job: BulkJob):
+            text, _ = self.render_job(job)
+            await self.outbound.edit_message_text(job.chat_id, job.message_id, text)
+        
+        self.bulk_jobs.start(job, fetch, apply, on_progress, on_finish)
+    
+    def bulk_job_steps(self, kind: str, params: dict):
+        """fetch and apply functions of a bulk job kind
+        
+        Jobs are described by kind and JSON parameters only, so a job paused
+        by a shutdown can be rebuilt on the next start.
+        """
+        if kind == 'set_users_active':
+            user_ids, active = params['user_ids'], params['active']
+            
+            def fetch(after, limit):
+                return [user_id for user_id in user_ids if after is None or user_id > after][:limit]
+            
+            async def apply(chunk):
+                changed = await self.scheduler.run_blocking(self.admin_ops.set_users_active, chunk, active)
+                if active:
+                    self.inactive_users.difference_update(chunk)
+                else:
+                    self.inactive_users.update(chunk)
+                return changed
+        
+        elif kind == 'purge_files':
+            user_id = params['user_id']
+            
+            def fetch(after, limit):
+                return self.admin_ops.user_file_ids_after(user_id, after, limit)
+            
+            async def apply(chunk):
+                deleted = await self.scheduler.run_blocking(self.admin_ops.delete_files, chunk)
+                self.inline_index.invalidate(user_id)
+                return deleted
+        
+        elif kind == 'rebackup_all':
+            fetch = self.admin_ops.files_after
+            
+            async def apply(chunk):
+                succeeded = 0
+                for _, file_data in chunk:
+                    try:
+                        if await self.backup_file_record(file_data):
+                            succeeded += 1
+                    except Exception as e:
+                        logger.error("Error backing up file %s: %s", file_data['file_id'], e)
+                return succeeded
+        
+        elif kind == 'verify_backups':
+            fetch = self.admin_ops.backups_after
+            
+            async def apply(chunk):
+                verified, repaired, _ = await self.verify_and_repair([file_data for _, file_data in chunk])
+                return verified + repaired
+        
+        else:
+            raise ValueError(f"Unknown bulk job kind: {kind}")
+        
+        return fetch, apply
+    
+    async def resume_bulk_jobs(self, lock):
+        """Resume the bulk jobs the previous instance paused when it shut down"""
+        # A predecessor handing over polling may still be draining; it saves its jobs before letting go
+        if not await lock.acquire(Config.HANDOFF_TIMEOUT + Config.SHUTDOWN_DEADLINE):
+            logger.warning("Previous instance still holds %s, not resuming its bulk jobs", lock.path)
+            return
+        
+        for job in await asyncio.to_thread(self.job_store.take, self.bulk_jobs):
+            logger.info("Resuming bulk job %s (%s) after %s", job.job_id, job.name, job.position)
+            if job.chat_id is not None:
+                text, reply_markup = self.render_job(job)
+                self.outbound.schedule_edit(job.chat_id, job.message_id, text, reply_markup=reply_markup)
+            self.run_bulk_job(job)
+    
+    async def deactivate_users_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /deactivate_users command"""
+        await self.set_users_active_command(update, context, active=False)
+    
+    async def activate_users_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /activate_users command"""
+        await self.set_users_active_command(update, context, active=True)
+    
+    async def set_users_active_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE, active: bool):
+        """Activate or deactivate the given users in chunks"""
+        if not await self.require_admin(update):
+            return
+        
+        command = "activate_users" if active else "deactivate_users"
+        user_ids = self.parse_ids(context.args)
+        if user_ids is None:
+            await self.reply(update, f"❌ لطفاً شناسه کاربران را وارد کنید.\nمثال: /{command} 123 456")
+            return
+        
+        user_ids = await self.scheduler.run_blocking(self.admin_ops.existing_users, user_ids)
+        if not user_ids:
+            await self.reply(update, "❌ کاربری با این شناسه‌ها یافت نشد.")
+            return
+        
+        name = "فعال‌سازی کاربران" if active else "غیرفعال‌سازی کاربران"
+        await self.start_bulk_job(update, 'set_users_active', {'user_ids': user_ids, 'active': active},
+                                  name, len(user_ids))
+    
+    async def purge_files_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /purge_files command: delete all of a user's files, hot and archived"""
+        if not await self.require_admin(update):
+            return
+        
+        user_ids = self.parse_ids(context.args)
+        if user_ids is None or len(user_ids) != 1:
+            await self.reply(update, "❌ لطفاً شناسه یک کاربر را وارد کنید.\nمثال: /purge_files 123")
+            return
+        
+        user_id = user_ids[0]
+        total = await self.scheduler.run_blocking(self.admin_ops.count_user_files, user_id)
+        if not total:
+            await self.reply(update, "📭 این کاربر فایلی ندارد.")
+            return
+        
+        await self.start_bulk_job(update, 'purge_files', {'user_id': user_id},
+                                  f"حذف فایل‌های کاربر {user_id}", total)
+    
+    async def rebackup_all_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /rebackup_all command: back up every stored file again"""
+        if not await self.require_admin(update):
+            return
+        
+        total = await self.scheduler.run_blocking(self.admin_ops.count_files)
+        if not total:
+            await self.reply(update, "📭 هیچ فایلی برای بکاپ وجود ندارد.")
+            return
+        
+        await self.start_bulk_job(update, 'rebackup_all', {}, "بکاپ مجدد همه فایل‌ها", total)
+    
+    async def jobs_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /jobs command: list recent bulk jobs"""
+        if not await self.require_admin(update):
+            return
+        
+        if not self.bulk_jobs.jobs:
+            await self.reply(update, "📭 هیچ عملیات گروهی‌ای ثبت نشده است.")
+            return
+        
+        lines = ["🛠️ عملیات گروهی:"]
+        for job in self.bulk_jobs.jobs.values():
+            text, _ = self.render_job(job)
+            lines.append(f"\n{text}")
+        await self.reply(update, "\n".join(lines))
+    
+    async def cancel_job_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /cancel_job command"""
+        if not await self.require_admin(update):
+            return
+        
+        job_ids = self.parse_ids(context.args)
+        if job_ids is None or len(job_ids) != 1:
+            await self.reply(update, "❌ لطفاً شناسه عملیات را وارد کنید.\nمثال: /cancel_job 1")
+            return
+        await self.cancel_job(update, job_ids[0])
+    
+    async def cancel_job(self, update: Update, job_id: int):
+        """Cancel a bulk job after its current chunk; the caller checks the sender is an admin"""
+        if self.bulk_jobs.cancel(job_id):
+            await self.reply(update, f"⛔ عملیات #{job_id} پس از بخش جاری متوقف می‌شود.")
+        else:
+            await self.reply(update, f"❌ عملیات در حال اجرای #{job_id} یافت نشد.")
     
     async def handle_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle callback queries"""
         query = update.callback_query
-        await query.answer()
+        await self.outbound.answer_callback_query(query.id)
         
         if query.data == "profile":
             await self.profile_command(update, context)
@@ -620,6 +1275,18 @@ phone: your_phone_number
             await self.view_database_command(update, context)
         elif query.data == "edit_profile":
             await self.show_edit_profile_options(update, context)
+        elif query.data.startswith("cancel_job_"):
+            if await self.require_admin(update):
+                await self.cancel_job(update, int(query.data.split("_")[2]))
+        elif query.data.startswith("files_page_"):
+            page = int(query.data.split("_")[2])
+            await self.show_files_page(update, context, page)
+        elif query.data.startswith("gallery_page_"):
+            page = int(query.data.split("_")[2])
+            await self.send_gallery_page(update, page)
+        elif query.data.startswith("search_page_"):
+            page = int(query.data.split("_")[2])
+            await self.show_search_page(update, context, page)
         elif query.data.startswith("send_photo_"):
             file_id = query.data.split("_")[2]
             await self.send_stored_photo(update, context, file_id)
@@ -629,207 +1296,444 @@ phone: your_phone_number
         elif query.data.startswith("delete_"):
             file_id = query.data.split("_")[1]
             await self.delete_file(update, context, file_id)
+        elif query.data == "backup_all":
+            await self.backup_all_files(update, context)
         elif query.data.startswith("backup_"):
             file_id = query.data.split("_")[1]
             await self.backup_single_file(update, context, file_id)
-        elif query.data == "backup_all":
-            await self.backup_all_files(update, context)
+    
+    def get_file_record(self, user_id: int, file_id: str):
+        """Find one of the user's files, hot or archived, by database ID or Telegram file ID"""
+        conn = open_connection(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT * FROM files
+            WHERE user_id = ? AND (file_id = ? OR telegram_file_id = ?)
+        ''', (user_id, file_id, file_id))
+        file_data = fetch_row(cursor)
+        
+        conn.close()
+        
+        if file_data is None:
+            file_data = self.archive.get_user_file(user_id, file_id)
+        return file_data
     
     async def send_stored_photo(self, update: Update, context: ContextTypes.DEFAULT_TYPE, file_id: str):
         """Send a stored photo"""
         try:
-            await context.bot.send_photo(
-                chat_id=update.effective_chat.id,
-                photo=file_id,
+            file_data = self.get_file_record(update.effective_user.id, file_id)
+            if not file_data:
+                await self.reply(update, "❌ فایل یافت نشد.")
+                return
+            
+            await self.outbound.send_photo(
+                update.effective_chat.id,
+                file_data['telegram_file_id'],
                 caption="📸 عکس ارسال شده از گالری شما"
             )
         except Exception as e:
-            await query.edit_message_text(f"❌ خطا در ارسال عکس: {str(e)}")
-    
+            logger.error("Error sending photo %s: %s", file_id, e)
+            await self.reply(update, f"❌ خطا در ارسال عکس: {str(e)}")
     
     async def download_file(self, update: Update, context: ContextTypes.DEFAULT_TYPE, file_id: str):
         """Download a file"""
         try:
-            # Get file info from database
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute('SELECT * FROM files WHERE telegram_file_id = ?', (file_id,))
-            file_data = cursor.fetchone()
-            conn.close()
-            
+            file_data = self.get_file_record(update.effective_user.id, file_id)
             if not file_data:
-                await update.callback_query.answer("❌ فایل یافت نشد.")
+                await self.reply(update, "❌ فایل یافت نشد.")
                 return
             
             # Send the file
-            await context.bot.send_document(
-                chat_id=update.effective_chat.id,
-                document=file_id,
-                caption=f"📥 {file_data[2]}"  # file_name
+            await self.outbound.send_document(
+                update.effective_chat.id,
+                file_data['telegram_file_id'],
+                caption=f"📥 {file_data['file_name']}"
             )
             
-            await update.callback_query.answer("✅ فایل ارسال شد!")
-            
         except Exception as e:
-            await update.callback_query.answer(f"❌ خطا در دانلود فایل: {str(e)}")
+            logger.error("Error sending file %s: %s", file_id, e)
+            await self.reply(update, f"❌ خطا در دانلود فایل: {str(e)}")
     
     async def delete_file(self, update: Update, context: ContextTypes.DEFAULT_TYPE, file_id: str):
         """Delete a file from database"""
+        user_id = update.effective_user.id
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = open_connection(self.db_path)
             cursor = conn.cursor()
-            cursor.execute('DELETE FROM files WHERE telegram_file_id = ?', (file_id,))
+            cursor.execute('''
+                DELETE FROM files
+                WHERE user_id = ? AND (file_id = ? OR telegram_file_id = ?)
+                RETURNING user_id, file_size
+            ''', (user_id, file_id, file_id))
+            rows = cursor.fetchall()
+            deleted = len(rows)
+            release_usage(cursor, rows)
             conn.commit()
             conn.close()
             
-            await update.callback_query.answer("✅ فایل حذف شد.")
+            if not deleted:
+                deleted = self.archive.delete_user_file(user_id, file_id)
+            
+            self.inline_index.invalidate(user_id)
+            
+            await self.reply(update, "✅ فایل حذف شد." if deleted else "❌ فایل یافت نشد.")
             
         except Exception as e:
-            await update.callback_query.answer(f"❌ خطا در حذف فایل: {str(e)}")
+            logger.error("Error deleting file %s: %s", file_id, e)
+            await self.reply(update, f"❌ خطا در حذف فایل: {str(e)}")
     
     async def backup_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /backup command"""
         user_id = update.effective_user.id
-        files = self.get_user_files(user_id)
-        
-        if not files:
-            await update.message.reply_text("📭 هیچ فایلی برای بکاپ وجود ندارد.")
-            return
+        files = self.get_user_files(user_id, limit=10)
         
-        text = "💾 انتخاب فایل برای بکاپ:\n\n"
-        keyboard = []
+        text, reply_markup = self.templates.backup_list(files, self.templates.language_for(update.effective_user), limit=10)
         
-        for i, file in enumerate(files[:10], 1):  # Limit to 10 files
-            text += f"{i}. 📄 {file['file_name']}\n"
-            keyboard.append([
-                InlineKeyboardButton(
-                    f"💾 بکاپ {file['file_name'][:15]}...",
-                    callback_data=f"backup_{file['file_id']}"
-                )
-            ])
-        
-        keyboard.append([InlineKeyboardButton("💾 بکاپ همه فایل‌ها", callback_data="backup_all")])
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await update.message.reply_text(text, reply_markup=reply_markup)
+        await self.reply(update, text, reply_markup=reply_markup)
     
     async def backup_file_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /backup_file command with file ID"""
         if not context.args:
-            await update.message.reply_text("❌ لطفاً شناسه فایل را وارد کنید.\nمثال: /backup_file <file_id>")
+            await self.reply(update, "❌ لطفاً شناسه فایل را وارد کنید.\nمثال: /backup_file <file_id>")
             return
         
         file_id = context.args[0]
         await self.backup_single_file(update, context, file_id)
     
-    async def backup_single_file(self, update: Update, context: ContextTypes.DEFAULT_TYPE, file_id: str):
-        """Backup a single file"""
+    async def backup_single_file(self, update: Update, context: ContextTypes.DEFAULT_TYPE, file_id: str,
+                                 notify: bool = True) -> bool:
+        """Backup a single file; returns whether it succeeded"""
         try:
             # Get file info from database
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute('SELECT * FROM files WHERE telegram_file_id = ?', (file_id,))
-            file_data = cursor.fetchone()
-            conn.close()
+            file_data = self.get_file_record(update.effective_user.id, file_id)
             
             if not file_data:
-                if hasattr(update, 'callback_query') and update.callback_query:
-                    await update.callback_query.answer("❌ فایل یافت نشد.")
-                else:
-                    await update.message.reply_text("❌ فایل یافت نشد.")
-                return
-            
-            # Get file from Telegram
-            file_info = await context.bot.get_file(file_id)
-            file_url = file_info.file_path
-            
-            # Download file
-            response = requests.get(f"https://api.telegram.org/file/bot{self.token}/{file_url}")
-            if response.status_code != 200:
-                if hasattr(update, 'callback_query') and update.callback_query:
-                    await update.callback_query.answer("❌ خطا در دانلود فایل از تلگرام.")
-                else:
-                    await update.message.reply_text("❌ خطا در دانلود فایل از تلگرام.")
-                return
+                if notify:
+                    await self.reply(update, "❌ فایل یافت نشد.")
+                return False
             
-            # Create backup directory
-            backup_dir = "/app/backups/files"
-            os.makedirs(backup_dir, exist_ok=True)
+            result = await self.backup_file_record(file_data)
+            if result is None:
+                if notify:
+                    await self.reply(update, "❌ خطا در دانلود فایل از تلگرام.")
+                return False
             
-            # Save file
-            file_name = file_data[2]  # file_name
-            safe_filename = "".join(c for c in file_name if c.isalnum() or c in "._- ")
-            backup_path = os.path.join(backup_dir, f"{file_id}_{safe_filename}")
-            
-            with open(backup_path, 'wb') as f:
-                f.write(response.content)
-            
-            # Update database with backup info
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute('''
-                UPDATE files 
-                SET backup_path = ?, backup_date = ?
-                WHERE telegram_file_id = ?
-            ''', (backup_path, datetime.now().isoformat(), file_id))
-            conn.commit()
-            conn.close()
+            backup_path, size = result
+            if notify:
+                await self.reply(
+                    update,
+                    f"✅ فایل با موفقیت بکاپ شد!\n"
+                    f"📄 نام فایل: {file_data['file_name'] or file_data['file_id']}\n"
+                    f"💾 مسیر بکاپ: {backup_path}\n"
+                    f"📊 حجم: {size} بایت"
+                )
+            return True
             
-            success_message = (
-                f"✅ فایل با موفقیت بکاپ شد!\n"
-                f"📄 نام فایل: {file_name}\n"
-                f"💾 مسیر بکاپ: {backup_path}\n"
-                f"📊 حجم: {len(response.content)} بایت"
+        except Exception as e:
+            logger.error("Error backing up file %s: %s", file_id, e)
+            if notify:
+                await self.reply(update, f"❌ خطا در بکاپ فایل: {str(e)}")
+            return False
+    
+    async def backup_file_record(self, file_data: dict):
+        """Download a stored file into the backup directory; returns (path, size), or None if the download failed
+        
+        A partial download left by an earlier attempt is resumed. The file only
+        appears at its final path, with its checksum recorded, once complete.
+        """
+        telegram_file_id = file_data['telegram_file_id']
+        
+        # Get file from Telegram; file_path is already the full download URL
+        file_info = await self.outbound.call('get_file', file_id=telegram_file_id)
+        file_url = file_info.file_path
+        
+        # Create backup directory
+        backup_dir = self.backup_dir
+        os.makedirs(backup_dir, exist_ok=True)
+        
+        file_name = file_data['file_name'] or str(file_data['file_id'])
+        safe_filename = "".join(c for c in file_name if c.isalnum() or c in "._- ")
+        backup_path = os.path.join(backup_dir, f"{telegram_file_id}_{safe_filename}")
+        
+        # Download file
+        try:
+            size, checksum = await self.scheduler.run_blocking(
+                download_resumable, file_url, backup_path, file_info.file_size, abort=self.transfers_aborted
             )
+        except TransferError as e:
+            logger.warning("Backup of file %s failed: %s", file_data['file_id'], e)
+            return None
+        
+        # Update database with backup info, in the archive for an archived file
+        self.archive.record_backup(file_data['file_id'], backup_path, size, checksum)
+        
+        if (file_data['file_type'] or '').startswith('image/'):
+            self.thumbnails.wake()
+        
+        return backup_path, size
+    
+    async def verify_backups_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /verify_backups command: check backups against their checksums and repair damaged ones"""
+        if context.args and context.args[0] == "all":
+            await self.verify_all_backups(update)
+            return
+        
+        files = await self.scheduler.run_blocking(self.get_user_files, update.effective_user.id, backed_up=True)
+        if not files:
+            await self.reply(update, "📭 هیچ فایل بکاپ‌شده‌ای وجود ندارد.")
+            return
+        
+        progress = await self.reply(update, "⏳ در حال بررسی صحت بکاپ‌ها... لطفاً صبر کنید.")
+        verified, repaired, failed = await self.verify_and_repair(files)
+        
+        await self.outbound.edit_message_text(
+            progress.chat_id,
+            progress.message_id,
+            f"🔍 بررسی بکاپ‌ها کامل شد!\n"
+            f"✅ سالم: {verified} فایل\n"
+            f"🛠️ ترمیم شده: {repaired} فایل\n"
+            f"❌ ناموفق: {failed} فایل"
+        )
+    
+    async def verify_all_backups(self, update: Update):
+        """Verify and repair every backup as an admin bulk job"""
+        if not await self.require_admin(update):
+            return
+        
+        total = await self.scheduler.run_blocking(self.admin_ops.count_backups)
+        if not total:
+            await self.reply(update, "📭 هیچ فایل بکاپ‌شده‌ای وجود ندارد.")
+            return
+        
+        await self.start_bulk_job(update, 'verify_backups', {}, "بررسی صحت همه بکاپ‌ها", total)
+    
+    async def verify_and_repair(self, files: List[dict]):
+        """Re-hash backups and download missing or corrupted ones again; returns (verified, repaired, failed)"""
+        verified = repaired = failed = 0
+        adopted = []
+        
+        for file_data, status, checksum in await self.verifier.verify(files, abort=self.transfers_aborted):
+            if status == VERIFIED:
+                verified += 1
+                if not file_data['backup_sha256']:
+                    # Backed up before checksums were recorded; its size matched
+                    adopted.append((checksum, file_data['file_id']))
+                continue
             
-            if hasattr(update, 'callback_query') and update.callback_query:
-                await update.callback_query.answer(success_message)
-            else:
-                await update.message.reply_text(success_message)
-            
-        except Exception as e:
-            error_message = f"❌ خطا در بکاپ فایل: {str(e)}"
-            if hasattr(update, 'callback_query') and update.callback_query:
-                await update.callback_query.answer(error_message)
+            if self.transfers_aborted.is_set():
+                # Shutting down: a download now would stop at once, so the rest wait for the next run
+                break
+            logger.warning("Backup of file %s is %s, downloading it again", file_data['file_id'], status)
+            try:
+                result = await self.backup_file_record(file_data)
+            except Exception as e:
+                logger.error("Error repairing backup of file %s: %s", file_data['file_id'], e)
+                result = None
+            if result:
+                repaired += 1
             else:
-                await update.message.reply_text(error_message)
+                failed += 1
+        
+        if adopted:
+            conn = open_connection(self.db_path)
+            conn.executemany('UPDATE files SET backup_sha256 = ? WHERE file_id = ? AND backup_sha256 IS NULL', adopted)
+            conn.commit()
+            conn.close()
+        
+        return verified, repaired, failed
     
     async def backup_all_files(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Backup all user files"""
         user_id = update.effective_user.id
-        files = self.get_user_files(user_id)
+        files = await self.scheduler.run_blocking(self.get_user_files, user_id)
         
         if not files:
-            await update.callback_query.answer("📭 هیچ فایلی برای بکاپ وجود ندارد.")
+            await self.reply(update, "📭 هیچ فایلی برای بکاپ وجود ندارد.")
             return
         
-        await update.callback_query.answer("⏳ در حال بکاپ فایل‌ها... لطفاً صبر کنید.")
+        progress = await self.reply(update, "⏳ در حال بکاپ فایل‌ها... لطفاً صبر کنید.")
         
         success_count = 0
         error_count = 0
         
-        for file in files:
-            try:
-                await self.backup_single_file(update, context, file['file_id'])
-                success_count += 1
-            except Exception as e:
-                error_count += 1
-                logger.error(f"Error backing up file {file['file_id']}: {str(e)}")
+        try:
+            for index, file in enumerate(files, 1):
+                if await self.backup_single_file(update, context, str(file['file_id']), notify=False):
+                    success_count += 1
+                else:
+                    error_count += 1
+                
+                # Progress edits are coalesced, so a fast loop does not flood the chat
+                self.outbound.schedule_edit(
+                    progress.chat_id,
+                    progress.message_id,
+                    f"⏳ در حال بکاپ فایل‌ها... {index}/{len(files)}"
+                )
+        except asyncio.CancelledError:
+            # Stopped at the shutdown deadline; finished backups are kept
+            self.outbound.schedule_edit(
+                progress.chat_id,
+                progress.message_id,
+                f"⚠️ بکاپ به دلیل راه‌اندازی مجدد ربات متوقف شد.\n"
+                f"✅ موفق: {success_count} فایل\n"
+                f"❌ خطا: {error_count} فایل\n"
+                f"لطفاً دوباره تلاش کنید."
+            )
+            raise
         
         final_message = (
             f"✅ بکاپ کامل شد!\n"
             f"✅ موفق: {success_count} فایل\n"
             f"❌ خطا: {error_count} فایل"
         )
-        await update.callback_query.answer(final_message)
+        await self.outbound.edit_message_text(progress.chat_id, progress.message_id, final_message)
     
-    def run(self):
+    def run(self, handoff: bool = False):
         """Start the bot"""
         logger.info("Starting Telegram Bot...")
-        self.application.run_polling(allowed_updates=Update.ALL_TYPES)
+        asyncio.run(self.serve(handoff))
+    
+    async def serve(self, handoff: bool = False, stop: Optional[asyncio.Event] = None):
+        """Poll for updates until SIGTERM/SIGINT or a hand-off request, then shut down gracefully
+        
+        With `handoff`, a running instance is asked to stop polling once
+        this one is initialized, instead of refusing to start. Bots hosted
+        together each pass their own `stop` event, which the host sets on a
+        signal; a hand-off request sets only this bot's event.
+        """
+        handover = HandOff(self.handoff_dir)
+        if not handover.polling.try_acquire() and not handoff:
+            logger.error("Another instance is polling bot %s (%s); start with --handoff to take over",
+                         self.bot_id, handover.polling.path)
+            return
+        
+        loop = asyncio.get_running_loop()
+        signals = ()
+        if stop is None:
+            stop = asyncio.Event()
+            signals = (signal.SIGTERM, signal.SIGINT)
+            for signum in signals:
+                loop.add_signal_handler(signum, stop.set)
+        
+        application = self.application
+        await application.initialize()
+        
+        if not handover.polling.held:
+            # Initialized and connected; only now make the running instance let go
+            logger.info("Asking the running instance to hand over polling of bot %s", self.bot_id)
+            handover.request()
+            if not await handover.polling.acquire(Config.HANDOFF_TIMEOUT):
+                handover.clear_request()
+                logger.error("Running instance did not hand over polling of bot %s within %ss",
+                             self.bot_id, Config.HANDOFF_TIMEOUT)
+                await application.shutdown()
+                return
+        handover.clear_request()
+        
+        await application.start()
+        await application.updater.start_polling(allowed_updates=Update.ALL_TYPES)
+        await self.post_init(application)
+        self.resume_task = asyncio.create_task(self.resume_bulk_jobs(handover.jobs))
+        logger.info("Bot %s polling for updates", self.bot_id)
+        
+        watcher = asyncio.create_task(self.watch_handoff(handover, stop))
+        await stop.wait()
+        watcher.cancel()
+        for signum in signals:
+            loop.remove_signal_handler(signum)
+        await self.shutdown(handover)
+    
+    async def watch_handoff(self, handover: HandOff, stop: asyncio.Event):
+        """Stop when a new instance asks to take over polling"""
+        while not handover.requested():
+            await asyncio.sleep(Config.HANDOFF_CHECK_INTERVAL)
+        logger.info("New instance is taking over polling of bot %s", self.bot_id)
+        stop.set()
+    
+    async def shutdown(self, handover: HandOff):
+        """Stop intake, let in-flight work finish until the deadline and save unfinished bulk jobs"""
+        application = self.application
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + Config.SHUTDOWN_DEADLINE
+        
+        def remaining() -> float:
+            return max(0.0, deadline - loop.time())
+        
+        logger.info("Bot %s shutting down, draining in-flight work for up to %ss", self.bot_id, Config.SHUTDOWN_DEADLINE)
+        # No new updates; the ones already fetched are confirmed to Telegram and handled below
+        await application.updater.stop()
+        handover.polling.release()
+        
+        if self.resume_task is not None:
+            self.resume_task.cancel()
+        pausing = asyncio.create_task(self.bulk_jobs.pause_all(remaining()))
+        
+        try:
+            await asyncio.wait_for(application.update_queue.join(), remaining())
+        except asyncio.TimeoutError:
+            cancelled = self.handler_tracker.cancel_all()
+            logger.warning("Cancelled %d handlers still running at the shutdown deadline", cancelled)
+            await application.update_queue.join()
+        
+        # Uploads waiting for their batch window are stored now
+        await self.upload_batcher.flush_all()
+        
+        saved = await asyncio.to_thread(self.job_store.save, await pausing)
+        handover.jobs.release()
+        if saved:
+            logger.info("Saved %d unfinished bulk jobs for the next start", saved)
+        
+        # Downloads still running belong to cancelled work; their .part files resume later
+        self.transfers_aborted.set()
+        
+        # Replies, including interruption notices, get at least a moment past the deadline
+        if not await self.outbound.drain(max(remaining(), 1.0)):
+            logger.warning("Shutting down with %d replies unsent", self.outbound.queued)
+        
+        await application.stop()
+        await self.post_stop(application)
+        await application.shutdown()
+        logger.info("Bot %s shut down", self.bot_id)
+
+async def serve_tenants(tenants: List[Tenant], handoff: bool = False):
+    """Host several bots in this process until SIGTERM/SIGINT or a hand-off request"""
+    shared = SharedResources(len(tenants))
+    bots = [TelegramBot(tenant.token, tenant=tenant, shared=shared) for tenant in tenants]
+    
+    # One event per bot: a hand-off of one token must not stop the others
+    stops = [asyncio.Event() for _ in bots]
+    
+    def stop_all():
+        for stop in stops:
+            stop.set()
+    
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, stop_all)
+    
+    logger.info("Hosting %d bots", len(bots))
+    try:
+        results = await asyncio.gather(*(bot.serve(handoff, stop) for bot, stop in zip(bots, stops)),
+                                       return_exceptions=True)
+        for tenant, result in zip(tenants, results):
+            if isinstance(result, Exception):
+                logger.error("Bot %s stopped with an error", tenant.bot_id, exc_info=result)
+    finally:
+        shared.shutdown()
 
 def main():
     """Main function"""
+    parser = argparse.ArgumentParser(description="Telegram Bot")
+    parser.add_argument('--handoff', action='store_true',
+                        help="take over polling from a running instance once started (zero-downtime restart)")
+    args = parser.parse_args()
+    
+    # Several tokens: host them all in this process
+    if Config.BOT_TOKENS:
+        setup_logging()
+        asyncio.run(serve_tenants(tenants_from_config(), handoff=args.handoff))
+        return
+    
     # Get bot token from environment variable
     bot_token = os.getenv('TELEGRAM_BOT_TOKEN')
     
@@ -838,9 +1742,11 @@ def main():
         print("مثال: export TELEGRAM_BOT_TOKEN='your_bot_token_here'")
         return
     
+    setup_logging()
+    
     # Create and run bot
     bot = TelegramBot(bot_token)
-    bot.run()
+    bot.run(handoff=args.handoff)
 
 if __name__ == '__main__':
     main()
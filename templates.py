@@ -0,0 +1,552 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Message templates and prebuilt keyboards for Telegram Bot
+"""
+
+import mimetypes
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from config import Config
+
+# Static screens per language. Screens with placeholders are rendered with
+# str.format, everything else is sent exactly as stored here.
+STRINGS: Dict[str, Dict[str, str]] = {
+    'fa': {
+        'welcome': """🤖 سلام {first_name}! به ربات تلگرام خوش آمدید!
+
+این ربات دارای قابلیت‌های زیر است:
+• 📝 مدیریت پروفایل کاربری
+• 📁 آپلود و دانلود فایل
+• 📸 ارسال عکس
+• 📊 ایجاد نظرسنجی
+• 🗄️ مشاهده دیتابیس
+
+برای شروع از دستور /help استفاده کنید.""",
+        'help': """📋 لیست دستورات ربات:
+
+👤 مدیریت پروفایل:
+/profile - مشاهده پروفایل
+/update_profile - به‌روزرسانی پروفایل
+
+📁 مدیریت فایل:
+/upload - آپلود فایل
+/download - دانلود فایل
+/my_files - مشاهده فایل‌های من
+/quota - فضای مصرفی و سهمیه شما
+/search - جستجو در فایل‌ها و نظرسنجی‌ها
+
+📸 عکس:
+/send_photo - ارسال عکس
+/gallery - گالری عکس‌ها
+/duplicates - یافتن عکس‌های تقریباً تکراری
+
+📊 نظرسنجی:
+/create_poll - ایجاد نظرسنجی جدید
+
+🗄️ دیتابیس:
+/view_database - مشاهده اطلاعات دیتابیس
+/admin_stats - آمار کلی (برای ادمین)
+/analytics - روند فعالیت (برای ادمین)
+/diag - عیب‌یابی زمان اجرا: پروفایل، تسک‌ها، کوئری‌های کند (برای ادمین)
+/jobs - عملیات گروهی ادمین: /deactivate_users، /purge_files، /rebackup_all
+
+💡 نکته: می‌توانید فایل‌ها و عکس‌ها را مستقیماً ارسال کنید!""",
+        'update_profile': """✏️ برای به‌روزرسانی پروفایل، لطفاً اطلاعات زیر را ارسال کنید:
+
+📧 ایمیل: example@email.com
+📱 شماره تلفن: 09123456789
+
+فرمت:
+email: your_email@example.com
+phone: your_phone_number""",
+        'upload': """📁 برای آپلود فایل، کافیست فایل مورد نظر را ارسال کنید.
+
+انواع فایل مجاز: {file_types}""",
+        'send_photo': """📸 برای ارسال عکس، کافیست عکس مورد نظر را ارسال کنید.
+
+همچنین می‌توانید از عکس‌های آپلود شده قبلی استفاده کنید:""",
+        'create_poll': """📊 برای ایجاد نظرسنجی، لطفاً اطلاعات زیر را ارسال کنید:
+
+فرمت:
+سوال: سوال نظرسنجی شما
+گزینه1: گزینه اول
+گزینه2: گزینه دوم
+گزینه3: گزینه سوم
+...
+
+مثال:
+سوال: بهترین زبان برنامه‌نویسی کدام است؟
+گزینه1: Python
+گزینه2: JavaScript
+گزینه3: Java""",
+        'my_files_header': "📁 فایل‌های شما:\n",
+        'my_files_entry': "{index}. 📄 {file_name}\n   📊 حجم: {file_size} بایت\n   📅 تاریخ: {upload_date}\n",
+        'no_files': "📭 هیچ فایلی آپلود نکرده‌اید.",
+        'backup_header': "💾 انتخاب فایل برای بکاپ:\n",
+        'backup_entry': "{index}. 📄 {file_name}",
+        'no_backup_files': "📭 هیچ فایلی برای بکاپ وجود ندارد.",
+        'btn_profile': "📝 پروفایل من",
+        'btn_my_files': "📁 فایل‌های من",
+        'btn_create_poll': "📊 ایجاد نظرسنجی",
+        'btn_view_db': "🗄️ مشاهده دیتابیس",
+        'btn_edit_profile': "✏️ ویرایش پروفایل",
+        'btn_list_users': "👥 لیست کاربران",
+        'btn_list_files': "📁 لیست فایل‌ها",
+        'btn_list_polls': "📊 لیست نظرسنجی‌ها",
+        'btn_download': "📥 دانلود {name}...",
+        'btn_delete': "🗑️ حذف {name}...",
+        'btn_backup': "💾 بکاپ {name}...",
+        'btn_backup_all': "💾 بکاپ همه فایل‌ها",
+        'btn_photo': "📸 {name}",
+        'btn_gallery_photo': "📸 {index}",
+        'gallery_header': "🖼️ گالری عکس‌ها (صفحه {page}):\n",
+        'gallery_entry': "{index}. 📸 {file_name}",
+        'no_photos': "📭 هیچ عکسی آپلود نکرده‌اید.",
+        'duplicates_header': "🧬 عکس‌های تقریباً تکراری:\n",
+        'duplicates_group': "{index}. {names}",
+        'no_duplicates': "✅ عکس تکراری‌ای یافت نشد.\n(فقط عکس‌های بکاپ‌شده بررسی می‌شوند.)",
+        'duplicates_unavailable': "⚠️ تشخیص عکس‌های تکراری روی این سرور فعال نیست.",
+        'search_usage': "🔍 لطفاً عبارت جستجو را وارد کنید.\nمثال: /search گزارش",
+        'search_header': "🔍 نتایج جستجو برای «{query}» (صفحه {page}):\n",
+        'search_file_entry': "{index}. 📄 {title}\n   🏷️ نوع: {detail}",
+        'search_poll_entry': "{index}. 📊 {title}",
+        'search_no_results': "📭 نتیجه‌ای برای «{query}» یافت نشد.",
+        'search_expired': "⌛ جستجو منقضی شده است. لطفاً دوباره /search را اجرا کنید.",
+        'btn_prev': "◀️ قبلی",
+        'btn_next': "بعدی ▶️",
+        'upload_document_done': "✅ فایل با موفقیت آپلود شد!\n📄 نام فایل: {file_name}\n📊 حجم: {file_size} بایت\n🔗 شناسه فایل: {telegram_file_id}",
+        'upload_photo_done': "📸 عکس با موفقیت آپلود شد!\n📊 حجم: {file_size} بایت\n🔗 شناسه فایل: {telegram_file_id}",
+        'upload_batch_done': "✅ {count} فایل با موفقیت آپلود شد!\n📊 حجم کل: {total_size} بایت",
+        'upload_batch_rejected': "❌ {count} فایل پذیرفته نشد:",
+        'upload_rejected_entry': "• {file_name}: {reason}",
+        'reject_too_large': "حجم بیش از {max_size} مگابایت",
+        'reject_type_not_allowed': "نوع فایل مجاز نیست ({file_type})",
+        'reject_unknown_type': "نوع فایل مشخص نیست",
+        'reject_over_quota': "سهمیه فضای شما پر است (/quota)",
+        'quota_status': "💾 فضای ذخیره‌سازی شما:\n📊 حجم: {used} از {max_size}\n📁 تعداد فایل: {files} از {max_files}",
+        'quota_unlimited': "نامحدود",
+        'quota_admin_usage': "❌ استفاده:\n/quota <شناسه کاربر> - مشاهده سهمیه کاربر\n"
+                             "/quota <شناسه کاربر> <مگابایت> [تعداد فایل] - تعیین سهمیه (۰ = نامحدود)\n"
+                             "/quota <شناسه کاربر> default - بازگشت به سهمیه پیش‌فرض\n"
+                             "/quota top - پرمصرف‌ترین کاربران\n"
+                             "/quota recount - محاسبه دوباره مصرف همه کاربران",
+        'quota_top_header': "💾 پرمصرف‌ترین کاربران:",
+        'quota_top_entry': "• {user_id}: {used} از {max_size} | {files} فایل{overridden}",
+        'quota_top_overridden': " (سهمیه اختصاصی)",
+        'quota_recounted': "✅ مصرف {users} کاربر دوباره محاسبه شد.",
+        'quota_user_header': "👤 کاربر {user_id} (سهمیه {kind}):",
+        'quota_kind_overridden': "اختصاصی",
+        'quota_kind_default': "پیش‌فرض",
+    },
+    'en': {
+        'welcome': """🤖 Hi {first_name}! Welcome to the Telegram bot!
+
+This bot can help you with:
+• 📝 Managing your profile
+• 📁 Uploading and downloading files
+• 📸 Sending photos
+• 📊 Creating polls
+• 🗄️ Viewing the database
+
+Use /help to get started.""",
+        'help': """📋 Bot commands:
+
+👤 Profile:
+/profile - View your profile
+/update_profile - Update your profile
+
+📁 Files:
+/upload - Upload a file
+/download - Download a file
+/my_files - View my files
+/quota - Your storage usage and quota
+/search - Search your files and polls
+
+📸 Photos:
+/send_photo - Send a photo
+/gallery - Photo gallery
+/duplicates - Find near-duplicate photos
+
+📊 Polls:
+/create_poll - Create a new poll
+
+🗄️ Database:
+/view_database - View database information
+/admin_stats - Overall statistics (admins)
+/analytics - Activity trends (admins)
+/diag - Runtime diagnostics: profile, tasks, slow queries (admins)
+/jobs - Admin bulk jobs: /deactivate_users, /purge_files, /rebackup_all
+
+💡 Tip: you can send files and photos directly!""",
+        'update_profile': """✏️ To update your profile, please send the following:
+
+📧 Email: example@email.com
+📱 Phone: 09123456789
+
+Format:
+email: your_email@example.com
+phone: your_phone_number""",
+        'upload': """📁 To upload a file, just send it to the bot.
+
+Allowed file types: {file_types}""",
+        'send_photo': """📸 To send a photo, just send it to the bot.
+
+You can also reuse one of your uploaded photos:""",
+        'create_poll': """📊 To create a poll, please send the following:
+
+Format:
+سوال: your poll question
+گزینه1: first option
+گزینه2: second option
+گزینه3: third option
+...
+
+Example:
+سوال: Which programming language is the best?
+گزینه1: Python
+گزینه2: JavaScript
+گزینه3: Java""",
+        'my_files_header': "📁 Your files:\n",
+        'my_files_entry': "{index}. 📄 {file_name}\n   📊 Size: {file_size} bytes\n   📅 Date: {upload_date}\n",
+        'no_files': "📭 You have not uploaded any files.",
+        'backup_header': "💾 Choose a file to back up:\n",
+        'backup_entry': "{index}. 📄 {file_name}",
+        'no_backup_files': "📭 There are no files to back up.",
+        'btn_profile': "📝 My profile",
+        'btn_my_files': "📁 My files",
+        'btn_create_poll': "📊 Create poll",
+        'btn_view_db': "🗄️ View database",
+        'btn_edit_profile': "✏️ Edit profile",
+        'btn_list_users': "👥 Users",
+        'btn_list_files': "📁 Files",
+        'btn_list_polls': "📊 Polls",
+        'btn_download': "📥 Download {name}...",
+        'btn_delete': "🗑️ Delete {name}...",
+        'btn_backup': "💾 Back up {name}...",
+        'btn_backup_all': "💾 Back up all files",
+        'btn_photo': "📸 {name}",
+        'btn_gallery_photo': "📸 {index}",
+        'gallery_header': "🖼️ Photo gallery (page {page}):\n",
+        'gallery_entry': "{index}. 📸 {file_name}",
+        'no_photos': "📭 You have not uploaded any photos.",
+        'duplicates_header': "🧬 Near-duplicate photos:\n",
+        'duplicates_group': "{index}. {names}",
+        'no_duplicates': "✅ No near-duplicate photos found.\n(Only backed-up photos are checked.)",
+        'duplicates_unavailable': "⚠️ Duplicate detection is not enabled on this server.",
+        'search_usage': "🔍 Please enter a search query.\nExample: /search report",
+        'search_header': "🔍 Results for “{query}” (page {page}):\n",
+        'search_file_entry': "{index}. 📄 {title}\n   🏷️ Type: {detail}",
+        'search_poll_entry': "{index}. 📊 {title}",
+        'search_no_results': "📭 No results for “{query}”.",
+        'search_expired': "⌛ This search has expired. Please run /search again.",
+        'btn_prev': "◀️ Previous",
+        'btn_next': "Next ▶️",
+        'upload_document_done': "✅ File uploaded successfully!\n📄 Name: {file_name}\n📊 Size: {file_size} bytes\n🔗 File ID: {telegram_file_id}",
+        'upload_photo_done': "📸 Photo uploaded successfully!\n📊 Size: {file_size} bytes\n🔗 File ID: {telegram_file_id}",
+        'upload_batch_done': "✅ {count} files uploaded successfully!\n📊 Total size: {total_size} bytes",
+        'upload_batch_rejected': "❌ {count} files were not accepted:",
+        'upload_rejected_entry': "• {file_name}: {reason}",
+        'reject_too_large': "larger than {max_size} MB",
+        'reject_type_not_allowed': "file type not allowed ({file_type})",
+        'reject_unknown_type': "file type could not be determined",
+        'reject_over_quota': "your storage quota is full (/quota)",
+        'quota_status': "💾 Your storage:\n📊 Used: {used} of {max_size}\n📁 Files: {files} of {max_files}",
+        'quota_unlimited': "unlimited",
+        'quota_admin_usage': "❌ Usage:\n/quota <user ID> - show a user's quota\n"
+                             "/quota <user ID> <MB> [file count] - set a quota (0 = unlimited)\n"
+                             "/quota <user ID> default - back to the default quota\n"
+                             "/quota top - heaviest users\n"
+                             "/quota recount - recount every user's usage",
+        'quota_top_header': "💾 Heaviest users:",
+        'quota_top_entry': "• {user_id}: {used} of {max_size} | {files} files{overridden}",
+        'quota_top_overridden': " (custom quota)",
+        'quota_recounted': "✅ Usage of {users} users recounted.",
+        'quota_user_header': "👤 User {user_id} ({kind} quota):",
+        'quota_kind_overridden': "custom",
+        'quota_kind_default': "default",
+    },
+}
+
+# Static keyboards: rows of (label key, callback data)
+KEYBOARDS: Dict[str, list] = {
+    'main_menu': [
+        [('btn_profile', 'profile')],
+        [('btn_my_files', 'my_files')],
+        [('btn_create_poll', 'create_poll')],
+        [('btn_view_db', 'view_db')],
+    ],
+    'profile': [
+        [('btn_edit_profile', 'edit_profile')],
+    ],
+    'database': [
+        [('btn_list_users', 'list_users')],
+        [('btn_list_files', 'list_files')],
+        [('btn_list_polls', 'list_polls')],
+    ],
+}
+
+# Characters of a file name shown on listing buttons
+BUTTON_NAME_LENGTH = 15
+
+
+def file_type_names(mime_types: Iterable[str]) -> str:
+    """Short names (JPG, PDF, ...) of MIME types, for help texts"""
+    names = []
+    for mime_type in mime_types:
+        extension = mimetypes.guess_extension(mime_type)
+        name = extension[1:].upper() if extension else mime_type
+        if name not in names:
+            names.append(name)
+    return ", ".join(names)
+
+
+class MessageTemplates:
+    """Precompiled screens and keyboards, built once per language"""
+
+    def __init__(self, default_language: Optional[str] = None):
+        default_language = default_language or Config.DEFAULT_LANGUAGE
+        self.default_language = default_language if default_language in STRINGS else 'fa'
+        self._strings: Dict[str, Dict[str, str]] = {}
+        self._keyboards: Dict[Tuple[str, str], InlineKeyboardMarkup] = {}
+
+        for language in STRINGS:
+            # Missing keys fall back to the default language
+            strings = dict(STRINGS[self.default_language])
+            strings.update(STRINGS[language])
+            # The upload help lists exactly the types validate_upload accepts
+            strings['upload'] = strings['upload'].format(file_types=file_type_names(Config.ALLOWED_FILE_TYPES))
+            self._strings[language] = strings
+
+            # Telegram objects are immutable, so one markup can be shared by every reply
+            for name, rows in KEYBOARDS.items():
+                self._keyboards[(language, name)] = InlineKeyboardMarkup([
+                    [InlineKeyboardButton(strings[label], callback_data=data) for label, data in row]
+                    for row in rows
+                ])
+
+    def language_for(self, user) -> str:
+        """Pick the screen language for a Telegram user"""
+        code = (getattr(user, 'language_code', None) or '')[:2].lower()
+        return code if code in self._strings else self.default_language
+
+    def text(self, key: str, language: Optional[str] = None) -> str:
+        """Get a static screen"""
+        return self._strings.get(language, self._strings[self.default_language])[key]
+
+    def render(self, key: str, language: Optional[str] = None, **values) -> str:
+        """Render a screen that has placeholders"""
+        return self.text(key, language).format(**values)
+
+    def keyboard(self, name: str, language: Optional[str] = None) -> InlineKeyboardMarkup:
+        """Get a prebuilt static keyboard"""
+        if language not in self._strings:
+            language = self.default_language
+        return self._keyboards[(language, name)]
+
+    def file_list(self, files: Iterable[dict], language: Optional[str] = None,
+                  limit: int = 10, page: int = 0,
+                  has_next: bool = False) -> Tuple[str, Optional[InlineKeyboardMarkup]]:
+        """Render one page of the /my_files listing with download, delete and paging buttons"""
+        strings = self._strings.get(language, self._strings[self.default_language])
+        entry = strings['my_files_entry']
+        download = strings['btn_download']
+        delete = strings['btn_delete']
+
+        parts = [strings['my_files_header']]
+        keyboard = []
+        for index, file in enumerate(files, 1):
+            if index > limit:
+                break
+            parts.append(entry.format(
+                index=page * limit + index,
+                file_name=file['file_name'],
+                file_size=file['file_size'],
+                upload_date=file['upload_date']
+            ))
+            short_name = (file['file_name'] or '')[:BUTTON_NAME_LENGTH]
+            keyboard.append([
+                InlineKeyboardButton(download.format(name=short_name), callback_data=f"download_{file['file_id']}"),
+                InlineKeyboardButton(delete.format(name=short_name), callback_data=f"delete_{file['file_id']}")
+            ])
+
+        if not keyboard:
+            return strings['no_files'], None
+
+        navigation = []
+        if page > 0:
+            navigation.append(InlineKeyboardButton(strings['btn_prev'], callback_data=f"files_page_{page - 1}"))
+        if has_next:
+            navigation.append(InlineKeyboardButton(strings['btn_next'], callback_data=f"files_page_{page + 1}"))
+        if navigation:
+            keyboard.append(navigation)
+
+        return "\n".join(parts), InlineKeyboardMarkup(keyboard)
+
+    def backup_list(self, files: Iterable[dict], language: Optional[str] = None,
+                    limit: int = 10) -> Tuple[str, Optional[InlineKeyboardMarkup]]:
+        """Render the /backup file picker"""
+        strings = self._strings.get(language, self._strings[self.default_language])
+        entry = strings['backup_entry']
+        button = strings['btn_backup']
+
+        parts = [strings['backup_header']]
+        keyboard = []
+        for index, file in enumerate(files, 1):
+            if index > limit:
+                break
+            parts.append(entry.format(index=index, file_name=file['file_name']))
+            keyboard.append([InlineKeyboardButton(
+                button.format(name=(file['file_name'] or '')[:BUTTON_NAME_LENGTH]),
+                callback_data=f"backup_{file['file_id']}"
+            )])
+
+        if not keyboard:
+            return strings['no_backup_files'], None
+        keyboard.append([InlineKeyboardButton(strings['btn_backup_all'], callback_data="backup_all")])
+        return "\n".join(parts), InlineKeyboardMarkup(keyboard)
+
+    def photo_list(self, photos: Iterable[dict], language: Optional[str] = None,
+                   limit: int = 5) -> Optional[InlineKeyboardMarkup]:
+        """Build the /send_photo picker keyboard"""
+        button = self._strings.get(language, self._strings[self.default_language])['btn_photo']
+        keyboard = []
+        for index, photo in enumerate(photos, 1):
+            if index > limit:
+                break
+            keyboard.append([InlineKeyboardButton(
+                button.format(name=photo['file_name']),
+                callback_data=f"send_photo_{photo['file_id']}"
+            )])
+        return InlineKeyboardMarkup(keyboard) if keyboard else None
+
+    def gallery(self, photos: List[dict], page: int, has_next: bool,
+                language: Optional[str] = None) -> Tuple[str, Optional[InlineKeyboardMarkup]]:
+        """Caption and keyboard sent after one /gallery album: full-size and paging buttons"""
+        strings = self._strings.get(language, self._strings[self.default_language])
+        if not photos:
+            return strings['no_photos'], None
+
+        entry = strings['gallery_entry']
+        button = strings['btn_gallery_photo']
+        parts = [strings['gallery_header'].format(page=page + 1)]
+        buttons = []
+        for index, photo in enumerate(photos, 1):
+            parts.append(entry.format(index=index, file_name=photo['file_name']))
+            buttons.append(InlineKeyboardButton(button.format(index=index),
+                                                callback_data=f"send_photo_{photo['file_id']}"))
+        keyboard = [buttons[start:start + 5] for start in range(0, len(buttons), 5)]
+
+        navigation = []
+        if page > 0:
+            navigation.append(InlineKeyboardButton(strings['btn_prev'], callback_data=f"gallery_page_{page - 1}"))
+        if has_next:
+            navigation.append(InlineKeyboardButton(strings['btn_next'], callback_data=f"gallery_page_{page + 1}"))
+        if navigation:
+            keyboard.append(navigation)
+
+        return "\n".join(parts), InlineKeyboardMarkup(keyboard)
+
+    def duplicates(self, groups: List[List[dict]], language: Optional[str] = None, limit: int = 20) -> str:
+        """Render the /duplicates report"""
+        strings = self._strings.get(language, self._strings[self.default_language])
+        if not groups:
+            return strings['no_duplicates']
+
+        entry = strings['duplicates_group']
+        parts = [strings['duplicates_header']]
+        for index, group in enumerate(groups[:limit], 1):
+            parts.append(entry.format(index=index, names=", ".join(
+                f"{photo['file_name']} (#{photo['file_id']})" for photo in group
+            )))
+        return "\n".join(parts)
+
+    def search_results(self, query: str, results: List[dict], page: int, has_next: bool,
+                       language: Optional[str] = None) -> Tuple[str, Optional[InlineKeyboardMarkup]]:
+        """Render one page of /search results with download and paging buttons"""
+        strings = self._strings.get(language, self._strings[self.default_language])
+        if not results:
+            return strings['search_no_results'].format(query=query), None
+
+        file_entry = strings['search_file_entry']
+        poll_entry = strings['search_poll_entry']
+        download = strings['btn_download']
+
+        parts = [strings['search_header'].format(query=query, page=page + 1)]
+        keyboard = []
+        for index, result in enumerate(results, 1):
+            if result['kind'] == 'file':
+                parts.append(file_entry.format(index=index, title=result['title'], detail=result['detail']))
+                keyboard.append([InlineKeyboardButton(
+                    download.format(name=(result['title'] or '')[:BUTTON_NAME_LENGTH]),
+                    callback_data=f"download_{result['item_id']}"
+                )])
+            else:
+                parts.append(poll_entry.format(index=index, title=result['title']))
+
+        navigation = []
+        if page > 0:
+            navigation.append(InlineKeyboardButton(strings['btn_prev'], callback_data=f"search_page_{page - 1}"))
+        if has_next:
+            navigation.append(InlineKeyboardButton(strings['btn_next'], callback_data=f"search_page_{page + 1}"))
+        if navigation:
+            keyboard.append(navigation)
+
+        return "\n".join(parts), InlineKeyboardMarkup(keyboard) if keyboard else None
+
+    def quota_status(self, quota, language: Optional[str] = None) -> str:
+        """Render a user's storage usage against their quota"""
+        strings = self._strings.get(language, self._strings[self.default_language])
+        unlimited = strings['quota_unlimited']
+        return strings['quota_status'].format(
+            used=f"{quota.bytes / (1024 * 1024):.1f} MB",
+            max_size=f"{quota.max_bytes / (1024 * 1024):.0f} MB" if quota.max_bytes else unlimited,
+            files=quota.files,
+            max_files=quota.max_files or unlimited
+        )
+
+    def quota_top(self, quotas: Iterable, language: Optional[str] = None) -> str:
+        """Render the admin list of the heaviest users"""
+        strings = self._strings.get(language, self._strings[self.default_language])
+        entry = strings['quota_top_entry']
+        parts = [strings['quota_top_header']]
+        for quota in quotas:
+            parts.append(entry.format(
+                user_id=quota.user_id,
+                used=f"{quota.bytes / (1024 * 1024):.1f} MB",
+                max_size=f"{quota.max_bytes / (1024 * 1024):.0f} MB" if quota.max_bytes else strings['quota_unlimited'],
+                files=quota.files,
+                overridden=strings['quota_top_overridden'] if quota.overridden else ''
+            ))
+        return "\n".join(parts)
+
+    def upload_summary(self, accepted: List[dict], rejected: List[Tuple[dict, str]],
+                       language: Optional[str] = None) -> str:
+        """Render the reply for a batch of uploads"""
+        strings = self._strings.get(language, self._strings[self.default_language])
+
+        if len(accepted) == 1 and not rejected:
+            item = accepted[0]
+            key = 'upload_photo_done' if item['media_kind'] == 'photo' else 'upload_document_done'
+            return strings[key].format(**item)
+
+        parts = []
+        if accepted:
+            parts.append(strings['upload_batch_done'].format(
+                count=len(accepted),
+                total_size=sum(item['file_size'] or 0 for item in accepted)
+            ))
+        if rejected:
+            parts.append(strings['upload_batch_rejected'].format(count=len(rejected)))
+            entry = strings['upload_rejected_entry']
+            for item, reason in rejected:
+                parts.append(entry.format(
+                    file_name=item['file_name'],
+                    reason=strings['reject_' + reason].format(
+                        max_size=Config.MAX_FILE_SIZE // (1024 * 1024),
+                        file_type=item['file_type']
+                    )
+                ))
+        return "\n".join(parts)
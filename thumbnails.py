@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Thumbnails and perceptual hashes for stored photos
+
+Backed-up images get a small cached JPEG thumbnail and a 64-bit difference
+hash (dHash). Decoding and resizing run in a process pool, so neither the
+event loop nor other threads are held up by image work. The hashes drive
+near-duplicate detection; the thumbnails serve gallery pages for images
+Telegram has no small size of (e.g. images sent as documents).
+
+Pillow is optional: without it the worker stays off and galleries fall
+back to the sizes Telegram provides.
+"""
+
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from config import Config
+from database import Row, fetch_rows, open_connection
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+PREVIEWS_AVAILABLE = Image is not None
+
+# Photos with a local copy and no thumbnail yet; '' marks images that could not be read
+PENDING_WHERE = "file_type LIKE 'image/%' AND backup_path IS NOT NULL AND thumbnail_path IS NULL"
+
+
+def _signed(value: int) -> int:
+    """Store an unsigned 64-bit hash in a SQLite INTEGER"""
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def hamming(first: int, second: int) -> int:
+    return bin((first ^ second) & 0xFFFFFFFFFFFFFFFF).count('1')
+
+
+def make_preview(source_path: str, thumbnail_path: str, size: int, quality: int) -> Tuple[int, int, int]:
+    """Write a JPEG thumbnail of an image and return (width, height, dhash)
+
+    Runs in a worker process. For JPEGs `draft` lets the decoder scale down
+    while decoding, so a large photo is never fully decoded.
+    """
+    with Image.open(source_path) as image:
+        image.draft('RGB', (size, size))
+        image = image.convert('RGB')
+
+        # dHash: compare neighbouring pixels of a 9x8 grayscale image
+        small = image.convert('L').resize((9, 8), Image.LANCZOS)
+        pixels = list(small.getdata())
+        dhash = 0
+        for row in range(8):
+            for column in range(8):
+                left = pixels[row * 9 + column]
+                dhash = (dhash << 1) | (left > pixels[row * 9 + column + 1])
+
+        image.thumbnail((size, size), Image.LANCZOS)
+        image.save(thumbnail_path, 'JPEG', quality=quality, optimize=True)
+        return image.width, image.height, _signed(dhash)
+
+
+def photo_sizes_json(photo_sizes: Iterable) -> str:
+    """Compact record of every PhotoSize Telegram sent, smallest first"""
+    return json.dumps(
+        [[size.width, size.height, size.file_size, size.file_id] for size in photo_sizes],
+        separators=(',', ':')
+    )
+
+
+def preview_file_id(photo_sizes: Optional[str], min_width: int) -> Optional[str]:
+    """Telegram file ID of the smallest recorded size at least `min_width` wide"""
+    if not photo_sizes:
+        return None
+    sizes = json.loads(photo_sizes)
+    for width, height, _, file_id in sizes:
+        if max(width, height) >= min_width:
+            return file_id
+    return sizes[-1][3] if sizes else None
+
+
+def find_near_duplicates(photos: List[dict], max_distance: int) -> List[List[dict]]:
+    """Group photos whose hashes differ in at most `max_distance` bits
+
+    The 64 hash bits are split into max_distance + 1 bands. Two hashes that
+    close must agree on at least one whole band, so only photos sharing a
+    band are compared instead of every pair.
+    """
+    bands = max_distance + 1
+    width = -(-64 // bands)
+    mask = (1 << width) - 1
+    buckets: Dict[Tuple[int, int], List[int]] = {}
+    for index, photo in enumerate(photos):
+        value = photo['phash'] & 0xFFFFFFFFFFFFFFFF
+        for band in range(bands):
+            buckets.setdefault((band, (value >> (band * width)) & mask), []).append(index)
+
+    parent = list(range(len(photos)))
+
+    def root(index: int) -> int:
+        while parent[index] != index:
+            parent[index] = parent[parent[index]]
+            index = parent[index]
+        return index
+
+    compared = set()
+    for members in buckets.values():
+        for position, first in enumerate(members):
+            for second in members[position + 1:]:
+                if (first, second) in compared:
+                    continue
+                compared.add((first, second))
+                if hamming(photos[first]['phash'], photos[second]['phash']) <= max_distance:
+                    parent[root(second)] = root(first)
+
+    groups: Dict[int, List[dict]] = {}
+    for index, photo in enumerate(photos):
+        groups.setdefault(root(index), []).append(photo)
+    return [group for group in groups.values() if len(group) > 1]
+
+
+class ThumbnailWorker:
+    """Generates thumbnails and hashes for backed-up photos in a process pool"""
+
+    def __init__(self, db_path: str, thumbnail_dir: Optional[str] = None,
+                 workers: Optional[int] = None, batch_size: Optional[int] = None,
+                 pool: Optional[ProcessPoolExecutor] = None):
+        self.db_path = db_path
+        self.thumbnail_dir = thumbnail_dir or Config.THUMBNAIL_DIR
+        self.workers = workers or Config.THUMBNAIL_WORKERS
+        self.batch_size = batch_size or Config.THUMBNAIL_BATCH_SIZE
+        # A pool shared with other bots in the process; it outlives this worker
+        self._shared_pool = pool
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._wakeup: Optional[asyncio.Event] = None
+
+    @staticmethod
+    def init_schema(cursor: sqlite3.Cursor):
+        """Index the photos still waiting for a thumbnail"""
+        cursor.execute(f'''
+            CREATE INDEX IF NOT EXISTS idx_files_thumbnail_pending ON files (file_id)
+            WHERE {PENDING_WHERE}
+        ''')
+
+    def thumbnail_path(self, file_id: int) -> str:
+        return os.path.join(self.thumbnail_dir, f"{file_id}.jpg")
+
+    def wake(self):
+        """Process new backups now instead of at the next interval"""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def run(self):
+        """Process pending photos until cancelled"""
+        if not PREVIEWS_AVAILABLE:
+            logger.warning("Pillow is not installed, thumbnails and duplicate detection are disabled")
+            return
+
+        os.makedirs(self.thumbnail_dir, exist_ok=True)
+        self._wakeup = asyncio.Event()
+        # spawn: forking a process that runs threads (logging, asyncio.to_thread) is unsafe
+        self._pool = self._shared_pool or ProcessPoolExecutor(
+            self.workers, mp_context=multiprocessing.get_context('spawn')
+        )
+        try:
+            while True:
+                try:
+                    while await self.process_batch() == self.batch_size:
+                        pass
+                except Exception as e:
+                    logger.error("Error generating thumbnails: %s", e)
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), Config.THUMBNAIL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+        finally:
+            if self._pool is not self._shared_pool:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+            self._wakeup = None
+
+    async def process_batch(self) -> int:
+        """Generate previews for one batch of pending photos; returns the batch size"""
+        pending = await asyncio.to_thread(self._pending)
+        if not pending:
+            return 0
+
+        loop = asyncio.get_running_loop()
+        futures = [
+            loop.run_in_executor(self._pool, make_preview, backup_path,
+                                 self.thumbnail_path(file_id), Config.THUMBNAIL_SIZE, Config.THUMBNAIL_QUALITY)
+            for file_id, backup_path in pending
+        ]
+        results = []
+        for (file_id, backup_path), outcome in zip(pending, await asyncio.gather(*futures, return_exceptions=True)):
+            if isinstance(outcome, Exception):
+                logger.warning("Cannot create thumbnail for file %s (%s): %s", file_id, backup_path, outcome)
+                results.append(('', None, file_id))
+            else:
+                _, _, dhash = outcome
+                results.append((self.thumbnail_path(file_id), dhash, file_id))
+
+        await asyncio.to_thread(self._store, results)
+        return len(pending)
+
+    def _pending(self) -> List[Tuple[int, str]]:
+        conn = open_connection(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute(f'SELECT file_id, backup_path FROM files WHERE {PENDING_WHERE} ORDER BY file_id LIMIT ?',
+                       (self.batch_size,))
+        pending = cursor.fetchall()
+        conn.close()
+        return pending
+
+    def _store(self, results: List[tuple]):
+        conn = open_connection(self.db_path)
+        conn.executemany('UPDATE files SET thumbnail_path = ?, phash = ? WHERE file_id = ?', results)
+        conn.commit()
+        conn.close()
+
+    def user_hashes(self, user_id: int) -> List[Row]:
+        """A user's hashed photos, oldest first"""
+        conn = open_connection(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT file_id, file_name, phash FROM files
+            WHERE user_id = ? AND phash IS NOT NULL
+            ORDER BY file_id
+        ''', (user_id,))
+        photos = fetch_rows(cursor)
+        conn.close()
+        return photos
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Resumable, verified file transfers for Telegram Bot
+
+Downloads stream into `<path>.part` and continue with an HTTP Range
+request after a dropped connection or a restart. The SHA-256 is computed
+while streaming. The finished file is fsynced and atomically renamed into
+place, so the final path only ever holds a complete file. Verification
+re-hashes backups in a small thread pool with a shared read rate limit, so
+it does not starve the bot of disk I/O. Both take an optional `abort`
+event from their caller that stops them at the next chunk, so one bot
+shutting down leaves the transfers of other bots in the process running.
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+import requests
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+
+# Verification results
+VERIFIED = 'ok'
+MISSING = 'missing'
+CORRUPT = 'corrupt'
+FAILED = 'failed'  # could not be read
+
+# Destination paths with a download in progress
+_active_paths = set()
+_active_lock = threading.Lock()
+
+
+class TransferError(Exception):
+    """A download that cannot complete (after retries, or not retryable)"""
+
+
+class _RateLimiter:
+    """Keeps the combined read rate of all verify threads under a limit"""
+
+    def __init__(self, bytes_per_second: float):
+        self.bytes_per_second = bytes_per_second
+        self._lock = threading.Lock()
+        self._next_free = time.monotonic()
+
+    def consume(self, size: int):
+        if self.bytes_per_second <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_free)
+            self._next_free = start + size / self.bytes_per_second
+        if start > now:
+            time.sleep(start - now)
+
+
+def _hash_file(path: str, hasher, limiter: Optional[_RateLimiter] = None,
+               abort: Optional[threading.Event] = None) -> int:
+    """Feed a file to `hasher` in chunks; returns its size"""
+    size = 0
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                return size
+            if abort is not None and abort.is_set():
+                raise TransferError(f"reading {path} aborted")
+            if limiter is not None:
+                limiter.consume(len(chunk))
+            hasher.update(chunk)
+            size += len(chunk)
+
+
+def download_resumable(url: str, path: str, expected_size: Optional[int] = None,
+                       session: Optional[requests.Session] = None,
+                       abort: Optional[threading.Event] = None) -> Tuple[int, str]:
+    """Download `url` to `path`, resuming any earlier partial download
+
+    Blocking; run it in a worker thread. Returns (size, sha256 hex digest).
+    Raises TransferError when the download cannot be completed or `abort`
+    is set; an aborted download keeps its .part file and resumes next time.
+    """
+    with _active_lock:
+        if path in _active_paths:
+            raise TransferError(f"{path} is already being downloaded")
+        _active_paths.add(path)
+    try:
+        return _download(url, path, expected_size, session or requests, abort)
+    finally:
+        with _active_lock:
+            _active_paths.discard(path)
+
+
+def _download(url: str, path: str, expected_size: Optional[int], session,
+              abort: Optional[threading.Event]) -> Tuple[int, str]:
+    part_path = f"{path}.part"
+    hasher = hashlib.sha256()
+    offset = _hash_file(part_path, hasher, abort=abort) if os.path.exists(part_path) else 0
+    if expected_size is not None and offset > expected_size:
+        hasher, offset = hashlib.sha256(), 0
+
+    attempt = 0
+    while expected_size is None or offset < expected_size:
+        headers = {'Range': f'bytes={offset}-'} if offset else {}
+        try:
+            with session.get(url, headers=headers, stream=True, timeout=Config.TRANSFER_TIMEOUT) as response:
+                if response.status_code == 416 and offset:
+                    # Nothing past what we have: the partial file is complete
+                    break
+                if response.status_code == 206 and response.headers.get('Content-Range', '').startswith(
+                        f'bytes {offset}-'):
+                    mode = 'ab'
+                elif response.status_code == 200:
+                    # Range not honored: start over
+                    hasher, offset, mode = hashlib.sha256(), 0, 'wb'
+                elif response.status_code >= 500 or response.status_code == 429:
+                    raise requests.ConnectionError(f"HTTP {response.status_code}")
+                else:
+                    raise TransferError(f"HTTP {response.status_code} for {path}")
+
+                with open(part_path, mode) as f:
+                    try:
+                        for chunk in response.iter_content(CHUNK_SIZE):
+                            if abort is not None and abort.is_set():
+                                raise TransferError(f"download of {path} aborted at byte {offset}")
+                            f.write(chunk)
+                            hasher.update(chunk)
+                            offset += len(chunk)
+                    finally:
+                        # Whatever arrived stays usable for the next attempt
+                        f.flush()
+                        os.fsync(f.fileno())
+            if expected_size is None:
+                break
+            if offset < expected_size:
+                raise requests.ConnectionError(f"connection closed at {offset} of {expected_size} bytes")
+        except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+            attempt += 1
+            if attempt > Config.TRANSFER_MAX_RETRIES:
+                raise TransferError(f"download of {path} failed after {attempt} attempts: {e}") from e
+            delay = min(Config.SEND_RETRY_MAX_DELAY, Config.SEND_RETRY_BASE_DELAY * 2 ** (attempt - 1))
+            logger.warning("Resuming download of %s at byte %d in %.1fs (attempt %d): %s",
+                           path, offset, delay, attempt, e)
+            time.sleep(delay)
+
+    if expected_size is not None and offset != expected_size:
+        os.remove(part_path)
+        raise TransferError(f"{path}: got {offset} bytes, expected {expected_size}")
+
+    os.replace(part_path, path)
+    _fsync_directory(os.path.dirname(path) or '.')
+    return offset, hasher.hexdigest()
+
+
+def _fsync_directory(directory: str):
+    """Make a rename durable"""
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def verify_backup(path: Optional[str], checksum: Optional[str], size: Optional[int],
+                  limiter: Optional[_RateLimiter] = None,
+                  abort: Optional[threading.Event] = None) -> Tuple[str, Optional[str]]:
+    """Re-hash one backup; returns (status, sha256 of the file on disk)
+
+    Backups made before checksums were recorded have none; they are checked
+    against the size Telegram reported instead.
+    """
+    if not path or not os.path.isfile(path):
+        return MISSING, None
+    hasher = hashlib.sha256()
+    actual_size = _hash_file(path, hasher, limiter, abort)
+    digest = hasher.hexdigest()
+    if checksum:
+        return (VERIFIED if digest == checksum else CORRUPT), digest
+    if size and actual_size != size:
+        return CORRUPT, digest
+    return VERIFIED, digest
+
+
+class BackupVerifier:
+    """Re-hashes backups in a bounded thread pool"""
+
+    def __init__(self, workers: Optional[int] = None, read_mbps: Optional[float] = None):
+        self.workers = workers or Config.VERIFY_WORKERS
+        read_mbps = read_mbps if read_mbps is not None else Config.VERIFY_READ_MBPS
+        self._limiter = _RateLimiter(read_mbps * 1024 * 1024)
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    async def verify(self, files: List[dict],
+                     abort: Optional[threading.Event] = None) -> List[Tuple[dict, str, Optional[str]]]:
+        """Verify backed-up file records; returns (record, status, sha256) per file
+
+        The pool is shared by every bot in the process; `abort` stops only
+        this call's files. Files it stopped before they were checked are
+        left out of the result.
+        """
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='verify')
+        loop = asyncio.get_running_loop()
+        results = await asyncio.gather(*(
+            loop.run_in_executor(self._executor, self._verify_one, file, abort) for file in files
+        ))
+        return [(file, *result) for file, result in zip(files, results) if result is not None]
+
+    def _verify_one(self, file: dict, abort: Optional[threading.Event]) -> Optional[Tuple[str, Optional[str]]]:
+        """verify_backup() for one record; None if `abort` stopped it"""
+        if abort is not None and abort.is_set():
+            return None
+        try:
+            return verify_backup(file['backup_path'], file['backup_sha256'],
+                                 file['backup_size'] or file['file_size'], self._limiter, abort)
+        except TransferError:
+            return None
+        except OSError as e:
+            logger.warning("Could not read backup %s: %s", file['backup_path'], e)
+            return FAILED, None
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None